@@ -1,18 +1,53 @@
+import time
 # for the flask app
-from flask import Flask, request,render_template,jsonify
-# basic libraries 
-import numpy as np
-import pandas as pd
+from flask import Flask, request,render_template,jsonify,g,Response
 from src.exception import CustomException
 # for the scalling the features
 # from sklearn.preprocessing import StandardScaler
 # for the mapping the data and doing the predictions
-from src.pipeline.predict_pipeline import CustomData,PredictPipeline
+from src.pipeline.predict_pipeline import PredictPipeline
+# request parsing , validation and answers shared with asgi.py
+from src.pipeline import api_handlers
+from src.pipeline.micro_batcher import MicroBatcher
+from src.pipeline.prediction_cache import PredictionCache
+# request / stage latency and error counters for /metrics
+from src.pipeline.metrics import metrics, STAGE_METRIC
 
 application = Flask(__name__)
 
 app = application # instance of the application file 
 
+# one pipeline per worker process , model and preprocessor are loaded once and hot swapped by the registry
+# PREDICTION_CACHE=memory|sqlite caches the results , dropped on a model hot swap
+prediction_cache = PredictionCache()
+predict_pipeline = PredictPipeline(cache=prediction_cache)
+prediction_cache.attach(predict_pipeline.registry)
+# the model loads in the background , /health/live answers meanwhile and /health/ready once it is loaded
+# (with the preloading gunicorn master it is loaded already)
+predict_pipeline.registry.warm_up()
+# opt-in coalescing of concurrent /api/predict calls (PREDICT_MICRO_BATCH=1)
+micro_batcher = MicroBatcher(predict_pipeline)
+micro_batcher.register_metrics(metrics)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.maybe_start()
+
+@app.after_request
+def record_request_metrics(response):
+    # one counter and one latency observation per request , errors by class
+    # (validation = the 4xx answers , the 500 handlers set g.error_class)
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started, {'route': route})
+    metrics.inc('http_requests_total', {'route': route, 'method': request.method, 'status': response.status_code})
+    error_class = g.get('error_class') or ('validation' if 400 <= response.status_code < 500 else None)
+    if error_class:
+        metrics.inc('http_request_errors_total', {'route': route, 'error_class': error_class})
+    return response
+
 # Route for the home page
 @app.route('/')
 def index():
@@ -23,129 +58,68 @@ def index():
 def predict_datapoint():
     if request.method == 'GET':
         return render_template('index.html') # it's basical a form to fill the input features 
-    try:
-
-        # here prediction should be done 
-        # here i am calling the CustomData class for the mapping the html input to the back end data frame 
-        data = CustomData(
-                gender = request.form.get('gender'),
-                race_ethnicity= request.form.get('race_ethnicity'),
-                parental_level_of_education= request.form.get('parental_level_of_education'),
-                lunch = request.form.get('lunch'),
-                test_preparation_course= request.form.get('test_preparation_course'),
-                reading_score= request.form.get('reading_score'),
-                writing_score = request.form.get('writing_score')
-            )
-            # validate the data 
-        if not all(data.values()):
-            return render_template("index.html",
-                                    results = "Please Fill In All  Fields",
-                                    error = True)
-                
-            # check the values are in range or not 
-        if not(0<=data['reading_score'] <= 100) or not(0 <= data['writing_score'] <= 100):
-            return render_template("index.html",
-                                    results = "Score must be Between 0 To 100.",
-                                    error = True)
-                
-            
-            
-                        
-        pred_df = data.get_data_as_data_frame()
-            # i can see the how my data look like in data frame 
-        print(pred_df)
-            
-        predict_pipeline = PredictPipeline()
-        results = predict_pipeline.predict(pred_df)
-            # handle both values single and array 
-        if hasattr(results,'__iter__') and not isinstance(results,str):
-                prediction_value = results[0]
-        else:
-                prediction_value = results    
-        return render_template('index.html',results = round(float(prediction_value),1))
-        
-    except ValueError as e:
-        return render_template('index.html',
-                                   results= "Invalid Input Values",
-                                   error = True)
-    except Exception as e:
-        print(f"Prediction error {e}")
-        return render_template('index.html',
-                                   results = "Error Occurred during prediction",
-                                   error = True)
-    
-        
+    # same checks and messages as the ASGI app (src/pipeline/api_handlers.py)
+    with metrics.time(STAGE_METRIC, stage='parse', mode='single'):
+        form = request.form.to_dict()
+    record, message = api_handlers.parse_form(form)
+    if record is None:
+        return render_template("index.html", results = message, error = True)
+    results, failed, error_class = api_handlers.predict_form(predict_pipeline, record)
+    if error_class:
+        g.error_class = error_class
+    with metrics.time(STAGE_METRIC, stage='render', mode='single'):
+        return render_template('index.html', results = results, error = failed)
+
+def api_response(response):
+    # ApiResponse of the shared handlers -> flask response , serialized under the mode of its request
+    if response.error_class:
+        g.error_class = response.error_class
+    with metrics.time(STAGE_METRIC, stage='serialize', mode=response.mode):
+        return jsonify(response.payload), response.status
 
 @app.route('/api/predict', methods=['POST'])
 def api_predict():
-    try:
-        data = request.get_json()
-
-        # Required fields
-        required_fields = ['gender', 'ethnicity', 'parental_level_of_education',
-                           'lunch', 'test_preparation_course', 'reading_score', 'writing_score']
-        for field in required_fields:
-            if field not in data or data[field] is None:
-                return jsonify(success=False, error=f'Missing required field: {field}'), 400
-
-        # Convert scores
-        try:
-            reading_score = float(data['reading_score'])
-            writing_score = float(data['writing_score'])
-        except ValueError:
-            return jsonify(success=False, error='Invalid score values'), 400
-
-        # Validate range
-        if not (0 <= reading_score <= 100) or not (0 <= writing_score <= 100):
-            return jsonify(success=False, error='Scores must be between 0 and 100'), 400
-
-        # Prepare data
-        custom_data = CustomData(
-            gender=data['gender'],
-            race_ethnicity=data['ethnicity'],
-            parental_level_of_education=data['parental_level_of_education'],
-            lunch=data['lunch'],
-            test_preparation_course=data['test_preparation_course'],
-            reading_score=reading_score,
-            writing_score=writing_score
-        )
-        pred_df = custom_data.get_data_as_data_frame()
-
-        # Predict
-        predict_pipeline = PredictPipeline()
-        results = predict_pipeline.predict(pred_df)
-
-        prediction_value = results[0] if hasattr(results, '__iter__') and not isinstance(results, str) else results
-
-        return jsonify(
-            success=True,
-            prediction=round(float(prediction_value), 1),
-            message='Prediction completed successfully'
-        )
-
-    except CustomException as e:
-        print(f"Custom API prediction error: {e}")
-        return jsonify(success=False, error='Model prediction error'), 500
-    except Exception as e:
-        print(f"API prediction error: {e}")
-        return jsonify(success=False, error='Internal server error'), 500
+    record, response = api_handlers.parse_predict_request(request.get_data())
+    if record is not None:
+        # concurrent requests are predicted together in one batch with PREDICT_MICRO_BATCH=1
+        response = api_handlers.predict_single(predict_pipeline, record, micro_batcher)
+    return api_response(response)
+
+@app.route('/api/predict/batch', methods=['POST'])
+def api_predict_batch():
+    # body is a JSON array of records or NDJSON , same fields as /api/predict
+    records, response = api_handlers.parse_batch_request(request.get_data(), request.content_type)
+    if records is not None:
+        response = api_handlers.predict_batch(predict_pipeline, records)
+    return api_response(response)
+
+@app.route('/api/predict/batcher')
+def micro_batcher_stats():
+    # queue depth and batch size histograms of the micro batcher in this worker
+    return jsonify(micro_batcher.stats())
+
+@app.route('/api/predict/cache')
+def prediction_cache_stats():
+    # hit ratio and size of the prediction cache (counts are per worker)
+    return jsonify(prediction_cache.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # prometheus text format , summed over all the gunicorn workers
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/health/live')
+def liveness_check():
+    return api_response(api_handlers.liveness())
+
+@app.route('/health/ready')
+def readiness_check():
+    return api_response(api_handlers.readiness(predict_pipeline.registry))
 
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    try:
-        # Test if pipeline can be created
-        pipeline = PredictPipeline()
-        return jsonify({
-            'status': 'healthy',
-            'pipeline_loaded': True
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e),
-            'pipeline_loaded': False
-        }), 500                
+    return api_response(api_handlers.health(predict_pipeline))
 # for testing purpose 
 if __name__=="__main__":
     app.run(host="0.0.0.0")    
\ No newline at end of file
@@ -0,0 +1,292 @@
+# ASGI entry point of the prediction api , same routes and answers as application.py
+# (the request handling of both is in src/pipeline/api_handlers.py)
+#   uvicorn asgi:application --workers 4 --host 0.0.0.0 --port 5000
+# the request parsing and the validation run on the event loop , the CPU bound prediction runs in a bounded
+# thread pool , so one worker keeps accepting connections while the model is busy
+# backpressure : when ASGI_MAX_IN_FLIGHT predictions are already running or waiting , new requests
+# get 503 with Retry-After at once instead of queueing without a limit , /health/live never waits for the executor
+import os
+import json
+import time
+import asyncio
+import mimetypes
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from src.logger import logging
+from src.pipeline import api_handlers
+from src.pipeline.predict_pipeline import PredictPipeline
+from src.pipeline.prediction_cache import PredictionCache
+from src.pipeline.metrics import metrics, STAGE_METRIC
+
+# threads which run the predictions of one worker process
+INFERENCE_THREADS = int(os.environ.get('ASGI_INFERENCE_THREADS', os.cpu_count() or 1))
+# predictions running + waiting for a thread , above this the request is rejected with 503
+MAX_IN_FLIGHT = int(os.environ.get('ASGI_MAX_IN_FLIGHT', 64))
+# larger request bodies are rejected with 413 before they are read completely
+MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 50 * 2 ** 20))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+
+# one pipeline per worker process , model and preprocessor are loaded once and hot swapped by the registry
+prediction_cache = PredictionCache()
+predict_pipeline = PredictPipeline(cache=prediction_cache)
+prediction_cache.attach(predict_pipeline.registry)
+
+
+def url_for(endpoint, filename=None):
+    # flask style url_for for the templates , the endpoint is the name of the handler like in the flask app
+    if endpoint == 'static':
+        return f'/static/{filename}'
+    for path, (_, handler) in ROUTES.items():
+        if handler.__name__ == endpoint:
+            return path
+    raise KeyError(f"Unknown endpoint {endpoint}")
+
+
+templates = Environment(loader=FileSystemLoader(os.path.join(BASE_DIR, 'templates')),
+                        autoescape=select_autoescape(['html']))
+templates.globals['url_for'] = url_for
+
+
+class Overloaded(Exception):
+    pass
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class InferenceExecutor:
+    # bounded thread pool for the predictions , in_flight is only changed on the event loop thread
+    def __init__(self, n_threads, max_in_flight):
+        self.n_threads = n_threads
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor = None
+
+    async def run(self, function, *args):
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            raise Overloaded()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.n_threads, thread_name_prefix='inference')
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+executor = InferenceExecutor(INFERENCE_THREADS, MAX_IN_FLIGHT)
+metrics.register_gauge('asgi_inference_in_flight', 'Predictions running or waiting for an inference thread',
+                       lambda: executor.in_flight)
+metrics.describe('asgi_requests_rejected_total', 'counter', 'Requests rejected with 503 because of backpressure')
+
+
+class Response:
+    def __init__(self, body, status=200, content_type='application/json', headers=None):
+        self.body = body if isinstance(body, bytes) else body.encode()
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or []
+        self.error_class = None
+
+
+def api_response(response):
+    # ApiResponse of the shared handlers , serialized under the mode of its request
+    with metrics.time(STAGE_METRIC, stage='serialize', mode=response.mode):
+        return failed(Response(json.dumps(response.payload), response.status), response.error_class)
+
+
+def render(status=200, **context):
+    with metrics.time(STAGE_METRIC, stage='render', mode='single'):
+        return Response(templates.get_template('index.html').render(**context), status, 'text/html; charset=utf-8')
+
+
+def failed(response, error_class):
+    # the error class of the 5xx answers for http_request_errors_total
+    response.error_class = error_class
+    return response
+
+
+async def read_body(receive, headers):
+    length = headers.get('content-length')
+    if length is not None and length.isdigit() and int(length) > MAX_BODY_BYTES:
+        raise BodyTooLarge()
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+# Route for the home page
+async def index(method, headers, body):
+    return render()
+
+
+# html form , same checks and messages as the flask route
+async def predict_datapoint(method, headers, body):
+    if method == 'GET':
+        return render()
+    with metrics.time(STAGE_METRIC, stage='parse', mode='single'):
+        form = {key: values[0] for key, values in parse_qs(body.decode('utf-8', errors='replace')).items()}
+    record, message = api_handlers.parse_form(form)
+    if record is None:
+        return render(results=message, error=True)
+    results, error, error_class = await executor.run(api_handlers.predict_form, predict_pipeline, record)
+    return failed(render(results=results, error=error), error_class)
+
+
+async def api_predict(method, headers, body):
+    # parsed and validated on the event loop , only the prediction goes to the thread pool
+    record, response = api_handlers.parse_predict_request(body)
+    if record is not None:
+        response = await executor.run(api_handlers.predict_single, predict_pipeline, record)
+    return api_response(response)
+
+
+async def api_predict_batch(method, headers, body):
+    # body is a JSON array of records or NDJSON , same fields as /api/predict
+    records, response = api_handlers.parse_batch_request(body, headers.get('content-type', ''))
+    if records is not None:
+        response = await executor.run(api_handlers.predict_batch, predict_pipeline, records)
+    return api_response(response)
+
+
+async def prediction_cache_stats(method, headers, body):
+    return api_response(api_handlers.ok(prediction_cache.stats()))
+
+
+async def prometheus_metrics(method, headers, body):
+    # prometheus text format , summed over all the worker processes
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4')
+
+
+async def liveness_check(method, headers, body):
+    # answered on the event loop , never behind the executor , a busy worker is still alive and must not be
+    # restarted by its liveness probe
+    return api_response(api_handlers.liveness())
+
+
+async def readiness_check(method, headers, body):
+    # behind the executor like the predictions , an overloaded worker answers 503 and gets no new traffic
+    # until it catches up
+    return api_response(await executor.run(api_handlers.readiness, predict_pipeline.registry))
+
+
+async def health_check(method, headers, body):
+    # the first call loads model and preprocessor , not on the event loop , once they are loaded it is answered
+    # inline like the liveness
+    if predict_pipeline.registry.is_loaded:
+        return api_response(api_handlers.health(predict_pipeline))
+    return api_response(await executor.run(api_handlers.health, predict_pipeline))
+
+
+# path -> (allowed methods , handler)
+ROUTES = {
+    '/': (('GET',), index),
+    '/predictdata': (('GET', 'POST'), predict_datapoint),
+    '/api/predict': (('POST',), api_predict),
+    '/api/predict/batch': (('POST',), api_predict_batch),
+    '/api/predict/cache': (('GET',), prediction_cache_stats),
+    '/metrics': (('GET',), prometheus_metrics),
+    '/health': (('GET',), health_check),
+    '/health/live': (('GET',), liveness_check),
+    '/health/ready': (('GET',), readiness_check),
+}
+
+
+def static_file(path):
+    # /static/<file> , never outside of the static directory
+    file_path = os.path.realpath(os.path.join(STATIC_DIR, path[len('/static/'):]))
+    if not file_path.startswith(STATIC_DIR + os.sep) or not os.path.isfile(file_path):
+        return Response(b'Not Found', 404, 'text/plain')
+    with open(file_path, 'rb') as file_obj:
+        return Response(file_obj.read(), content_type=mimetypes.guess_type(file_path)[0] or 'application/octet-stream')
+
+
+async def dispatch(method, path, headers, receive):
+    # returns (route label for the metrics , Response)
+    if path.startswith('/static/') and method == 'GET':
+        return '/static/<path:filename>', static_file(path)
+    route = ROUTES.get(path)
+    if route is None:
+        return 'unmatched', Response(json.dumps({'error': 'Not Found'}), 404)
+    methods, handler = route
+    if method not in methods:
+        return path, Response(json.dumps({'error': 'Method Not Allowed'}), 405,
+                              headers=[(b'allow', ', '.join(methods).encode())])
+    try:
+        body = await read_body(receive, headers) if method == 'POST' else b''
+        return path, await handler(method, headers, body)
+    except BodyTooLarge:
+        return path, Response(json.dumps({'success': False, 'error': 'Request body is too large'}), 413)
+    except Overloaded:
+        metrics.inc('asgi_requests_rejected_total', {'route': path})
+        return path, failed(Response(json.dumps({'success': False, 'error': 'Server is overloaded , retry later'}),
+                                     503, headers=[(b'retry-after', b'1')]), 'overloaded')
+    except Exception as e:
+        logging.info(f"Unhandled error on {path}: {e}")
+        return path, failed(Response(json.dumps({'error': str(e)}), 500), type(e).__name__)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            metrics.maybe_start()
+            # the artifacts load in the background , the server accepts connections (liveness) meanwhile
+            predict_pipeline.registry.warm_up()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    started = time.perf_counter()
+    metrics.maybe_start()
+    method = scope['method']
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    route, response = await dispatch(method, scope['path'], headers, receive)
+
+    await send({'type': 'http.response.start',
+                'status': response.status,
+                'headers': [(b'content-type', response.content_type.encode()),
+                            (b'content-length', str(len(response.body)).encode())] + response.headers})
+    await send({'type': 'http.response.body', 'body': response.body})
+
+    # same request metrics as the flask app
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - started, {'route': route})
+    metrics.inc('http_requests_total', {'route': route, 'method': method, 'status': response.status})
+    error_class = response.error_class or ('validation' if 400 <= response.status < 500 else None)
+    if error_class:
+        metrics.inc('http_request_errors_total', {'route': route, 'error_class': error_class})
+
+
+app = application
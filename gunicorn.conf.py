@@ -0,0 +1,90 @@
+# gunicorn settings , read automatically by gunicorn from the working directory
+# the log collector : one process receives the log records of all the workers and is the only writer of the
+# rotating log file (see src/logger.py) , LOG_MODE=async / sync switches it off
+# preload : the master imports the app and loads the model once before it forks the workers , so the
+# workers share those pages copy-on-write instead of every worker importing and unpickling everything again
+# (GUNICORN_PRELOAD=0 goes back to loading in every worker)
+import gc
+import os
+import sys
+import time
+import socket
+import subprocess
+
+os.environ.setdefault('LOG_MODE', 'collector')
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+_collector = None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# with preload_app the app (and src.logger) is imported before on_starting , so the collector address
+# must be in the environment already when this file is read , the workers inherit it
+if os.environ['LOG_MODE'] == 'collector':
+    os.environ.setdefault('LOG_COLLECTOR_ADDRESS', f'127.0.0.1:{_free_port()}')
+
+
+def on_starting(server):
+    global _collector
+    if os.environ['LOG_MODE'] != 'collector':
+        return
+    _collector = subprocess.Popen([sys.executable, '-m', 'src.logger'])
+    host, port = os.environ['LOG_COLLECTOR_ADDRESS'].rsplit(':', 1)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, int(port)), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    server.log.warning("Log collector did not start , the workers will drop their log records")
+
+
+def when_ready(server):
+    # runs in the master after the preload and before the first fork
+    if not preload_app:
+        return
+    from src.pipeline.model_registry import get_registry
+    try:
+        started = time.perf_counter()
+        version = get_registry().get().version
+        server.log.info(f"Preloaded model {version} in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        # the workers load it themselves on the first request
+        server.log.warning(f"Model could not be preloaded: {e}")
+    # everything which exists now goes to the permanent generation , the collector of the workers never
+    # writes to those objects , so their pages stay shared with the master
+    gc.collect()
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    # runs in the worker as it exits , its last counts would be lost between two flushes of the snapshot
+    from src.pipeline.metrics import metrics
+    if metrics.enabled:
+        try:
+            metrics.flush()
+        except Exception as e:
+            server.log.warning(f"Metrics snapshot of worker {worker.pid} could not be written: {e}")
+
+
+def child_exit(server, worker):
+    # runs in the master when a worker has exited (crashed , killed or recycled) , its metrics snapshot is
+    # folded into the retired totals , so /metrics keeps its counts and a new worker with the same pid starts clean
+    from src.pipeline.metrics import retire_workers, worker_metrics_dir
+    try:
+        retire_workers(worker_metrics_dir(os.getpid()), worker.pid)
+    except Exception as e:
+        server.log.warning(f"Metrics of worker {worker.pid} could not be retired: {e}")
+
+
+def on_exit(server):
+    if _collector is not None:
+        _collector.terminate()
+        _collector.wait(timeout=10)
@@ -20,7 +20,7 @@ setup(
     version= '0.0.1',
     author = 'ajay',
     author_email = 'ajaysulya06@gmail.com',
-    packages = find_packages(),
+    packages = find_packages(exclude=["tests", "tests.*"]),
     
     # install_requires = ['numpy','pandas','scikit-learn','matplotlib','seaborn'], # if there is 100 packages , we can't add manually instead we can use 
     # this function will read the requirements.txt file and return the list of packages
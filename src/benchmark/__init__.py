@@ -0,0 +1 @@
+# benchmarks and profiling harnesses (python -m src.benchmark.<name>)
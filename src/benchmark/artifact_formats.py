@@ -0,0 +1,81 @@
+# read time and file size of the dataset artifacts in every format (csv , parquet , feather , npz)
+# python -m src.benchmark.artifact_formats --rows 1000000 --output artifacts/benchmarks/artifact_formats.json
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from src.utils import ARTIFACT_FORMATS, apply_dtypes, save_dataframe, load_dataframe
+from src.components.data_transformation import DATASET_DTYPES, NUMERICAL_FEATURES, CATEGORICAL_FEATURES, TARGET_COLUMN
+from src.benchmark.datasets import make_synthetic_dataset
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run(n_rows, repeat=3, formats=None):
+    df = apply_dtypes(make_synthetic_dataset(n_rows), DATASET_DTYPES)
+    # the columns which DataTransformation reads (every column except the ones nobody uses)
+    needed = NUMERICAL_FEATURES + CATEGORICAL_FEATURES + [TARGET_COLUMN]
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='artifact_formats_')
+    try:
+        for artifact_format in formats or ARTIFACT_FORMATS:
+            file_path = os.path.join(work_dir, 'data' + ARTIFACT_FORMATS[artifact_format])
+            try:
+                write_seconds = best_time(lambda: save_dataframe(file_path, df), 1)
+            except Exception as e:
+                # parquet / feather need pyarrow
+                results.append({'format': artifact_format, 'error': str(e).splitlines()[0]})
+                continue
+            results.append({
+                'format': artifact_format,
+                'rows': n_rows,
+                'size_bytes': os.path.getsize(file_path),
+                'write_seconds': write_seconds,
+                'read_seconds': best_time(lambda: load_dataframe(file_path), repeat),
+                'read_needed_columns_seconds': best_time(lambda: load_dataframe(file_path, columns=needed), repeat),
+                'read_two_columns_seconds': best_time(lambda: load_dataframe(file_path, columns=NUMERICAL_FEATURES), repeat),
+            })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare read time and size of the dataset artifact formats")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--formats', nargs='*', choices=list(ARTIFACT_FORMATS))
+    parser.add_argument('--output', help="write the results as json to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.repeat, args.formats)
+    csv_result = next((result for result in results if result['format'] == 'csv' and 'error' not in result), None)
+    print(f"{'format':<10}{'size MB':>10}{'read s':>10}{'needed s':>10}{'2 cols s':>10}{'vs csv':>9}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['format']:<10} skipped: {result['error']}")
+            continue
+        speedup = csv_result['read_seconds'] / result['read_seconds'] if csv_result else float('nan')
+        print(f"{result['format']:<10}{result['size_bytes'] / 2 ** 20:>10.2f}{result['read_seconds']:>10.3f}"
+              f"{result['read_needed_columns_seconds']:>10.3f}{result['read_two_columns_seconds']:>10.3f}{speedup:>8.1f}x")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as file_obj:
+            json.dump({'benchmark': 'artifact_formats', 'results': results}, file_obj, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+# synthetic student datasets for the benchmarks , rows are sampled from notebook/data/stud.csv
+# (each column independently , so there are no exact copies of the original rows) and scaled to any size
+# keep_rows=True samples whole rows and jitters the scores instead , so the target still depends on the
+# features (needed by the training benchmark , the models learn nothing from independent columns)
+import os
+
+import numpy as np
+import pandas as pd
+
+SOURCE_DATA_PATH = os.path.join('notebook', 'data', 'stud.csv')
+
+
+SCORE_COLUMNS = ['math_score', 'reading_score', 'writing_score']
+
+
+def make_synthetic_dataset(n_rows, source_path=SOURCE_DATA_PATH, random_state=42, keep_rows=False, score_noise=3):
+    source = pd.read_csv(source_path)
+    rng = np.random.default_rng(random_state)
+    if keep_rows:
+        df = source.iloc[rng.integers(0, len(source), n_rows)].reset_index(drop=True)
+        for column in SCORE_COLUMNS:
+            noise = rng.integers(-score_noise, score_noise + 1, n_rows)
+            df[column] = np.clip(df[column].to_numpy() + noise, 0, 100)
+        return df
+    data = {}
+    for column in source.columns:
+        values = source[column].to_numpy()
+        data[column] = values[rng.integers(0, len(values), n_rows)]
+    return pd.DataFrame(data)
+
+
+def write_synthetic_csv(file_path, n_rows, source_path=SOURCE_DATA_PATH, random_state=42, chunk_rows=1000000,
+                        keep_rows=False):
+    # written chunk by chunk , so millions of rows do not need to fit in memory at once
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with open(file_path, 'w', newline='') as file_obj:
+        for chunk_index, start in enumerate(range(0, n_rows, chunk_rows)):
+            chunk = make_synthetic_dataset(min(chunk_rows, n_rows - start), source_path, random_state + chunk_index,
+                                           keep_rows=keep_rows)
+            chunk.to_csv(file_obj, index=False, header=chunk_index == 0)
+    return file_path
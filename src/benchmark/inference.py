@@ -0,0 +1,454 @@
+# latency and throughput of the prediction service
+# python -m src.benchmark.inference --concurrency 1 4 16 --requests 500 --output artifacts/benchmarks/inference.json
+# scenarios :
+#   stages     time of every step of one prediction (parse , DataFrame build , transform , predict , serialize)
+#   pipeline   PredictPipeline.predict (DataFrame) and predict_record (compiled path) called directly
+#   inprocess  /api/predict and /predictdata through the flask test client , at every concurrency level
+#   gunicorn   the same routes through a local gunicorn (--gunicorn-workers) over http , with the RSS of each worker
+#   uvicorn    the same routes through the ASGI entry point (asgi.py) with the same number of uvicorn workers
+#   preload    gunicorn started with and without GUNICORN_PRELOAD , cold start time and RSS / PSS of every worker
+# --baseline old.json compares p95 and requests/sec with an older run and exits with 1 on a regression
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+from src.utils import process_memory_mb, process_smaps_mb
+from src.pipeline.predict_pipeline import PredictPipeline, CustomData, FEATURE_COLUMNS
+
+SAMPLE_DATA_PATH = os.path.join('notebook', 'data', 'stud.csv')
+STAGES = ['parse', 'dataframe', 'transform', 'transform_compiled', 'predict', 'serialize']
+
+
+def sample_payloads(n_records=200, source_path=SAMPLE_DATA_PATH):
+    # /api/predict bodies (the api sends race_ethnicity as ethnicity)
+    df = pd.read_csv(source_path).head(n_records)
+    payloads = []
+    for record in df[FEATURE_COLUMNS].to_dict(orient='records'):
+        record['ethnicity'] = record.pop('race_ethnicity')
+        payloads.append(record)
+    return payloads
+
+
+def form_payload(payload):
+    # /predictdata takes the html form fields
+    form = dict(payload)
+    form['race_ethnicity'] = form.pop('ethnicity')
+    return form
+
+
+def summarize(latencies, elapsed=None):
+    latencies = np.asarray(latencies) * 1000
+    summary = {'count': int(len(latencies)),
+               'mean_ms': float(latencies.mean()),
+               'p50_ms': float(np.percentile(latencies, 50)),
+               'p95_ms': float(np.percentile(latencies, 95)),
+               'p99_ms': float(np.percentile(latencies, 99)),
+               'max_ms': float(latencies.max())}
+    if elapsed:
+        summary['requests_per_second'] = len(latencies) / elapsed
+    return summary
+
+
+def child_pids(parent_pid):
+    pids = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as file_obj:
+                # the command name can contain spaces , the ppid is the 2nd field after the closing bracket
+                if int(file_obj.read().rsplit(')', 1)[1].split()[1]) == parent_pid:
+                    pids.append(int(name))
+        except (OSError, IndexError, ValueError):
+            continue
+    return sorted(pids)
+
+
+def bench_stages(payloads, n_iterations):
+    pipeline = PredictPipeline()
+    artifacts = pipeline.registry.get()
+    bodies = [json.dumps(payload).encode() for payload in payloads]
+    timings = {stage: [] for stage in STAGES}
+    for i in range(n_iterations):
+        body = bodies[i % len(bodies)]
+
+        started = time.perf_counter()
+        data = json.loads(body)
+        timings['parse'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        features = CustomData(gender=data['gender'],
+                              race_ethnicity=data['ethnicity'],
+                              parental_level_of_education=data['parental_level_of_education'],
+                              lunch=data['lunch'],
+                              test_preparation_course=data['test_preparation_course'],
+                              reading_score=float(data['reading_score']),
+                              writing_score=float(data['writing_score'])).get_data_as_data_frame()
+        timings['dataframe'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        data_scaled = artifacts.preprocessor.transform(features)
+        timings['transform'].append(time.perf_counter() - started)
+
+        if artifacts.compiled_preprocessor is not None:
+            started = time.perf_counter()
+            artifacts.compiled_preprocessor.transform_record(features.iloc[0].to_dict())
+            timings['transform_compiled'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        prediction = artifacts.model.predict(data_scaled)
+        timings['predict'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        json.dumps({'success': True, 'prediction': round(float(prediction[0]), 1),
+                    'message': 'Prediction completed successfully'})
+        timings['serialize'].append(time.perf_counter() - started)
+    return {stage: summarize(values) for stage, values in timings.items() if values}
+
+
+def bench_pipeline(payloads, n_iterations):
+    pipeline = PredictPipeline()
+    frames = [CustomData(**form_payload(payload)).get_data_as_data_frame() for payload in payloads]
+    results = {}
+    for name, call, inputs in [('predict_dataframe', pipeline.predict, frames),
+                               ('predict_record', pipeline.predict_record, payloads)]:
+        latencies = []
+        for i in range(n_iterations):
+            started = time.perf_counter()
+            call(inputs[i % len(inputs)])
+            latencies.append(time.perf_counter() - started)
+        results[name] = summarize(latencies)
+    return results
+
+
+def drive(make_sender, n_requests, concurrency):
+    """
+    Send n_requests with concurrency threads , every thread gets its own sender from make_sender().
+    A sender takes the request number and returns the http status.
+    """
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def worker():
+        send = make_sender()
+        while True:
+            with lock:
+                request_number = next(counter, None)
+            if request_number is None:
+                return
+            started = time.perf_counter()
+            try:
+                status = send(request_number)
+            except Exception as e:
+                status = type(e).__name__
+            latency = time.perf_counter() - started
+            with lock:
+                latencies.append(latency)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    summary = summarize(latencies, elapsed)
+    summary['concurrency'] = concurrency
+    summary['statuses'] = statuses
+    return summary
+
+
+def inprocess_senders(app, payloads):
+    def api_predict():
+        client = app.test_client()
+        return lambda i: client.post('/api/predict', json=payloads[i % len(payloads)]).status_code
+
+    def predictdata():
+        client = app.test_client()
+        return lambda i: client.post('/predictdata', data=form_payload(payloads[i % len(payloads)])).status_code
+
+    return {'/api/predict': api_predict, '/predictdata': predictdata}
+
+
+def http_senders(port, payloads):
+    json_bodies = [json.dumps(payload) for payload in payloads]
+    form_bodies = [urlencode(form_payload(payload)) for payload in payloads]
+
+    def make_sender(path, bodies, content_type):
+        def sender():
+            def send(i):
+                # the sync workers of gunicorn close the connection after every response
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                try:
+                    connection.request('POST', path, body=bodies[i % len(bodies)],
+                                       headers={'Content-Type': content_type})
+                    response = connection.getresponse()
+                    response.read()
+                    return response.status
+                finally:
+                    connection.close()
+            return send
+        return sender
+
+    return {'/api/predict': make_sender('/api/predict', json_bodies, 'application/json'),
+            '/predictdata': make_sender('/predictdata', form_bodies, 'application/x-www-form-urlencoded')}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def bench_gunicorn(payloads, concurrency_levels, n_requests, n_workers, app_module='application:application'):
+    port = free_port()
+    return bench_server([sys.executable, '-m', 'gunicorn', '-w', str(n_workers), '-b', f'127.0.0.1:{port}',
+                         '--log-level', 'warning', app_module],
+                        port, payloads, concurrency_levels, n_requests, n_workers)
+
+
+def bench_uvicorn(payloads, concurrency_levels, n_requests, n_workers, app_module='asgi:application'):
+    port = free_port()
+    return bench_server([sys.executable, '-m', 'uvicorn', '--workers', str(n_workers), '--host', '127.0.0.1',
+                         '--port', str(port), '--log-level', 'warning', '--no-access-log', app_module],
+                        port, payloads, concurrency_levels, n_requests, n_workers)
+
+
+def server_workers(server_pid):
+    # the log collector of gunicorn.conf.py and the resource tracker of uvicorn are children too , not workers
+    return [pid for pid in child_pids(server_pid)
+            if not any(helper in _cmdline(pid) for helper in ('src.logger', 'resource_tracker'))]
+
+
+def wait_for_workers(server_pid, n_workers, timeout=60):
+    # /health answers as soon as the first worker is up , the others can still be booting
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        workers = server_workers(server_pid)
+        if len(workers) >= n_workers:
+            return workers
+        time.sleep(0.05)
+    return server_workers(server_pid)
+
+
+def bench_server(command, port, payloads, concurrency_levels, n_requests, n_workers):
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        if not wait_until_healthy(port):
+            server.terminate()
+            return {'error': server.stderr.read().decode(errors='replace')[-2000:] or f'{command[2]} did not start'}
+        workers = wait_for_workers(server.pid, n_workers)
+        # the first /health only reached one worker , warm up all of them before measuring
+        drive(http_senders(port, payloads)['/api/predict'], 4 * n_workers, n_workers)
+        results = {'workers': n_workers,
+                   'rss_mb_idle': {str(pid): process_memory_mb(pid) for pid in workers},
+                   'routes': {}}
+        for route, make_sender in http_senders(port, payloads).items():
+            results['routes'][route] = [drive(make_sender, n_requests, concurrency) for concurrency in concurrency_levels]
+        results['rss_mb_loaded'] = {str(pid): process_memory_mb(pid) for pid in workers}
+        results['rss_mb_master'] = process_memory_mb(server.pid)
+        results['pss_mb_loaded'] = {str(pid): process_smaps_mb(pid) for pid in workers}
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def bench_preload(payloads, n_workers, app_module='application:application'):
+    """
+    Start gunicorn without and with the preloading master and compare the cold start (seconds until /health
+    answers) and the memory of the workers after every worker predicted a few requests.
+    """
+    results = {}
+    for preload in ['0', '1']:
+        port = free_port()
+        started = time.perf_counter()
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(n_workers), '-b', f'127.0.0.1:{port}',
+                                   '--log-level', 'warning', app_module],
+                                  env=dict(os.environ, GUNICORN_PRELOAD=preload),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            if not wait_until_healthy(port):
+                server.terminate()
+                results[f'preload_{preload}'] = {'error': server.stderr.read().decode(errors='replace')[-2000:]}
+                continue
+            workers = wait_for_workers(server.pid, n_workers)
+            cold_start = time.perf_counter() - started
+            drive(http_senders(port, payloads)['/api/predict'], 20 * n_workers, n_workers)
+            rss = {str(pid): process_memory_mb(pid) for pid in workers}
+            pss = {str(pid): process_smaps_mb(pid) for pid in workers}
+            results[f'preload_{preload}'] = {'cold_start_seconds': cold_start,
+                                             'rss_mb': rss,
+                                             'pss_mb': pss,
+                                             'rss_mb_master': process_memory_mb(server.pid),
+                                             'pss_mb_master': process_smaps_mb(server.pid),
+                                             # what the workers + master really use together
+                                             'pss_mb_total': sum(pss.values()) + process_smaps_mb(server.pid)}
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return results
+
+
+def _cmdline(pid):
+    try:
+        with open(f'/proc/{pid}/cmdline', 'rb') as file_obj:
+            return file_obj.read().decode(errors='replace')
+    except OSError:
+        return ''
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(concurrency_levels=(1, 4, 16), n_requests=500, n_iterations=1000, scenarios=None, gunicorn_workers=2):
+    scenarios = scenarios or ['stages', 'pipeline', 'inprocess', 'gunicorn', 'uvicorn', 'preload']
+    payloads = sample_payloads()
+    report = {'benchmark': 'inference',
+              'commit': git_commit(),
+              'python': platform.python_version(),
+              'cpu_count': os.cpu_count(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'settings': {'concurrency': list(concurrency_levels), 'requests': n_requests, 'iterations': n_iterations},
+              'results': {}}
+    if 'stages' in scenarios:
+        report['results']['stages'] = bench_stages(payloads, n_iterations)
+    if 'pipeline' in scenarios:
+        report['results']['pipeline'] = bench_pipeline(payloads, n_iterations)
+    if 'inprocess' in scenarios:
+        from application import application
+        rss_before = process_memory_mb()
+        routes = {route: [drive(make_sender, n_requests, concurrency) for concurrency in concurrency_levels]
+                  for route, make_sender in inprocess_senders(application, payloads).items()}
+        report['results']['inprocess'] = {'routes': routes, 'rss_mb_before': rss_before, 'rss_mb_after': process_memory_mb()}
+    if 'gunicorn' in scenarios:
+        report['results']['gunicorn'] = bench_gunicorn(payloads, concurrency_levels, n_requests, gunicorn_workers)
+    if 'uvicorn' in scenarios:
+        report['results']['uvicorn'] = bench_uvicorn(payloads, concurrency_levels, n_requests, gunicorn_workers)
+    if 'preload' in scenarios:
+        report['results']['preload'] = bench_preload(payloads, gunicorn_workers)
+    return report
+
+
+def route_rows(report):
+    # (scenario , route , concurrency , summary) of every load test in a report
+    for scenario in ['inprocess', 'gunicorn', 'uvicorn']:
+        for route, summaries in report['results'].get(scenario, {}).get('routes', {}).items():
+            for summary in summaries:
+                yield scenario, route, summary['concurrency'], summary
+
+
+def all_rows(report):
+    # the load tests and the single threaded stage / pipeline measurements
+    for scenario in ['stages', 'pipeline']:
+        for name, summary in report['results'].get(scenario, {}).items():
+            yield scenario, name, 1, summary
+    yield from route_rows(report)
+
+
+def compare(report, baseline, tolerance):
+    """
+    Regressions against a baseline report : p95 latency higher or requests/sec lower by more than tolerance.
+    """
+    old = {(scenario, name, concurrency): summary for scenario, name, concurrency, summary in all_rows(baseline)}
+    regressions = []
+    for scenario, name, concurrency, summary in all_rows(report):
+        previous = old.get((scenario, name, concurrency))
+        if previous is None:
+            continue
+        if summary['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario} {name} c={concurrency}: p95 {previous['p95_ms']:.2f} -> {summary['p95_ms']:.2f} ms")
+        if 'requests_per_second' in summary and \
+                summary['requests_per_second'] < previous['requests_per_second'] * (1 - tolerance):
+            regressions.append(f"{scenario} {name} c={concurrency}: rps {previous['requests_per_second']:.0f} -> "
+                               f"{summary['requests_per_second']:.0f}")
+    return regressions
+
+
+def print_report(report):
+    results = report['results']
+    for scenario in ['stages', 'pipeline']:
+        if scenario in results:
+            print(f"\n{scenario:<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+            for name, summary in results[scenario].items():
+                print(f"{name:<22}{summary['p50_ms']:>9.3f}{summary['p95_ms']:>9.3f}{summary['p99_ms']:>9.3f}")
+    if 'error' in results.get('gunicorn', {}):
+        print(f"\ngunicorn skipped: {results['gunicorn']['error']}")
+    rows = list(route_rows(report))
+    if rows:
+        print(f"\n{'scenario':<11}{'route':<14}{'conc':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+        for scenario, route, concurrency, summary in rows:
+            print(f"{scenario:<11}{route:<14}{concurrency:>5}{summary['requests_per_second']:>9.0f}{summary['p50_ms']:>9.2f}"
+                  f"{summary['p95_ms']:>9.2f}{summary['p99_ms']:>9.2f}  {summary['statuses']}")
+    for server in ['gunicorn', 'uvicorn']:
+        if 'rss_mb_loaded' in results.get(server, {}):
+            print(f"\n{server} worker RSS MB: {results[server]['rss_mb_loaded']}  PSS MB: {results[server]['pss_mb_loaded']}")
+    for mode, summary in results.get('preload', {}).items():
+        if 'error' in summary:
+            print(f"\n{mode}: {summary['error']}")
+            continue
+        print(f"\n{mode}: cold start {summary['cold_start_seconds']:.2f}s , worker RSS MB {summary['rss_mb']} , "
+              f"worker PSS MB {summary['pss_mb']} , master + workers PSS {summary['pss_mb_total']:.0f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and throughput of the prediction service")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=500, help="requests per route and concurrency level")
+    parser.add_argument('--iterations', type=int, default=1000, help="calls per stage / pipeline measurement")
+    parser.add_argument('--scenarios', nargs='+', choices=['stages', 'pipeline', 'inprocess', 'gunicorn', 'uvicorn', 'preload'])
+    parser.add_argument('--gunicorn-workers', type=int, default=2, help="workers of the gunicorn and the uvicorn server")
+    parser.add_argument('--output', help="write the results as json to this file")
+    parser.add_argument('--baseline', help="json of an older run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed relative slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    report = run(args.concurrency, args.requests, args.iterations, args.scenarios, args.gunicorn_workers)
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as file_obj:
+            json.dump(report, file_obj, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file_obj:
+            regressions = compare(report, json.load(file_obj), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# latency and memory of the onnxruntime backend vs the sklearn backend
+# python -m src.benchmark.onnx_backend --export --output artifacts/benchmarks/onnx_backend.json
+# every backend is measured in a fresh interpreter (PREDICT_BACKEND=sklearn|onnx , lookup table and cache off) :
+#   ready_seconds     import of the pipeline + loading of the model
+#   rss_mb            resident memory after the load and the predictions , and which heavy libraries were imported
+#   record_us         predict_record latency (p50 / p99) over the sample records
+#   batch_ms          predict_frame of --batch-size records
+# and the predictions of both backends are compared (parity)
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+import numpy as np
+
+from src.benchmark.startup import FORBIDDEN_MODULES
+
+BACKENDS = ['sklearn', 'onnx']
+
+
+def measure(backend, n_records, batch_size):
+    # runs inside the fresh interpreter
+    started = time.perf_counter()
+    from src.utils import process_memory_mb
+    from src.pipeline.model_registry import ModelRegistry
+    from src.pipeline.predict_pipeline import PredictPipeline, FEATURE_COLUMNS
+    pipeline = PredictPipeline(registry=ModelRegistry())
+    artifacts = pipeline.registry.get()
+    ready_seconds = time.perf_counter() - started
+
+    # pandas only for the benchmark input , it is imported after the modules are recorded
+    modules = sorted(name for name in FORBIDDEN_MODULES if name in sys.modules)
+    import pandas as pd
+    from src.benchmark.datasets import make_synthetic_dataset
+    records = make_synthetic_dataset(n_records)[FEATURE_COLUMNS].to_dict(orient='records')
+    predictions, latencies = [], []
+    for record in records:
+        record_started = time.perf_counter()
+        predictions.append(pipeline.predict_record(record))
+        latencies.append(time.perf_counter() - record_started)
+    batch = pd.DataFrame(make_synthetic_dataset(batch_size)[FEATURE_COLUMNS])
+    pipeline.predict_frame(batch)
+    batch_timings = []
+    for _ in range(5):
+        batch_started = time.perf_counter()
+        pipeline.predict_frame(batch)
+        batch_timings.append(time.perf_counter() - batch_started)
+    return {'backend': backend,
+            'served_by': artifacts.backend,
+            'version': artifacts.version,
+            'ready_seconds': ready_seconds,
+            'rss_mb': process_memory_mb(),
+            'peak_rss_mb': process_memory_mb(field='VmHWM'),
+            'heavy_modules_at_ready': modules,
+            'record_us_p50': float(np.percentile(latencies, 50) * 1e6),
+            'record_us_p99': float(np.percentile(latencies, 99) * 1e6),
+            'batch_size': batch_size,
+            'batch_ms': min(batch_timings) * 1000,
+            'predictions': predictions}
+
+
+def run_backend(backend, n_records, batch_size):
+    env = dict(os.environ, PREDICT_BACKEND=backend, PREDICT_LOOKUP_TABLE='0', PREDICTION_CACHE='off',
+               PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-m', 'src.benchmark.onnx_backend', '--measure', backend,
+                             '--records', str(n_records), '--batch-size', str(batch_size)],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return {'backend': backend, 'error': result.stderr[-2000:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(n_records=2000, batch_size=1000, export=False):
+    if export:
+        from src.pipeline.onnx_pipeline import export_onnx
+        export_onnx()
+    results = [run_backend(backend, n_records, batch_size) for backend in BACKENDS]
+    report = {'benchmark': 'onnx_backend', 'results': results}
+    if all('error' not in result for result in results):
+        sklearn_predictions, onnx_predictions = (np.array(result['predictions']) for result in results)
+        report['parity_max_abs_diff'] = float(np.max(np.abs(sklearn_predictions - onnx_predictions)))
+    for result in results:
+        result.pop('predictions', None)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the onnxruntime and the sklearn prediction backends")
+    parser.add_argument('--records', type=int, default=2000, help="records predicted one by one")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--export', action='store_true', help="export the current artifacts to ONNX first")
+    parser.add_argument('--measure', choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help="write the results as json to this file")
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.records, args.batch_size)))
+        return 0
+
+    report = run(args.records, args.batch_size, args.export)
+    print(f"{'backend':<9}{'served by':<11}{'ready s':>9}{'RSS MB':>9}{'record p50 us':>15}{'p99 us':>9}"
+          f"{'batch ms':>10}  heavy modules")
+    for result in report['results']:
+        if 'error' in result:
+            print(f"{result['backend']:<9} failed: {result['error']}")
+            continue
+        print(f"{result['backend']:<9}{result['served_by']:<11}{result['ready_seconds']:>9.2f}{result['rss_mb']:>9.0f}"
+              f"{result['record_us_p50']:>15.0f}{result['record_us_p99']:>9.0f}{result['batch_ms']:>10.2f}  "
+              f"{','.join(result['heavy_modules_at_ready']) or '-'}")
+    if 'parity_max_abs_diff' in report:
+        print(f"\nlargest difference of the predictions: {report['parity_max_abs_diff']:.3g}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as file_obj:
+            json.dump(report, file_obj, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
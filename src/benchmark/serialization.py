@@ -0,0 +1,114 @@
+# load time and artifact size of every model of the ModelTrainer zoo in every serializer format vs dill
+# python -m src.benchmark.serialization --rows 10000 --output artifacts/benchmarks/serialization.json
+# the models are fitted with their default params on a synthetic dataset (keep_rows , so they learn something) ,
+#   load_seconds        best of --repeat loads in this process (the library is imported already)
+#   cold_load_seconds   load in a fresh interpreter , including the import of the library , like a new worker
+#   max_abs_diff        largest difference of the predictions of the loaded model to the fitted one
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from src.model_serializer import ModelSerializerConfig, NATIVE_FORMAT_MODULES, save_model, load_model
+from src.components.data_transformation import DataTransformation, TARGET_COLUMN
+from src.components.model_trainer import ModelTrainer
+from src.benchmark.datasets import make_synthetic_dataset
+from src.benchmark.artifact_formats import best_time
+
+
+def formats_of(model):
+    # dill is the baseline , joblib is loaded with and without mmap_mode , plus the native format of the library
+    module = type(model).__module__.split('.')[0]
+    candidates = [('dill', ''), ('joblib', ''), ('joblib', 'r')]
+    candidates += [(serializer, '') for serializer, library in NATIVE_FORMAT_MODULES.items() if library == module]
+    return candidates
+
+
+def cold_load_seconds(model_path, mmap_mode):
+    code = ("import time; started = time.perf_counter(); "
+            "from src.model_serializer import ModelSerializerConfig, load_model; "
+            f"load_model({model_path!r}, ModelSerializerConfig(mmap_mode={mmap_mode!r})); "
+            "print(time.perf_counter() - started)")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def run(n_rows=10000, repeat=5, model_names=None):
+    df = make_synthetic_dataset(n_rows, keep_rows=True)
+    preprocessor = DataTransformation().get_data_transformer_object()
+    X = preprocessor.fit_transform(df.drop(columns=[TARGET_COLUMN]))
+    y = df[TARGET_COLUMN].to_numpy()
+    models, _ = ModelTrainer().get_models_and_params()
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='serialization_')
+    try:
+        for name, model in models.items():
+            if model_names and name not in model_names:
+                continue
+            started = time.perf_counter()
+            model.fit(X, y)
+            fit_seconds = time.perf_counter() - started
+            expected = model.predict(X)
+            for serializer, mmap_mode in formats_of(model):
+                model_path = os.path.join(work_dir, name.replace(' ', '_'), 'model.pkl')
+                config = ModelSerializerConfig(serializer=serializer, mmap_mode=mmap_mode)
+                record = {'model': name, 'format': serializer + ('+mmap' if mmap_mode else ''), 'rows': n_rows,
+                          'fit_seconds': fit_seconds}
+                try:
+                    started = time.perf_counter()
+                    manifest = save_model(model, model_path, config)
+                    record['save_seconds'] = time.perf_counter() - started
+                    loaded = load_model(model_path, config)
+                    record.update(size_bytes=manifest['size_bytes'],
+                                  load_seconds=best_time(lambda: load_model(model_path, config), repeat),
+                                  cold_load_seconds=cold_load_seconds(model_path, mmap_mode),
+                                  max_abs_diff=float(np.max(np.abs(loaded.predict(X) - expected))))
+                except Exception as e:
+                    record['error'] = str(e).splitlines()[0]
+                results.append(record)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare load time and size of the model serializer formats")
+    parser.add_argument('--rows', type=int, default=10000, help="rows of the synthetic training set")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--models', nargs='*', help="names of the zoo models , default all")
+    parser.add_argument('--output', help="write the results as json to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.rows, args.repeat, args.models)
+    print(f"{'model':<24}{'format':<15}{'size KB':>10}{'load ms':>10}{'cold ms':>10}{'vs dill':>9}{'max diff':>10}")
+    baseline = {}
+    for result in results:
+        if 'error' in result:
+            print(f"{result['model']:<24}{result['format']:<15} failed: {result['error']}")
+            continue
+        if result['format'] == 'dill':
+            baseline[result['model']] = result['load_seconds']
+        speedup = baseline.get(result['model'], float('nan')) / result['load_seconds']
+        print(f"{result['model']:<24}{result['format']:<15}{result['size_bytes'] / 1024:>10.1f}"
+              f"{result['load_seconds'] * 1000:>10.2f}{result['cold_load_seconds'] * 1000:>10.0f}"
+              f"{speedup:>8.1f}x{result['max_abs_diff']:>10.2g}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as file_obj:
+            json.dump({'benchmark': 'serialization', 'results': results}, file_obj, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# cold start budget of the web app
+# python -m src.benchmark.startup --module application --budget-ms 600 --output artifacts/benchmarks/startup.json
+#   import     python -X importtime -c "import <module>" in a fresh interpreter (median of --repeat runs) ,
+#              the slowest modules of the import and the heavy libraries which it pulled in
+#   ready      seconds from the start of the interpreter until the model is loaded (readiness)
+# exits with 1 when the import is slower than --budget-ms or imports one of the --forbidden libraries ,
+# so the check can run in CI next to the other benchmarks
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+# the libraries which the web app must not import before the first request needs them
+FORBIDDEN_MODULES = ['pandas', 'sklearn', 'scipy', 'xgboost', 'catboost']
+
+
+def parse_importtime(stderr):
+    # lines are 'import time: self [us] | cumulative | <indent>module' , the indent is the nesting level
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        entries.append({'module': name.strip(),
+                        'level': (len(name) - len(name.lstrip()) - 1) // 2,
+                        'self_ms': int(self_us) / 1000,
+                        'cumulative_ms': int(cumulative_us) / 1000})
+    return entries
+
+
+def measure_import(module, env):
+    # the background model load is switched off , it would import sklearn in parallel and blur the numbers
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, env=dict(env, MODEL_WARM_UP='0'))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr[-2000:]}")
+    entries = parse_importtime(result.stderr)
+    total = next(entry['cumulative_ms'] for entry in entries if entry['module'] == module and entry['level'] == 0)
+    return total, entries
+
+
+def measure_ready(module, env):
+    # time until the registry has the model , and the libraries which the model load imports
+    code = ("import time , sys , json; started = time.perf_counter(); "
+            f"import {module}; imported = time.perf_counter() - started; "
+            f"{module}.predict_pipeline.registry.get(); "
+            "print(json.dumps({'import_seconds': imported , 'ready_seconds': time.perf_counter() - started , "
+            "'modules': sorted(name for name in sys.modules if '.' not in name)}))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env=dict(env, MODEL_WARM_UP='0'))
+    if result.returncode != 0:
+        return {'error': result.stderr[-2000:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(module='application', repeat=5, top=15, forbidden=None):
+    forbidden = FORBIDDEN_MODULES if forbidden is None else forbidden
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+    totals, entries = [], []
+    for _ in range(repeat):
+        total, entries = measure_import(module, env)
+        totals.append(total)
+    imported = {entry['module'] for entry in entries}
+    ready = measure_ready(module, env)
+    return {'benchmark': 'startup',
+            'module': module,
+            'import_ms': statistics.median(totals),
+            'import_ms_runs': totals,
+            'slowest_modules': sorted((entry for entry in entries if entry['level'] <= 2),
+                                      key=lambda entry: entry['cumulative_ms'], reverse=True)[:top],
+            'forbidden_imported': [name for name in forbidden if name in imported],
+            'ready': ready,
+            'loaded_by_model': [name for name in forbidden if name in ready.get('modules', [])]}
+
+
+def check(report, budget_ms):
+    problems = []
+    if budget_ms is not None and report['import_ms'] > budget_ms:
+        problems.append(f"import {report['module']} took {report['import_ms']:.0f} ms , budget {budget_ms:.0f} ms")
+    for name in report['forbidden_imported']:
+        problems.append(f"import {report['module']} imports {name}")
+    return problems
+
+
+def print_report(report):
+    print(f"import {report['module']}: {report['import_ms']:.0f} ms (median of {len(report['import_ms_runs'])})")
+    print(f"\n{'module':<40}{'level':>6}{'cumulative ms':>14}{'self ms':>9}")
+    for entry in report['slowest_modules']:
+        print(f"{entry['module']:<40}{entry['level']:>6}{entry['cumulative_ms']:>14.1f}{entry['self_ms']:>9.1f}")
+    ready = report['ready']
+    if 'error' in ready:
+        print(f"\nmodel load failed: {ready['error']}")
+    else:
+        print(f"\nready after {ready['ready_seconds']:.2f}s (import {ready['import_seconds']:.2f}s) , "
+              f"the model load imported {report['loaded_by_model']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time budget and readiness time of the web app")
+    parser.add_argument('--module', default='application', help="module of the app (application , app , asgi)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, help="fail when the median import time is higher")
+    parser.add_argument('--forbidden', nargs='*', default=FORBIDDEN_MODULES,
+                        help="libraries which the import must not pull in")
+    parser.add_argument('--output', help="write the results as json to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.module, args.repeat, forbidden=args.forbidden)
+    print_report(report)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as file_obj:
+            json.dump(report, file_obj, indent=2)
+
+    problems = check(report, args.budget_ms)
+    for problem in problems:
+        print(f"BUDGET {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
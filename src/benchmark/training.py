@@ -0,0 +1,268 @@
+# where the time and the memory of a training run go
+# python -m src.benchmark.training --rows 0 100000 1000000 --output artifacts/benchmarks/training.json
+# runs ingestion -> transformation -> model trainer on notebook/data/stud.csv (--rows 0) and on synthetic datasets
+# of the given sizes , and records wall time , cpu time and peak memory of every stage and of every
+# (model , param combination) of the model search (the cv fits run in worker processes , ModelSearch measures them there)
+# --profile DIR also writes a cProfile file (snakeviz / pstats) and a collapsed stack file (same format as
+# py-spy record -f raw , for flamegraph.pl / speedscope) of the main process per dataset , for the workers use
+# py-spy record --subprocesses -o training.svg -- python -m src.benchmark.training
+import os
+import sys
+import json
+import time
+import shutil
+import cProfile
+import platform
+import argparse
+import resource
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.utils import process_memory_mb, reset_peak_memory
+from src.components.data_ingestion import DataIngestion
+from src.components.data_transformation import DataTransformation
+from src.components.model_trainer import ModelTrainer, ModelTrainerConfig
+from src.components.model_search import ModelSearchConfig
+from src.components.search_checkpoint import SearchCheckpointConfig
+from src.components.streaming_ingestion import StreamingDataIngestion, StreamingIngestionConfig
+from src.components.streaming_transformation import StreamingDataTransformation
+from src.benchmark.datasets import SOURCE_DATA_PATH, write_synthetic_csv
+from src.benchmark.inference import git_commit
+
+
+def children_usage():
+    # cpu seconds and max rss (MB) of the finished child processes (the pool workers once they are shut down)
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+
+class StageRecorder:
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **info):
+        record = dict(stage=name, **info)
+        reset_peak_memory()
+        children_cpu_before, _ = children_usage()
+        started, cpu_started = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = str(e).splitlines()[0]
+            raise
+        finally:
+            children_cpu, children_max_rss = children_usage()
+            record.update(wall_seconds=time.perf_counter() - started,
+                          cpu_seconds=time.process_time() - cpu_started,
+                          children_cpu_seconds=children_cpu - children_cpu_before,
+                          peak_memory_mb=process_memory_mb(field='VmHWM'),
+                          children_max_rss_mb=children_max_rss)
+            self.stages.append(record)
+
+
+class StackSampler:
+    # samples the stack of one thread every interval seconds and counts the stacks ,
+    # written in the collapsed format "outer;...;inner count" like py-spy / flamegraph.pl
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.counts = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, file_path):
+        with open(file_path, 'w') as file_obj:
+            for stack, count in sorted(self.counts.items()):
+                file_obj.write(f"{stack} {count}\n")
+
+
+def candidate_rows(model_search):
+    # one row per (model , param combination) of the cross validation , fold values summed (times) or maxed (memory)
+    rows = []
+    for model_name, results in model_search.cv_results.items():
+        for result in results:
+            peaks = [peak for peak in result.fit_peak_memory_mb if peak is not None]
+            rows.append({'model': model_name,
+                         'params': result.params,
+                         'mean_score': result.mean_score if np.isfinite(result.mean_score) else None,
+                         'folds': len(result.fold_scores),
+                         'fit_seconds': float(np.nansum(result.fit_times)),
+                         'fit_cpu_seconds': float(np.nansum(result.fit_cpu_times)),
+                         'score_seconds': float(np.nansum(result.score_times)),
+                         'fit_peak_memory_mb': max(peaks) if peaks else None})
+    return rows
+
+
+def model_rows(model_search, candidates):
+    rows = []
+    for model_name in model_search.cv_results:
+        own = [candidate for candidate in candidates if candidate['model'] == model_name]
+        rows.append({'model': model_name,
+                     'candidates': len(own),
+                     'cv_fit_seconds': sum(candidate['fit_seconds'] for candidate in own),
+                     'cv_fit_cpu_seconds': sum(candidate['fit_cpu_seconds'] for candidate in own),
+                     'final_fit_seconds': model_search.fit_times.get(model_name),
+                     'best_params': model_search.best_params.get(model_name)})
+    return sorted(rows, key=lambda row: row['cv_fit_seconds'], reverse=True)
+
+
+def run_dataset(source_path, args):
+    recorder = StageRecorder()
+    result = {'source_path': source_path, 'stages': recorder.stages}
+    with recorder.stage('ingestion', mode=args.ingestion_mode) as record:
+        if args.ingestion_mode == 'streaming':
+            ingestion = StreamingDataIngestion(StreamingIngestionConfig(source_data_path=source_path))
+            train_path, test_path, train_rows, test_rows = ingestion.initiate_data_ingestion()
+        else:
+            ingestion = DataIngestion()
+            ingestion.ingestion_config.source_data_path = source_path
+            train_path, test_path = ingestion.initiate_data_ingestion()
+        record['train_path'], record['test_path'] = train_path, test_path
+
+    with recorder.stage('transformation', mode=args.ingestion_mode) as record:
+        if args.ingestion_mode == 'streaming':
+            train_arr, test_arr, _ = StreamingDataTransformation().initiate_data_transformation(
+                train_path, test_path, train_rows, test_rows)
+        else:
+            train_arr, test_arr, _ = DataTransformation().initiate_data_transformation(train_path, test_path)
+        record['train_shape'], record['test_shape'] = list(train_arr.shape), list(test_arr.shape)
+
+    search_config = ModelSearchConfig(n_jobs=args.n_jobs, strategy=args.strategy, n_iter=args.n_iter,
+                                      early_stopping_rounds=args.early_stopping_rounds,
+                                      data_sharing=args.data_sharing)
+    # no search checkpoint , every fit is measured again
+    model_trainer = ModelTrainer(ModelTrainerConfig(search_mode='parallel', search_config=search_config,
+                                                    model_names=args.models,
+                                                    checkpoint_config=SearchCheckpointConfig(enabled=False)))
+    try:
+        with recorder.stage('model_trainer', strategy=args.strategy) as record:
+            record['test_r2'] = model_trainer.initiate_model_trainer(train_arr, test_arr)
+    except Exception:
+        # e.g. "No Best Model Found" , the timings of the search are still worth keeping
+        pass
+    if model_trainer.selection_report is not None:
+        result['selection'] = model_trainer.selection_report
+    if model_trainer.model_search is not None:
+        result['candidates'] = candidate_rows(model_trainer.model_search)
+        result['models'] = model_rows(model_trainer.model_search, result['candidates'])
+    return result
+
+
+def run(args):
+    report = {'benchmark': 'training',
+              'commit': git_commit(),
+              'python': platform.python_version(),
+              'cpu_count': os.cpu_count(),
+              'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'settings': {name: value for name, value in vars(args).items() if name not in ('output', 'profile')},
+              'datasets': []}
+    source_path = os.path.abspath(SOURCE_DATA_PATH)
+    profile_dir = os.path.abspath(args.profile) if args.profile else None
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='training_benchmark_')
+    previous_dir = os.getcwd()
+    os.makedirs(work_dir, exist_ok=True)
+    # the components write into artifacts/ relative to the working directory , so the real artifacts stay untouched
+    os.chdir(work_dir)
+    try:
+        for n_rows in args.rows:
+            name = 'stud' if n_rows == 0 else f'synthetic_{n_rows}'
+            dataset_path = source_path
+            if n_rows:
+                dataset_path = write_synthetic_csv(os.path.join(work_dir, 'data', f'{name}.csv'), n_rows,
+                                                   source_path=source_path, keep_rows=True)
+            print(f"Benchmarking {name}")
+            profiler = cProfile.Profile() if profile_dir else None
+            sampler = StackSampler().start() if profile_dir else None
+            if profiler:
+                profiler.enable()
+            try:
+                result = run_dataset(dataset_path, args)
+            finally:
+                if profiler:
+                    profiler.disable()
+                    sampler.stop()
+                    os.makedirs(profile_dir, exist_ok=True)
+                    profiler.dump_stats(os.path.join(profile_dir, f'{name}.prof'))
+                    sampler.write(os.path.join(profile_dir, f'{name}.collapsed'))
+            result['dataset'] = name
+            result['rows'] = n_rows or None
+            report['datasets'].append(result)
+    finally:
+        os.chdir(previous_dir)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def print_report(report, top=10):
+    for dataset in report['datasets']:
+        print(f"\n{dataset['dataset']}")
+        print(f"{'stage':<16}{'wall s':>9}{'cpu s':>9}{'workers cpu s':>15}{'peak MB':>10}{'workers MB':>12}")
+        for stage in dataset['stages']:
+            print(f"{stage['stage']:<16}{stage['wall_seconds']:>9.2f}{stage['cpu_seconds']:>9.2f}"
+                  f"{stage['children_cpu_seconds']:>15.2f}{stage['peak_memory_mb'] or 0:>10.0f}"
+                  f"{stage['children_max_rss_mb']:>12.0f}  {stage.get('error', '')}")
+        if dataset.get('models'):
+            print(f"{'model':<24}{'candidates':>11}{'cv fit s':>10}{'final fit s':>13}")
+            for row in dataset['models']:
+                print(f"{row['model']:<24}{row['candidates']:>11}{row['cv_fit_seconds']:>10.2f}"
+                      f"{row['final_fit_seconds'] or 0:>13.2f}")
+            slowest = sorted(dataset['candidates'], key=lambda row: row['fit_seconds'], reverse=True)[:top]
+            print(f"slowest {len(slowest)} candidates (fit seconds over all folds , peak MB of one fit)")
+            for row in slowest:
+                print(f"  {row['fit_seconds']:>8.2f}s {row['fit_peak_memory_mb'] or 0:>6.0f}MB  {row['model']} {row['params']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wall time , cpu time and peak memory of the training pipeline")
+    parser.add_argument('--rows', type=int, nargs='+', default=[0],
+                        help="dataset sizes , 0 is notebook/data/stud.csv , other sizes are synthetic")
+    parser.add_argument('--ingestion-mode', choices=['memory', 'streaming'], default='memory')
+    parser.add_argument('--models', nargs='+', help="only these models of the zoo")
+    parser.add_argument('--strategy', choices=['grid', 'random', 'halving'], default='grid')
+    parser.add_argument('--n-iter', type=int, default=10)
+    parser.add_argument('--n-jobs', type=int)
+    parser.add_argument('--early-stopping-rounds', type=int)
+    parser.add_argument('--data-sharing', choices=['auto', 'memmap', 'pickle'], default='auto',
+                        help="how the workers get the train data and the fold slices")
+    parser.add_argument('--work-dir', help="keep the artifacts of the runs here (default: temporary directory)")
+    parser.add_argument('--profile', help="write cProfile and collapsed stack files into this directory")
+    parser.add_argument('--output', help="write the results as json to this file")
+    args = parser.parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+
+    report = run(args)
+    print_report(report)
+    if output:
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with open(output, 'w') as file_obj:
+            json.dump(report, file_obj, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,9 @@
-from multiprocessing.util import info
 import os 
 import sys
 import pandas as pd
 from src.exception import CustomException
 from src.logger import logging
+from src.utils import ARTIFACT_FORMATS, apply_dtypes, save_dataframe
 
 from sklearn.model_selection import train_test_split
 
@@ -11,6 +11,7 @@ from dataclasses import dataclass # this will use to create a class variable
 ## this is for checking everything working fine or not 
 from src.components.data_transformation import DataTransformation
 from src.components.data_transformation import DataTransformationConfig
+from src.components.data_transformation import DATASET_DTYPES
 # this for testing purpose 
 
 
@@ -25,6 +26,20 @@ class DataIngestionConfig:
     train_data_path: str = os.path.join('artifacts','train.csv')
     test_data_path: str= os.path.join('artifacts','test.csv')
     raw_data_path: str = os.path.join('artifacts','data.csv')
+    # source dataset and the split settings
+    source_data_path: str = os.path.join('notebook','data','stud.csv')
+    test_size: float = 0.2
+    random_state: int = 42
+    # format of the raw / train / test artifacts : csv , parquet , feather or npz (compressed numpy)
+    artifact_format: str = os.environ.get('ARTIFACT_FORMAT', 'csv')
+
+    def __post_init__(self):
+        # the default .csv paths get the extension of the chosen format
+        extension = ARTIFACT_FORMATS[self.artifact_format]
+        for name in ('train_data_path', 'test_data_path', 'raw_data_path'):
+            path = getattr(self, name)
+            if path.endswith('.csv'):
+                setattr(self, name, path[:-len('.csv')] + extension)
 
 class DataIngestion:
     # whenever i call this class , it save this config in the variables , 
@@ -38,21 +53,23 @@ class DataIngestion:
         # use try except block to handle the exception 
         try:
             ## read the dataset from the different sources like csv, mongodb, api etc.
-            df = pd.read_csv('notebook\data\stud.csv') # here you can read from mongg db and other sources as well 
+            df = pd.read_csv(self.ingestion_config.source_data_path) # here you can read from mongg db and other sources as well 
+            if self.ingestion_config.artifact_format != 'csv':
+                df = apply_dtypes(df, DATASET_DTYPES) # explicit dtypes instead of the inferred ones (csv can not keep them anyway)
             logging.info('Read the dataset as dataframe')
             # I am creating a directory to save the train , test and raw data where the directory name is artificts
             os.makedirs(os.path.dirname(self.ingestion_config.train_data_path),exist_ok = True) # exist_ok = True will not raise an error if the directory already exists
             
             # for the save the raw data path
-            df.to_csv(self.ingestion_config.raw_data_path,index = False,header = True) # write the dataframe to csv file with headers but without index , at the given path
+            save_dataframe(self.ingestion_config.raw_data_path,df) # write the dataframe in the artifact format (csv with headers but without index by default) , at the given path
             
             logging.info("Train and test split initiated")
-            train_set,test_set = train_test_split(df,test_size = 0.2,random_state = 42) # split the data into train and test set with 80% train and 20% test 
+            train_set,test_set = train_test_split(df,test_size = self.ingestion_config.test_size,random_state = self.ingestion_config.random_state) # split the data into train and test set with 80% train and 20% test 
             # save the train and test data to the respective paths
-            train_set.to_csv(self.ingestion_config.train_data_path,index = False,header = True) # write the train set to csv file with headers but without index
+            save_dataframe(self.ingestion_config.train_data_path,train_set) # write the train set in the artifact format
             # same for the test set 
-            test_set.to_csv(self.ingestion_config.test_data_path,index = False,header = True) # write the test set to csv file with headers but without index
-            logging,info("Ingestion of the data is completed")
+            save_dataframe(self.ingestion_config.test_data_path,test_set) # write the test set in the artifact format
+            logging.info("Ingestion of the data is completed")
             
             return (
                 self.ingestion_config.train_data_path,
@@ -6,7 +6,7 @@ import pandas as pd
 import sys
 
 # for saving object
-from src.utils import save_object
+from src.utils import save_object, load_dataframe
 # Data Transformation Configuration
 
 from sklearn.compose import ColumnTransformer
@@ -22,6 +22,22 @@ from src.exception import CustomException
 # logging configuration
 from src.logger import logging
 
+# input features and the target of the student dataset
+NUMERICAL_FEATURES = ['writing_score', 'reading_score']
+CATEGORICAL_FEATURES = [
+    'gender',
+    'race_ethnicity',
+    'parental_level_of_education',
+    'lunch',
+    'test_preparation_course'
+]
+TARGET_COLUMN = 'math_score'
+# explicit dtypes of the dataset artifacts , categoricals are dictionary encoded in the columnar formats
+DATASET_DTYPES = {
+    **{column: 'category' for column in CATEGORICAL_FEATURES},
+    **{column: 'float64' for column in NUMERICAL_FEATURES + [TARGET_COLUMN]},
+}
+
 @dataclass # dataclass to store configuration related to data transformation
 class DataTransformationConfig: # for storing the all configuration related to data transformation
     # define the path for the transformed data
@@ -53,14 +69,8 @@ class DataTransformation:
         # exception handling 
         try:
             # define numerical features and categorical features
-            numerical_features =  ['writing_score', 'reading_score']  # example numerical features
-            categorical_features = [
-                                    'gender',
-                                    'race_ethnicity',
-                                    'parental_level_of_education',
-                                    'lunch',
-                                    'test_preparation_course'
-            ]
+            numerical_features =  NUMERICAL_FEATURES
+            categorical_features = CATEGORICAL_FEATURES
             
             """        . Apply multiple steps in one go
                         Numeric data often needs:  Missing value handling (SimpleImputer → fill with mean/median)
@@ -106,13 +116,14 @@ class DataTransformation:
         logging.info("Data Transformation started")
         # handle the exception            
         try:
-            train_df = pd.read_csv(train_path) # read the train data from the given path
-            test_df = pd.read_csv(test_path) # read the test data from the given path
+            # only the columns which are needed (the columnar formats do not even read the others)
+            columns = NUMERICAL_FEATURES + CATEGORICAL_FEATURES + [TARGET_COLUMN]
+            train_df = load_dataframe(train_path, columns = columns) # read the train data from the given path
+            test_df = load_dataframe(test_path, columns = columns) # read the test data from the given path
             
             logging.info("Read the train and test data as dataframes")                
             preprocessor_obj = self.get_data_transformer_object() # get the preprocessor object 
-            target_column_name = 'math_score' # target column name
-            numerical_features = ['writing_score', 'reading_score'] # numerical features
+            target_column_name = TARGET_COLUMN # target column name
             
             # split the trainig data into input and target 
             input_features_train_df = train_df.drop(columns = [target_column_name],axis = 1) # independent features
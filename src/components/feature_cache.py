@@ -0,0 +1,123 @@
+# content addressed cache of the transformed train / test arrays
+# key = hash of the raw data + split settings + preprocessor config , so when nothing of that changed
+# the training pipeline skips the ingestion and the transformation and memory maps the cached .npy files
+import os
+import sys
+import json
+import mmap
+import shutil
+import hashlib
+from dataclasses import dataclass
+
+import numpy as np
+import sklearn
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+@dataclass
+class FeatureCacheConfig:
+    cache_dir: str = os.path.join('artifacts', 'feature_cache')
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_obj:
+        for block in iter(lambda: file_obj.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, config: FeatureCacheConfig = None):
+        self.cache_config = config or FeatureCacheConfig()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_config.cache_dir, key)
+
+    def data_hash(self, file_path):
+        # hashing a big csv still needs one full read , so the hash is remembered for (path , mtime , size)
+        stat = os.stat(file_path)
+        index_path = os.path.join(self.cache_config.cache_dir, 'data_hashes.json')
+        stamp = f"{os.path.abspath(file_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        index = {}
+        if os.path.exists(index_path):
+            with open(index_path) as file_obj:
+                index = json.load(file_obj)
+        if stamp not in index:
+            index[stamp] = hash_file(file_path)
+            os.makedirs(self.cache_config.cache_dir, exist_ok=True)
+            with open(index_path, 'w') as file_obj:
+                json.dump(index, file_obj, indent=2)
+        return index[stamp]
+
+    def key(self, raw_data_path, split_settings, preprocessor):
+        """
+        Cache key from the raw data content , the split settings (dict) and the unfitted preprocessor.
+        """
+        try:
+            parts = {
+                'data': self.data_hash(raw_data_path),
+                'split': split_settings,
+                'preprocessor': str(preprocessor.get_params(deep=True)),
+                'sklearn': sklearn.__version__,
+            }
+            return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def load(self, key):
+        """
+        Returns (train_arr , test_arr , cached preprocessor path) with the arrays memory mapped , or None on a miss.
+        """
+        entry_dir = self._entry_dir(key)
+        if not os.path.exists(os.path.join(entry_dir, 'manifest.json')):
+            return None
+        try:
+            train_arr = np.load(os.path.join(entry_dir, 'train.npy'), mmap_mode='r')
+            test_arr = np.load(os.path.join(entry_dir, 'test.npy'), mmap_mode='r')
+            logging.info(f"Feature cache hit {key}")
+            return train_arr, test_arr, os.path.join(entry_dir, 'preprocessor.pkl')
+        except Exception as e:
+            # broken entry is treated like a miss and written again
+            logging.info(f"Feature cache entry {key} could not be read: {e}")
+            return None
+
+    def save(self, key, train_arr, test_arr, preprocessor_path):
+        try:
+            entry_dir = self._entry_dir(key)
+            # the entry is written in a temporary directory and renamed , so a crash never leaves half an entry
+            tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+            os.makedirs(tmp_dir, exist_ok=True)
+            _save_array(os.path.join(tmp_dir, 'train.npy'), train_arr)
+            _save_array(os.path.join(tmp_dir, 'test.npy'), test_arr)
+            shutil.copyfile(preprocessor_path, os.path.join(tmp_dir, 'preprocessor.pkl'))
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as file_obj:
+                json.dump({'key': key, 'train_shape': list(train_arr.shape), 'test_shape': list(test_arr.shape)},
+                          file_obj, indent=2)
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir)
+            os.replace(tmp_dir, entry_dir)
+            logging.info(f"Feature cache saved {key}")
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+def _save_array(file_path, array):
+    # memory mapped .npy files (streaming transformation) are copied as files , never loaded into memory
+    # (only a whole mapped file , a slice of it has the memmap as base and not the mmap itself)
+    if isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and str(array.filename).endswith('.npy'):
+        shutil.copyfile(array.filename, file_path)
+    else:
+        np.save(file_path, np.ascontiguousarray(array))
+
+
+def restore_file(source_path, target_path):
+    # copy the cached file only when it is different , so the model registry does not reload for nothing
+    if os.path.exists(target_path) and hash_file(source_path) == hash_file(target_path):
+        return
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    tmp_path = f"{target_path}.{os.getpid()}.tmp"
+    shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, target_path)
@@ -0,0 +1,337 @@
+# incremental training : when only some rows were appended to the source , the model is updated instead of
+# running ingestion -> transformation -> model search from scratch
+#   new rows      artifacts/training_state.pkl remembers how many bytes of the source were trained on and the
+#                 sha256 of them , a source which only grew is read from that offset , any other change
+#                 (edited / removed rows) means a full retrain
+#   split         the new rows go to train or test by the hash of their content (same as the streaming ingestion)
+#   preprocessor  the streaming statistics (Welford moments , median sample , category counts) are kept in the
+#                 state and updated with the new train rows , a model which is fitted again gets a new
+#                 CompiledPreprocessor from them , a warm started model keeps the preprocessor it was trained with
+#                 (its trees / weights are fitted on that scaling , new means and scales would shift the inputs)
+#   model         xgboost / catboost continue boosting , models with partial_fit (SGD style) get the new rows ,
+#                 warm_start ensembles (random forest , gradient boosting) grow more trees ,
+#                 everything else is fitted again with its tuned params (no hyperparameter search)
+# a full retrain runs instead when there is no state , the new rows are too many or bring a new category ,
+# the new rows drifted , or the updated model misses the r2 gate of ModelTrainer
+import io
+import os
+import sys
+import time
+import shutil
+import hashlib
+import dataclasses
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import save_object, load_object, load_dataframe, save_dataframe, apply_dtypes
+from src.components.data_transformation import NUMERICAL_FEATURES, CATEGORICAL_FEATURES, TARGET_COLUMN, DATASET_DTYPES
+from src.components.streaming_ingestion import hash_split
+from src.components.streaming_transformation import StreamingPreprocessorFitter, RunningMoments
+from src.model_serializer import save_model, load_model
+
+
+@dataclass
+class IncrementalTrainingConfig:
+    state_path: str = os.path.join('artifacts', 'training_state.pkl')
+    # more new rows than this share of the trained rows -> full retrain
+    max_new_fraction: float = float(os.environ.get('INCREMENTAL_MAX_NEW_FRACTION', 0.5))
+    # largest drift score of a column (mean shift in standard deviations for the numbers ,
+    # total variation distance of the shares for the categories) before a full retrain
+    drift_threshold: float = float(os.environ.get('INCREMENTAL_DRIFT_THRESHOLD', 0.25))
+    # below this many new rows the drift scores are mostly noise , they are reported but not used
+    min_drift_rows: int = int(os.environ.get('INCREMENTAL_MIN_DRIFT_ROWS', 100))
+    # boosting rounds / trees added by one warm start
+    extra_estimators: int = int(os.environ.get('INCREMENTAL_EXTRA_ESTIMATORS', 16))
+    # warm starts in a row before a full retrain , so the ensembles do not grow forever
+    max_incremental_runs: int = int(os.environ.get('INCREMENTAL_MAX_RUNS', 10))
+    chunksize: int = int(os.environ.get('INGESTION_CHUNKSIZE', 100000))
+
+
+@dataclass
+class TrainingState:
+    source_path: str
+    # bytes of the source which are trained on and their sha256
+    source_offset: int
+    source_sha256: str
+    rows: int
+    fitter: StreamingPreprocessorFitter
+    target_moments: RunningMoments
+    incremental_runs: int = 0
+    r2: float = None
+    trained_at: float = field(default_factory=time.time)
+
+
+def hash_prefix(file_path, n_bytes):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_obj:
+        while n_bytes > 0:
+            block = file_obj.read(min(1 << 20, n_bytes))
+            if not block:
+                break
+            digest.update(block)
+            n_bytes -= len(block)
+    return digest.hexdigest()
+
+
+def read_frames(file_path, chunksize):
+    # csv chunk by chunk , the other artifact formats in one piece
+    if file_path.endswith('.csv'):
+        yield from pd.read_csv(file_path, chunksize=chunksize)
+    else:
+        yield load_dataframe(file_path)
+
+
+def append_rows(file_path, rows):
+    # into a copy which replaces the split , a crash never leaves the new rows half appended
+    tmp_file_path = f"{file_path}.{os.getpid()}.append.tmp"
+    if file_path.endswith('.csv'):
+        shutil.copyfile(file_path, tmp_file_path)
+        columns = pd.read_csv(file_path, nrows=0).columns
+        rows[columns].to_csv(tmp_file_path, mode='a', index=False, header=False)
+        os.replace(tmp_file_path, file_path)
+    else:
+        # the columnar formats can not be appended to
+        save_dataframe(file_path, apply_dtypes(pd.concat([load_dataframe(file_path), rows], ignore_index=True),
+                                               DATASET_DTYPES))
+
+
+def drift_scores(fitter, target_moments, rows):
+    """
+    Drift of every column of the new rows against the trained statistics , and the categories which were never seen.
+    """
+    scores, unseen = {}, {}
+    for column in NUMERICAL_FEATURES + [TARGET_COLUMN]:
+        moments = target_moments if column == TARGET_COLUMN else fitter.moments[column]
+        values = pd.to_numeric(rows[column], errors='coerce').dropna()
+        std = np.sqrt(moments.variance)
+        scores[column] = float(abs(values.mean() - moments.mean) / std) if len(values) and std > 0 else 0.0
+    for column in CATEGORICAL_FEATURES:
+        counts = fitter.category_counts[column]
+        total = sum(counts.values())
+        new_counts = rows[column].dropna().astype(str).value_counts()
+        new_total = int(new_counts.sum())
+        categories = set(counts) | set(new_counts.index)
+        scores[column] = float(0.5 * sum(abs(counts.get(category, 0) / total -
+                                             (new_counts.get(category, 0) / new_total if new_total else 0))
+                                         for category in categories))
+        new_categories = sorted(set(new_counts.index) - set(counts))
+        if new_categories:
+            unseen[column] = new_categories
+    return scores, unseen
+
+
+class IncrementalTrainer:
+    def __init__(self, pipeline, config: IncrementalTrainingConfig = None):
+        # pipeline is the TrainPipeline , its components do the full retrain
+        self.pipeline = pipeline
+        self.incremental_config = config or IncrementalTrainingConfig()
+        ingestion = pipeline.streaming_ingestion if pipeline.train_pipeline_config.ingestion_mode == 'streaming' \
+            else pipeline.data_ingestion
+        self.ingestion_config = ingestion.ingestion_config
+        self.model_trainer = pipeline.model_trainer
+        self.preprocessor_path = pipeline.data_transformation.data_transformation_config.preprocessor_obj_file_path
+
+    def load_state(self):
+        state_path = self.incremental_config.state_path
+        if not os.path.exists(state_path):
+            return None
+        state = load_object(state_path)
+        if os.path.abspath(state.source_path) != os.path.abspath(self.ingestion_config.source_data_path):
+            return None
+        return state
+
+    def new_rows(self, state):
+        """
+        The rows appended to the source since the state was saved (empty DataFrame when there are none) ,
+        None when the trained part of the source changed.
+        """
+        source_path = self.ingestion_config.source_data_path
+        size = os.path.getsize(source_path)
+        if size < state.source_offset or hash_prefix(source_path, state.source_offset) != state.source_sha256:
+            return None, size
+        with open(source_path, 'rb') as file_obj:
+            header = file_obj.readline()
+            file_obj.seek(state.source_offset)
+            appended = file_obj.read()
+        if not appended.strip():
+            return pd.DataFrame(), size
+        return pd.read_csv(io.BytesIO(header + appended)), size
+
+    def build_state(self, r2):
+        # statistics of the train split which the full retrain has just written
+        config = self.incremental_config
+        fitter = StreamingPreprocessorFitter()
+        target_moments = RunningMoments()
+        rows = 0
+        for frame in read_frames(self.ingestion_config.train_data_path, config.chunksize):
+            fitter.partial_fit(frame)
+            target_moments.update(frame[TARGET_COLUMN].to_numpy(dtype=float))
+            rows += len(frame)
+        for frame in read_frames(self.ingestion_config.test_data_path, config.chunksize):
+            rows += len(frame)
+        source_path = self.ingestion_config.source_data_path
+        size = os.path.getsize(source_path)
+        return TrainingState(source_path=source_path,
+                             source_offset=size,
+                             source_sha256=hash_prefix(source_path, size),
+                             rows=rows,
+                             fitter=fitter,
+                             target_moments=target_moments,
+                             r2=r2)
+
+    def full_retrain(self, reason, report):
+        logging.info(f"Full retrain : {reason}")
+        # the split files are read back for the state , so the ingestion always runs (no feature cache)
+        train_arr, test_arr, _ = self.pipeline.build_features(use_cache=False)
+        r2 = self.model_trainer.initiate_model_trainer(train_arr, test_arr)
+        save_object(file_path=self.incremental_config.state_path, obj=self.build_state(r2))
+        report.update(mode='full', reason=reason, r2=r2)
+        return report
+
+    def transform(self, preprocessor, file_path, new_rows):
+        # features and target of the split file + its new rows
+        features, targets = [], []
+        frames = read_frames(file_path, self.incremental_config.chunksize)
+        for frame in list(frames) + ([new_rows] if len(new_rows) else []):
+            features.append(preprocessor.transform(frame))
+            targets.append(frame[TARGET_COLUMN].to_numpy(dtype=float))
+        return np.vstack(features), np.concatenate(targets)
+
+    @staticmethod
+    def warm_start_method(model):
+        # how warm_start updates the model , all but 'refit' continue from the fitted trees / weights
+        library = type(model).__module__.split('.')[0]
+        if library in ('xgboost', 'catboost'):
+            return 'continued_boosting'
+        if hasattr(model, 'partial_fit'):
+            return 'partial_fit'
+        params = model.get_params()
+        if 'warm_start' in params and 'n_estimators' in params:
+            return 'warm_start'
+        return 'refit'
+
+    def warm_start(self, model, X_train, y_train, X_new, y_new):
+        """
+        Update the fitted model with the new data , returns (model , method).
+        """
+        extra = self.incremental_config.extra_estimators
+        method = self.warm_start_method(model)
+        library = type(model).__module__.split('.')[0]
+        if library == 'xgboost':
+            # extra rounds on top of the trees of the booster
+            booster = model.get_booster()
+            model.set_params(n_estimators=extra)
+            model.fit(X_train, y_train, xgb_model=booster)
+            return model, 'continued_boosting'
+        if library == 'catboost':
+            params = model.get_params()
+            params.update(iterations=extra, verbose=False)
+            continued = type(model)(**params)
+            continued.fit(X_train, y_train, init_model=model)
+            return continued, 'continued_boosting'
+        if method == 'partial_fit':
+            model.partial_fit(X_new, y_new)
+            return model, 'partial_fit'
+        if method == 'warm_start':
+            # the fitted trees are kept , only the extra ones are fitted
+            model.set_params(warm_start=True, n_estimators=model.get_params()['n_estimators'] + extra)
+            model.fit(X_train, y_train)
+            model.set_params(warm_start=False)
+            return model, 'warm_start'
+        model.fit(X_train, y_train)
+        return model, 'refit'
+
+    def run(self):
+        """
+        Update the model with the new rows of the source , or retrain it fully when that is needed.
+        Returns a report dict (mode , reason , new rows , warm start method , drift scores , r2 , seconds).
+        """
+        started = time.perf_counter()
+        report = {'mode': 'incremental', 'new_rows': 0}
+        try:
+            config = self.incremental_config
+            state = self.load_state()
+            if state is None:
+                return self.full_retrain('no training state of this source', report)
+            if state.incremental_runs >= config.max_incremental_runs:
+                return self.full_retrain(f'{state.incremental_runs} incremental runs in a row', report)
+            new_rows, source_size = self.new_rows(state)
+            if new_rows is None:
+                return self.full_retrain('the trained rows of the source changed', report)
+            report['new_rows'] = len(new_rows)
+            if not len(new_rows):
+                report.update(mode='none', reason='no new rows', r2=state.r2)
+                return report
+            if len(new_rows) > config.max_new_fraction * state.rows:
+                return self.full_retrain(f'{len(new_rows)} new rows on {state.rows} trained rows', report)
+
+            scores, unseen = drift_scores(state.fitter, state.target_moments, new_rows)
+            report['drift'] = scores
+            if unseen:
+                return self.full_retrain(f'new categories {unseen}', report)
+            drifted = {column: round(score, 3) for column, score in scores.items() if score > config.drift_threshold}
+            if drifted and len(new_rows) >= config.min_drift_rows:
+                return self.full_retrain(f'drift of {drifted}', report)
+
+            ingestion_config = self.ingestion_config
+            test_mask = hash_split(new_rows, ingestion_config.test_size, ingestion_config.random_state)
+            new_train, new_test = new_rows[~test_mask], new_rows[test_mask]
+            report.update(new_train_rows=len(new_train), new_test_rows=len(new_test))
+
+            fitter, target_moments = state.fitter, state.target_moments
+            if len(new_train):
+                fitter.partial_fit(new_train)
+                target_moments.update(new_train[TARGET_COLUMN].to_numpy(dtype=float))
+
+            trainer_config = self.model_trainer.model_trainer_config
+            # loaded into memory , the warm start changes the fitted arrays
+            model = load_model(trainer_config.trained_model_file_path,
+                               dataclasses.replace(trainer_config.serializer_config, mmap_mode=''))
+            # the updated statistics only go into a preprocessor for a model which is fitted from scratch ,
+            # the others continue on the features of the preprocessor they were trained with
+            trained_preprocessor = load_object(self.preprocessor_path)
+            refit_preprocessor = self.warm_start_method(model) == 'refit'
+            preprocessor = fitter.finalize() if refit_preprocessor else trained_preprocessor
+            report['preprocessor'] = 'refitted' if refit_preprocessor else 'kept'
+            X_train, y_train = self.transform(preprocessor, ingestion_config.train_data_path, new_train)
+            X_test, y_test = self.transform(preprocessor, ingestion_config.test_data_path, new_test)
+            # the model before the update is scored on the features it was trained with
+            X_test_before = X_test if preprocessor is trained_preprocessor else \
+                self.transform(trained_preprocessor, ingestion_config.test_data_path, new_test)[0]
+            report['r2_before'] = r2_score(y_test, model.predict(X_test_before))
+            X_new = preprocessor.transform(new_train) if len(new_train) else X_train[:0]
+            model, method = self.warm_start(model, X_train, y_train, X_new, new_train[TARGET_COLUMN].to_numpy(dtype=float))
+            r2 = r2_score(y_test, model.predict(X_test))
+            report.update(method=method, model=type(model).__name__, r2=r2)
+            logging.info(f"Warm start ({method}) of {type(model).__name__} with {len(new_train)} new rows , "
+                         f"test r2 {report['r2_before']:.4f} -> {r2:.4f}")
+            if r2 < trainer_config.min_r2_score:
+                return self.full_retrain(f'r2 {r2:.4f} of the updated model is below {trainer_config.min_r2_score}',
+                                         report)
+
+            append_rows(ingestion_config.train_data_path, new_train)
+            append_rows(ingestion_config.test_data_path, new_test)
+            if refit_preprocessor:
+                save_object(file_path=self.preprocessor_path, obj=preprocessor)
+            save_model(model=model, model_path=trainer_config.trained_model_file_path,
+                       config=trainer_config.serializer_config)
+            self.model_trainer.export_artifacts()
+            state.source_offset = source_size
+            state.source_sha256 = hash_prefix(ingestion_config.source_data_path, source_size)
+            state.rows += len(new_rows)
+            state.incremental_runs += 1
+            state.r2 = r2
+            state.trained_at = time.time()
+            save_object(file_path=config.state_path, obj=state)
+            report['reason'] = f'{len(new_rows)} new rows'
+            return report
+        except Exception as e:
+            raise CustomException(e, sys)
+        finally:
+            report['seconds'] = time.perf_counter() - started
+            logging.info(f"Incremental training report {report}")
@@ -0,0 +1,508 @@
+# parallel hyperparameter search for all the candidate models of ModelTrainer
+# instead of GridSearchCV running model after model on one core , every (model , param combination , fold)
+# fit is one task for a process pool , the train data is sent to every worker only once (initializer)
+# and the final fit with the best params also runs in the pool , so nothing is fitted twice
+# the candidates come from a search strategy : exhaustive grid , randomized with a budget , or successive halving
+# with data_sharing='memmap' the train data and the (train , validation) slices of every fold are written once
+# as .npy files (in /dev/shm when there is one and the files fit in it) and every worker memory maps them read only , so all the workers
+# share one copy of the pages and no fit slices (copies) the train array again
+# with a SearchCheckpoint every fold result and every final estimator is written to sqlite as it finishes ,
+# and a search started again on the same data only runs the fits which are missing
+import os
+import sys
+import math
+import time
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, ParameterGrid, ParameterSampler, train_test_split
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import process_memory_mb, reset_peak_memory
+from src.components.search_checkpoint import FOLD_COLUMNS, candidate_key
+
+
+@dataclass
+class ModelSearchConfig:
+    # number of worker processes , None means all the cpu cores
+    n_jobs: int = int(os.environ['MODEL_SEARCH_N_JOBS']) if os.environ.get('MODEL_SEARCH_N_JOBS') else None
+    # upper limit for the memory of all the workers together (MB) , None means no limit
+    max_memory_mb: float = float(os.environ['MODEL_SEARCH_MAX_MEMORY_MB']) if os.environ.get('MODEL_SEARCH_MAX_MEMORY_MB') else None
+    # rough memory of one worker without the data (python + numpy + sklearn + xgboost + catboost)
+    worker_base_memory_mb: float = 300
+    # same folds as GridSearchCV(cv=3) uses for the regressors
+    cv: int = 3
+    # 'grid' is every param combination , 'random' samples n_iter of them per model ,
+    # 'halving' is successive halving with n_estimators / iterations as the resource
+    strategy: str = os.environ.get('MODEL_SEARCH_STRATEGY', 'grid')
+    # budget of param combinations per model for the random strategy
+    n_iter: int = int(os.environ.get('MODEL_SEARCH_N_ITER', 10))
+    # only the best 1/factor candidates survive each halving round , and they get factor times more resource
+    halving_factor: int = 3
+    # native early stopping of XGBoost , CatBoost and GradientBoosting , None switches it off
+    early_stopping_rounds: int = int(os.environ['MODEL_SEARCH_EARLY_STOPPING_ROUNDS']) if os.environ.get('MODEL_SEARCH_EARLY_STOPPING_ROUNDS') else None
+    # part of the training rows which is held out for the early stopping
+    early_stopping_fraction: float = 0.1
+    random_state: int = 42
+    # 'memmap' shares the train data and the cached fold slices with the workers through memory mapped files ,
+    # 'pickle' sends every worker its own copy and slices the folds on every fit ,
+    # 'auto' is memmap when there are more workers than folds (the shared cache is cv times the train data ,
+    # the private copies are one train data per worker)
+    data_sharing: str = os.environ.get('MODEL_SEARCH_DATA_SHARING', 'auto')
+    # directory of the fold cache , None means /dev/shm (or the temp directory when there is no /dev/shm
+    # or it has not enough free space , docker gives a container 64 MB by default)
+    cache_dir: str = os.environ.get('MODEL_SEARCH_CACHE_DIR')
+
+
+# params which are the "resource" of successive halving (number of trees / boosting iterations)
+RESOURCE_PARAMS = ('n_estimators', 'iterations')
+
+
+class FoldCache:
+    """
+    The train data and the (X , y) slices of every fold as .npy files , built once by the parent process.
+    Only the directory is pickled to the workers , open() memory maps the files there.
+    """
+    def __init__(self, directory, n_folds):
+        self.directory = directory
+        self.n_folds = n_folds
+        # fold index -> (start , stop) when the validation rows are one contiguous block (KFold without shuffle) ,
+        # they are a view of the mapped train data then and need no file of their own
+        self.validation_ranges = {}
+
+    PREFIX = 'model_search_folds_'
+    # free space of /dev/shm which has to be left over the size of the cache
+    SHM_HEADROOM = 1.25
+
+    @staticmethod
+    def required_bytes(X_train, y_train, folds):
+        # train data + the fit and validation slices of every fold (the contiguous validation blocks need no
+        # file , so this is an upper bound)
+        row_bytes = X_train[:1].nbytes + y_train[:1].nbytes
+        rows = len(X_train) + sum(len(train_index) + len(validation_index) for train_index, validation_index in folds)
+        return rows * row_bytes
+
+    @classmethod
+    def default_dir(cls, n_bytes):
+        # /dev/shm when the cache fits in it , else None (the temp directory)
+        if not (os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK)):
+            return None
+        cls.remove_stale('/dev/shm')
+        free = shutil.disk_usage('/dev/shm').free
+        if n_bytes * cls.SHM_HEADROOM <= free:
+            return '/dev/shm'
+        logging.info(f"/dev/shm has {free / 2 ** 20:.1f} MB free , the fold cache needs {n_bytes / 2 ** 20:.1f} MB , "
+                     f"it is written to the temp directory")
+        return None
+
+    @classmethod
+    def build(cls, X_train, y_train, folds, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = cls.default_dir(cls.required_bytes(X_train, y_train, folds))
+            if cache_dir == '/dev/shm':
+                try:
+                    return cls._write(X_train, y_train, folds, cache_dir)
+                except OSError as e:
+                    # filled up by someone else meanwhile (ENOSPC) , the half written cache is removed already
+                    logging.info(f"Fold cache does not fit in /dev/shm ({e}) , writing it to the temp directory")
+                    cache_dir = None
+        return cls._write(X_train, y_train, folds, cache_dir)
+
+    @classmethod
+    def _write(cls, X_train, y_train, folds, cache_dir):
+        cls.remove_stale(cache_dir or tempfile.gettempdir())
+        # the pid in the name tells remove_stale whether the search which wrote it is still running
+        directory = tempfile.mkdtemp(prefix=f'{cls.PREFIX}{os.getpid()}_', dir=cache_dir)
+        cache = cls(directory, len(folds))
+        try:
+            np.save(cache._path('X_train'), np.ascontiguousarray(X_train))
+            np.save(cache._path('y_train'), np.ascontiguousarray(y_train))
+            for fold_index, (train_index, validation_index) in enumerate(folds):
+                # sliced once here , every model and every candidate reuses the same contiguous fold arrays
+                np.save(cache._path(f'fold{fold_index}_X_fit'), X_train[train_index])
+                np.save(cache._path(f'fold{fold_index}_y_fit'), y_train[train_index])
+                start = int(validation_index[0]) if len(validation_index) else 0
+                if np.array_equal(validation_index, np.arange(start, start + len(validation_index))):
+                    cache.validation_ranges[fold_index] = (start, start + len(validation_index))
+                else:
+                    np.save(cache._path(f'fold{fold_index}_X_validation'), X_train[validation_index])
+                    np.save(cache._path(f'fold{fold_index}_y_validation'), y_train[validation_index])
+        except Exception:
+            cache.remove()
+            raise
+        return cache
+
+    def _path(self, name):
+        return os.path.join(self.directory, f'{name}.npy')
+
+    def _load(self, name):
+        return np.load(self._path(name), mmap_mode='r')
+
+    @property
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory))
+
+    def open(self):
+        # (X_train , y_train , [(X_fit , y_fit , X_validation , y_validation) per fold]) as read only memmaps
+        X_train, y_train = self._load('X_train'), self._load('y_train')
+        folds = []
+        for fold_index in range(self.n_folds):
+            X_fit, y_fit = self._load(f'fold{fold_index}_X_fit'), self._load(f'fold{fold_index}_y_fit')
+            if fold_index in self.validation_ranges:
+                start, stop = self.validation_ranges[fold_index]
+                folds.append((X_fit, y_fit, X_train[start:stop], y_train[start:stop]))
+            else:
+                folds.append((X_fit, y_fit, self._load(f'fold{fold_index}_X_validation'),
+                              self._load(f'fold{fold_index}_y_validation')))
+        return X_train, y_train, folds
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @classmethod
+    def remove_stale(cls, cache_dir):
+        # caches of killed searches , /dev/shm is memory and is only freed on reboot otherwise
+        for name in os.listdir(cache_dir):
+            if not name.startswith(cls.PREFIX):
+                continue
+            pid = name[len(cls.PREFIX):].split('_')[0]
+            if pid.isdigit() and not os.path.exists(f'/proc/{pid}'):
+                logging.info(f"Removing the fold cache {name} of the finished process {pid}")
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+
+# train data of the worker process , it is set once by the pool initializer
+_worker_data = {}
+
+
+def _init_worker(X_train, y_train, folds, search_config):
+    # X_train is a FoldCache in the memmap mode , the arrays themselves in the pickle mode
+    if isinstance(X_train, FoldCache):
+        X_train, y_train, fold_arrays = X_train.open()
+    else:
+        fold_arrays = None
+    _worker_data['X_train'] = X_train
+    _worker_data['y_train'] = y_train
+    _worker_data['folds'] = folds
+    _worker_data['fold_arrays'] = fold_arrays
+    _worker_data['search_config'] = search_config
+
+
+def _fold_data(fold_index):
+    # (X_fit , y_fit , X_validation , y_validation) of the fold , the cached slices when there are some
+    if _worker_data['fold_arrays'] is not None:
+        return _worker_data['fold_arrays'][fold_index]
+    X_train, y_train = _worker_data['X_train'], _worker_data['y_train']
+    train_index, validation_index = _worker_data['folds'][fold_index]
+    return X_train[train_index], y_train[train_index], X_train[validation_index], y_train[validation_index]
+
+
+def fit_estimator(estimator, X, y, early_stopping_rounds=None, early_stopping_fraction=0.1, random_state=42):
+    """
+    Fit the estimator , with its native early stopping when rounds are given and the model supports it
+    (XGBoost / CatBoost get a held out part of X as eval set , GradientBoosting uses n_iter_no_change).
+    """
+    model_type = type(estimator).__name__
+    if not early_stopping_rounds or model_type not in ('XGBRegressor', 'CatBoostRegressor', 'GradientBoostingRegressor'):
+        return estimator.fit(X, y)
+
+    if model_type == 'GradientBoostingRegressor':
+        estimator.set_params(n_iter_no_change=early_stopping_rounds, validation_fraction=early_stopping_fraction)
+        return estimator.fit(X, y)
+
+    X_fit, X_stop, y_fit, y_stop = train_test_split(X, y, test_size=early_stopping_fraction, random_state=random_state)
+    if model_type == 'XGBRegressor':
+        estimator.set_params(early_stopping_rounds=early_stopping_rounds)
+        estimator.fit(X_fit, y_fit, eval_set=[(X_stop, y_stop)], verbose=False)
+        # predict keeps using best_iteration , but a later plain fit() must not ask for an eval set
+        estimator.set_params(early_stopping_rounds=None)
+    else:
+        estimator.fit(X_fit, y_fit, eval_set=(X_stop, y_stop), early_stopping_rounds=early_stopping_rounds, verbose=False)
+    return estimator
+
+
+def _fit(estimator, X, y):
+    search_config = _worker_data['search_config']
+    return fit_estimator(estimator, X, y,
+                         early_stopping_rounds=search_config.early_stopping_rounds,
+                         early_stopping_fraction=search_config.early_stopping_fraction,
+                         random_state=search_config.random_state)
+
+
+def _single_threaded(estimator):
+    # every worker is already one process per core , so the estimators must not start their own threads
+    params = estimator.get_params()
+    if 'n_jobs' in params:
+        estimator.set_params(n_jobs=1)
+    if type(estimator).__name__.startswith('CatBoost'):
+        # catboost also writes catboost_info/ on every fit , workers would write into the same files
+        estimator.set_params(thread_count=1, allow_writing_files=False)
+    return estimator
+
+
+def _fit_and_score(model_name, candidate_index, estimator, fold_index):
+    estimator = _single_threaded(estimator)
+
+    # the peak memory of the worker is reset , so it is the peak of this fit (None off linux)
+    reset_peak_memory()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    X_fit, y_fit, X_validation, y_validation = _fold_data(fold_index)
+    _fit(estimator, X_fit, y_fit)
+    fit_time = time.perf_counter() - started
+    fit_cpu_time = time.process_time() - cpu_started
+    fit_peak_memory_mb = process_memory_mb(field='VmHWM')
+
+    started = time.perf_counter()
+    score = r2_score(y_validation, estimator.predict(X_validation))
+    score_time = time.perf_counter() - started
+    return model_name, candidate_index, fold_index, score, fit_time, score_time, fit_cpu_time, fit_peak_memory_mb
+
+
+def _fit_final(model_name, estimator):
+    # fitted single threaded like the cv fits , other final fits run in the pool at the same time
+    n_jobs = estimator.get_params().get('n_jobs')
+    estimator = _single_threaded(estimator)
+    X_train, y_train = _worker_data['X_train'], _worker_data['y_train']
+    started = time.perf_counter()
+    _fit(estimator, X_train, y_train)
+    fit_time = time.perf_counter() - started
+    # the saved model predicts with its own n_jobs again (catboost takes the threads of predict as an argument)
+    if 'n_jobs' in estimator.get_params():
+        estimator.set_params(n_jobs=n_jobs)
+    return model_name, estimator, fit_time
+
+
+@dataclass
+class CandidateResult:
+    params: dict
+    fold_scores: list = field(default_factory=list)
+    fit_times: list = field(default_factory=list)
+    score_times: list = field(default_factory=list)
+    fit_cpu_times: list = field(default_factory=list)
+    fit_peak_memory_mb: list = field(default_factory=list)
+
+    def add_fold(self, score, fit_time, score_time, fit_cpu_time=None, fit_peak_memory_mb=None):
+        self.fold_scores.append(score)
+        self.fit_times.append(fit_time)
+        self.score_times.append(score_time)
+        self.fit_cpu_times.append(fit_cpu_time)
+        self.fit_peak_memory_mb.append(fit_peak_memory_mb)
+
+    @property
+    def mean_score(self):
+        # a failed fold makes the whole candidate invalid , like error_score=nan of GridSearchCV
+        if not self.fold_scores or any(np.isnan(score) for score in self.fold_scores):
+            return -np.inf
+        return float(np.mean(self.fold_scores))
+
+
+class ModelSearch:
+    def __init__(self, config: ModelSearchConfig = None):
+        self.search_config = config or ModelSearchConfig()
+        self.cv_results = {}     # model name -> list of CandidateResult
+        self.best_params = {}    # model name -> best params found by the cross validation
+        self.fit_times = {}      # model name -> seconds of the final fit
+        self.checkpoint = None   # SearchCheckpoint of the running search
+        self.resumed_fits = 0    # fits which were skipped because the checkpoint had their result
+
+    def resolve_data_sharing(self):
+        data_sharing = self.search_config.data_sharing
+        if data_sharing == 'auto':
+            n_workers = self.search_config.n_jobs or os.cpu_count() or 1
+            return 'memmap' if n_workers > self.search_config.cv else 'pickle'
+        if data_sharing not in ('memmap', 'pickle'):
+            raise ValueError(f"Unknown data sharing mode: {data_sharing}")
+        return data_sharing
+
+    def resolve_n_workers(self, data_bytes, data_sharing='pickle'):
+        n_workers = self.search_config.n_jobs or os.cpu_count() or 1
+        if self.search_config.max_memory_mb:
+            if data_sharing == 'memmap':
+                # the mapped pages are shared , a worker only keeps the working copy of the estimator
+                # (e.g. the DMatrix of xgboost) , the fold cache (train data + cv - 1 times it in fit slices)
+                # is counted once for all the workers
+                budget_mb = self.search_config.max_memory_mb - self.search_config.cv * data_bytes / 2 ** 20
+                per_worker_mb = self.search_config.worker_base_memory_mb + data_bytes / 2 ** 20
+                return max(1, min(n_workers, int(budget_mb // per_worker_mb)))
+            # every worker keeps a copy of the train data and the slices of one fold
+            per_worker_mb = self.search_config.worker_base_memory_mb + 3 * data_bytes / 2 ** 20
+            n_workers = min(n_workers, int(self.search_config.max_memory_mb // per_worker_mb))
+        return max(1, n_workers)
+
+    def run(self, X_train, y_train, X_test, y_test, models, params, checkpoint=None):
+        """
+        Cross validate every param combination of every model in parallel , fit each model once with
+        its best params and return {model name: test r2 score} like evaluate_models.
+        The fitted estimators replace the entries of the models dict.
+        With a SearchCheckpoint the results which it has already are not computed again.
+        """
+        try:
+            self.checkpoint = checkpoint
+            self.resumed_fits = 0
+            folds = list(KFold(n_splits=self.search_config.cv).split(X_train))
+            data_sharing = self.resolve_data_sharing()
+            n_workers = self.resolve_n_workers(X_train.nbytes + y_train.nbytes, data_sharing)
+            logging.info(f"Model search with {n_workers} worker processes , data sharing {data_sharing}")
+
+            fold_cache = None
+            worker_data = (X_train, y_train)
+            if data_sharing == 'memmap':
+                started = time.perf_counter()
+                fold_cache = FoldCache.build(X_train, y_train, folds, self.search_config.cache_dir)
+                worker_data = (fold_cache, None)
+                logging.info(f"Fold cache of {fold_cache.nbytes / 2 ** 20:.1f} MB written to {fold_cache.directory} "
+                             f"in {time.perf_counter() - started:.2f}s")
+            try:
+                with ProcessPoolExecutor(max_workers=n_workers,
+                                         initializer=_init_worker,
+                                         initargs=worker_data + (folds, self.search_config)) as executor:
+                    self._cross_validate(executor, models, params, len(folds))
+                    fitted = self._fit_best(executor, models)
+            finally:
+                if fold_cache is not None:
+                    fold_cache.remove()
+
+            report = {}
+            for model_name, model in fitted.items():
+                models[model_name] = model
+                report[model_name] = r2_score(y_test, model.predict(X_test))
+                if checkpoint is not None:
+                    checkpoint.record_test_score(model_name, report[model_name])
+                logging.info(f"{model_name}: best params {self.best_params[model_name]} test r2 {report[model_name]}")
+            if self.resumed_fits:
+                logging.info(f"{self.resumed_fits} fits were taken from the search checkpoint")
+            return report
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _cross_validate(self, executor, models, params, n_folds):
+        if self.search_config.strategy == 'halving':
+            self._successive_halving(executor, models, params, n_folds)
+            return
+        candidates = {model_name: self._candidates(params.get(model_name, {})) for model_name in models}
+        self.cv_results = self._evaluate(executor, models, candidates, n_folds)
+        for model_name, results in self.cv_results.items():
+            # first best candidate wins on a tie , same as GridSearchCV
+            best = max(results, key=lambda result: result.mean_score)
+            self.best_params[model_name] = best.params
+
+    def _candidates(self, param_grid):
+        if self.search_config.strategy not in ('grid', 'random'):
+            raise ValueError(f"Unknown search strategy: {self.search_config.strategy}")
+        grid = list(ParameterGrid(param_grid))
+        if self.search_config.strategy == 'random' and len(grid) > self.search_config.n_iter:
+            return list(ParameterSampler(param_grid, n_iter=self.search_config.n_iter,
+                                         random_state=self.search_config.random_state))
+        return grid
+
+    def _halving_plan(self, param_grid):
+        # (resource param , increasing resource levels , candidates without the resource param)
+        resource = next((name for name in RESOURCE_PARAMS if name in param_grid), None)
+        if resource is None:
+            return None, [None], list(ParameterGrid(param_grid))
+        values = sorted(param_grid[resource])
+        levels, level = [], values[0]
+        while level < values[-1]:
+            levels.append(level)
+            level *= self.search_config.halving_factor
+        levels.append(values[-1])
+        other_params = {name: value for name, value in param_grid.items() if name != resource}
+        return resource, levels, list(ParameterGrid(other_params))
+
+    def _successive_halving(self, executor, models, params, n_folds):
+        plans = {model_name: self._halving_plan(params.get(model_name, {})) for model_name in models}
+        self.cv_results = {model_name: [] for model_name in models}
+        remaining = {model_name: plan[2] for model_name, plan in plans.items()}
+        round_index = 0
+        # every round evaluates the surviving candidates of all the models together , so the pool stays busy
+        while remaining:
+            candidates = {}
+            for model_name, survivors in remaining.items():
+                resource, levels, _ = plans[model_name]
+                level = levels[round_index]
+                candidates[model_name] = [dict(candidate, **{resource: level}) if resource else candidate
+                                          for candidate in survivors]
+            results = self._evaluate(executor, models, candidates, n_folds)
+
+            for model_name, round_results in results.items():
+                self.cv_results[model_name].extend(round_results)
+                resource, levels, _ = plans[model_name]
+                ranked = sorted(round_results, key=lambda result: result.mean_score, reverse=True)
+                keep = math.ceil(len(ranked) / self.search_config.halving_factor)
+                last_round = round_index + 1 == len(levels)
+                if keep == 1 or last_round:
+                    # the winner is trained with the full resource of the grid
+                    best = dict(ranked[0].params)
+                    if resource:
+                        best[resource] = levels[-1]
+                    self.best_params[model_name] = best
+                    del remaining[model_name]
+                else:
+                    remaining[model_name] = [{name: value for name, value in result.params.items() if name != resource}
+                                             for result in ranked[:keep]]
+            logging.info(f"Successive halving round {round_index} evaluated "
+                         f"{sum(len(batch) for batch in candidates.values())} candidates")
+            round_index += 1
+
+    def _evaluate(self, executor, models, candidates, n_folds):
+        # cross validate the given candidates of every model , returns model name -> list of CandidateResult
+        results = {model_name: [CandidateResult(params=candidate) for candidate in model_candidates]
+                   for model_name, model_candidates in candidates.items()}
+        futures = {}
+        for model_name, model_candidates in candidates.items():
+            for candidate_index, candidate in enumerate(model_candidates):
+                estimator = clone(models[model_name]).set_params(**candidate)
+                key = candidate_key(estimator) if self.checkpoint is not None else None
+                for fold_index in range(n_folds):
+                    saved = self.checkpoint.fold_result(key, fold_index) if key else None
+                    if saved is not None:
+                        results[model_name][candidate_index].add_fold(*(saved[column] for column in FOLD_COLUMNS))
+                        self.resumed_fits += 1
+                        continue
+                    future = executor.submit(_fit_and_score, model_name, candidate_index, estimator, fold_index)
+                    futures[future] = (model_name, candidate_index, key)
+        logging.info(f"Submitted {len(futures)} cross validation fits")
+
+        for future in as_completed(futures):
+            model_name, candidate_index, key = futures[future]
+            result = results[model_name][candidate_index]
+            try:
+                _, _, fold_index, score, fit_time, score_time, fit_cpu_time, fit_peak_memory_mb = future.result()
+            except Exception as e:
+                # one broken param combination should not stop the whole search
+                # (it is not checkpointed , a crashed worker fails the same way and is retried on the next run)
+                logging.info(f"Cross validation fit of {model_name} {result.params} failed: {e}")
+                result.add_fold(np.nan, np.nan, np.nan, np.nan, None)
+                continue
+            result.add_fold(score, fit_time, score_time, fit_cpu_time, fit_peak_memory_mb)
+            if key:
+                self.checkpoint.record_fold(model_name, key, result.params, fold_index, score, fit_time, score_time,
+                                            fit_cpu_time, fit_peak_memory_mb)
+        return results
+
+    def _fit_best(self, executor, models):
+        futures, keys, fitted = [], {}, {}
+        for model_name, model in models.items():
+            estimator = clone(model).set_params(**self.best_params[model_name])
+            if self.checkpoint is not None:
+                keys[model_name] = candidate_key(estimator)
+                saved = self.checkpoint.best_estimator(model_name, keys[model_name])
+                if saved is not None:
+                    fitted[model_name], self.fit_times[model_name] = saved
+                    self.resumed_fits += 1
+                    continue
+            futures.append(executor.submit(_fit_final, model_name, estimator))
+        for future in as_completed(futures):
+            model_name, estimator, fit_time = future.result()
+            fitted[model_name] = estimator
+            self.fit_times[model_name] = fit_time
+            if self.checkpoint is not None:
+                self.checkpoint.save_best(model_name, keys[model_name], self.best_params[model_name], estimator, fit_time)
+        # keep the order of the models dict
+        return {model_name: fitted[model_name] for model_name in models}
@@ -0,0 +1,189 @@
+# cost aware choice of the model which is served
+# every fitted candidate of the search is measured on the test features :
+#   row_latency_us     predict of one row (p50 / p99) , what the /predict endpoint pays per request
+#   batch_latency_ms   predict of a batch of batch_size rows (best of repeat) , the batch endpoint / bulk scoring
+#   size_bytes         saved artifact in the configured serializer format
+#   load_ms            load_model of that artifact (best of repeat , the library is imported already)
+# the preprocessing is the same for every model , so it is not part of the numbers
+# policies :
+#   r2              best test r2 (the old behaviour)
+#   latency_budget  best test r2 of the models within the row / batch latency budgets
+#   pareto          Pareto front of (r2 , row latency , batch latency , size) , on it the fastest model
+#                   which is at most r2_tolerance below the best r2
+# all the numbers , the front and the choice are written to artifacts/model_selection.json
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from dataclasses import dataclass, asdict
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+from src.model_serializer import save_model, load_model
+
+SELECTION_POLICIES = ('r2', 'latency_budget', 'pareto')
+# objectives of the Pareto front , True = higher is better
+PARETO_OBJECTIVES = {'test_r2': True, 'row_latency_us_p50': False, 'batch_latency_ms': False, 'size_bytes': False}
+
+
+@dataclass
+class ModelSelectionConfig:
+    policy: str = os.environ.get('MODEL_SELECTION_POLICY', 'r2')
+    # latency_budget : p50 of the single row predict in microseconds and the batch predict in ms , 0 = no budget
+    row_latency_budget_us: float = float(os.environ.get('MODEL_SELECTION_ROW_BUDGET_US', 0))
+    batch_latency_budget_ms: float = float(os.environ.get('MODEL_SELECTION_BATCH_BUDGET_MS', 0))
+    # pareto : how much r2 may be traded for a faster model
+    r2_tolerance: float = float(os.environ.get('MODEL_SELECTION_R2_TOLERANCE', 0.01))
+    # rows predicted one by one , size of the batch , repeats of the batch predict and of the load
+    latency_rows: int = 200
+    batch_size: int = 1000
+    repeat: int = 5
+    report_path: str = os.path.join('artifacts', 'model_selection.json')
+
+
+def measure_inference_cost(model, X, config: ModelSelectionConfig, serializer_config=None):
+    """
+    Latency of the single row and the batch predict , size and load time of the saved model.
+    X are feature rows (e.g. the test features) , they are repeated when there are fewer than needed.
+    """
+    rows = X[np.arange(config.latency_rows) % len(X)]
+    batch = X[np.arange(config.batch_size) % len(X)]
+    # first call outside of the timings (lazy initialisation of the libraries)
+    model.predict(rows[:1])
+    latencies = []
+    for position in range(len(rows)):
+        started = time.perf_counter()
+        model.predict(rows[position:position + 1])
+        latencies.append(time.perf_counter() - started)
+    batch_seconds = []
+    for _ in range(config.repeat):
+        started = time.perf_counter()
+        model.predict(batch)
+        batch_seconds.append(time.perf_counter() - started)
+
+    directory = tempfile.mkdtemp(prefix='model_selection_')
+    try:
+        model_path = os.path.join(directory, 'model.pkl')
+        manifest = save_model(model, model_path, serializer_config)
+        load_seconds = []
+        for _ in range(config.repeat):
+            started = time.perf_counter()
+            load_model(model_path, serializer_config)
+            load_seconds.append(time.perf_counter() - started)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {'row_latency_us_p50': float(np.percentile(latencies, 50) * 1e6),
+            'row_latency_us_p99': float(np.percentile(latencies, 99) * 1e6),
+            'batch_latency_ms': min(batch_seconds) * 1000,
+            'batch_size': config.batch_size,
+            'size_bytes': manifest['size_bytes'],
+            'format': manifest['format'],
+            'load_ms': min(load_seconds) * 1000}
+
+
+def pareto_front(rows):
+    # names of the rows which no other row beats or equals on every objective (and beats on one)
+    def at_least_as_good(a, b):
+        return all(a[name] >= b[name] if higher else a[name] <= b[name] for name, higher in PARETO_OBJECTIVES.items())
+
+    front = []
+    for row in rows:
+        dominated = any(other is not row and at_least_as_good(other, row) and
+                        any(other[name] != row[name] for name in PARETO_OBJECTIVES) for other in rows)
+        if not dominated:
+            front.append(row['model'])
+    return front
+
+
+def within_budget(row, config):
+    if config.row_latency_budget_us and row['row_latency_us_p50'] > config.row_latency_budget_us:
+        return False
+    if config.batch_latency_budget_ms and row['batch_latency_ms'] > config.batch_latency_budget_ms:
+        return False
+    return True
+
+
+def choose(rows, config: ModelSelectionConfig):
+    """
+    Returns (model name , reason) of the row which the policy picks.
+    """
+    if config.policy not in SELECTION_POLICIES:
+        raise ValueError(f"Unknown model selection policy {config.policy} , use one of {SELECTION_POLICIES}")
+    # sorted by r2 , the first one wins every tie below
+    ranked = sorted(rows, key=lambda row: row['test_r2'], reverse=True)
+    if config.policy == 'r2':
+        return ranked[0]['model'], 'best test r2'
+    if config.policy == 'latency_budget':
+        allowed = [row for row in ranked if row['within_budget']]
+        if not allowed:
+            fastest = min(rows, key=lambda row: row['row_latency_us_p50'])
+            raise ValueError(f"No model within the latency budget (row {config.row_latency_budget_us} us , batch "
+                             f"{config.batch_latency_budget_ms} ms) , the fastest is {fastest['model']} with "
+                             f"{fastest['row_latency_us_p50']:.0f} us per row and {fastest['batch_latency_ms']:.2f} ms per batch")
+        return allowed[0]['model'], 'best test r2 within the latency budget'
+    best_r2 = ranked[0]['test_r2']
+    close = [row for row in ranked if row['pareto'] and row['test_r2'] >= best_r2 - config.r2_tolerance]
+    chosen = min(close, key=lambda row: row['row_latency_us_p50'])
+    return chosen['model'], f"fastest model of the Pareto front within {config.r2_tolerance} r2 of the best"
+
+
+def select_model(models, model_report, X_test, config: ModelSelectionConfig = None, serializer_config=None):
+    """
+    Measure the inference cost of every fitted model of the search , choose one with the configured policy
+    and write the selection report. Returns the report dict , report['selected'] is the model name.
+    """
+    try:
+        config = config or ModelSelectionConfig()
+        rows = []
+        for model_name, score in model_report.items():
+            started = time.perf_counter()
+            row = {'model': model_name, 'test_r2': float(score)}
+            row.update(measure_inference_cost(models[model_name], X_test, config, serializer_config))
+            row['measure_seconds'] = time.perf_counter() - started
+            rows.append(row)
+        front = pareto_front(rows)
+        for row in rows:
+            row['pareto'] = row['model'] in front
+            row['within_budget'] = within_budget(row, config)
+
+        selected, reason = choose(rows, config)
+        for row in rows:
+            row['selected'] = row['model'] == selected
+        report = {'policy': config.policy,
+                  'selected': selected,
+                  'reason': reason,
+                  'config': asdict(config),
+                  'models': sorted(rows, key=lambda row: row['test_r2'], reverse=True)}
+        logging.info(f"Model selection ({config.policy}) : {selected} , {reason}")
+        for row in report['models']:
+            logging.info(f"{row['model']}: r2 {row['test_r2']:.4f} , row p50 {row['row_latency_us_p50']:.0f} us , "
+                         f"batch {row['batch_latency_ms']:.2f} ms , {row['size_bytes']} bytes , load {row['load_ms']:.2f} ms"
+                         f"{' , pareto' if row['pareto'] else ''}")
+
+        if config.report_path:
+            os.makedirs(os.path.dirname(config.report_path) or '.', exist_ok=True)
+            tmp_file_path = f"{config.report_path}.{os.getpid()}.tmp"
+            with open(tmp_file_path, 'w') as file_obj:
+                json.dump(report, file_obj, indent=2)
+            os.replace(tmp_file_path, config.report_path)
+        return report
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+# the last selection report (python -m src.components.model_selection)
+if __name__ == "__main__":
+    with open(ModelSelectionConfig().report_path) as file_obj:
+        report = json.load(file_obj)
+    print(f"policy {report['policy']} , selected {report['selected']} ({report['reason']})")
+    print(f"{'model':<24}{'test r2':>9}{'row p50 us':>12}{'row p99 us':>12}{'batch ms':>10}{'size KB':>10}"
+          f"{'load ms':>9}  pareto")
+    for row in report['models']:
+        print(f"{row['model']:<24}{row['test_r2']:>9.4f}{row['row_latency_us_p50']:>12.0f}{row['row_latency_us_p99']:>12.0f}"
+              f"{row['batch_latency_ms']:>10.2f}{row['size_bytes'] / 1024:>10.1f}{row['load_ms']:>9.2f}  "
+              f"{'yes' if row['pareto'] else ''}{' <- selected' if row['selected'] else ''}")
@@ -1,6 +1,6 @@
 import os  # for let you interact with the operating system for tasks like handling files , directories , variables
 import sys # work as bridge between the python code and runtime environment
-from dataclasses import dataclass # dundare class for making those class which are store and manipulate the data 
+from dataclasses import dataclass, field # dundare class for making those class which are store and manipulate the data 
 
 # Algorithms for train model 
 from sklearn.linear_model import ( 
@@ -31,20 +31,107 @@ from src.exception import CustomException
 
 
 # for all the common function i will import utils 
-from src.utils import (save_object,
-                       evaluate_models)
+from src.utils import evaluate_models
+# parallel search over all the models , params and folds
+from src.components.model_search import ModelSearch, ModelSearchConfig
+# sqlite checkpoint of every fold result and final estimator , a restarted search resumes from it
+from src.components.search_checkpoint import SearchCheckpoint, SearchCheckpointConfig
+# which model is served : best r2 , best r2 within a latency budget or from the Pareto front of r2 and cost
+from src.components.model_selection import ModelSelectionConfig, select_model
+# native / joblib model artifacts with a manifest instead of one dill pickle
+from src.model_serializer import ModelSerializerConfig, save_model
+# optional precomputed predictions of the whole input domain
+from src.pipeline.lookup_table import LookupTableConfig, materialize_lookup_table
+# optional ONNX graph of preprocessor + model for the onnxruntime backend
+from src.pipeline.onnx_pipeline import OnnxExportConfig, export_onnx
 
 
 @dataclass
 class ModelTrainerConfig: # this will give the input whatever i required while my model training
     # variable for storing the trained model file path
     trained_model_file_path = os.path.join("artifacts","model.pkl")
+    # 'parallel' spreads every (model , params , fold) fit over a process pool , 'sequential' is GridSearchCV model after model
+    search_mode: str = os.environ.get('MODEL_SEARCH_MODE', 'parallel')
+    # workers and memory cap of the parallel search
+    search_config: ModelSearchConfig = field(default_factory=ModelSearchConfig)
+    # MODEL_SEARCH_CHECKPOINT=0 switches the checkpoint (artifacts/model_search.sqlite) off
+    checkpoint_config: SearchCheckpointConfig = field(default_factory=SearchCheckpointConfig)
+    # MODEL_SELECTION_POLICY=r2|latency_budget|pareto , the report goes to artifacts/model_selection.json
+    selection_config: ModelSelectionConfig = field(default_factory=ModelSelectionConfig)
+    # train only these models of the zoo (e.g. for the benchmarks) , None means all of them
+    model_names: list = None
+    # MATERIALIZE_LOOKUP_TABLE=1 predicts the whole finite input domain after training (artifacts/lookup_table.npy)
+    materialize_lookup_table: bool = os.environ.get('MATERIALIZE_LOOKUP_TABLE', '0') == '1'
+    # format of the saved model (MODEL_SERIALIZER=auto|xgboost_ubj|xgboost_json|catboost_cbm|joblib|dill)
+    serializer_config: ModelSerializerConfig = field(default_factory=ModelSerializerConfig)
+    # EXPORT_ONNX=1 writes artifacts/model.onnx after training (served with PREDICT_BACKEND=onnx)
+    export_onnx: bool = os.environ.get('EXPORT_ONNX', '0') == '1'
+    # test r2 which the best model has to reach , else the training fails (and the incremental training retrains fully)
+    min_r2_score: float = 0.6
     
 # another class for training the model , inside this class we will train the model 
 class ModelTrainer:
-    def __init__(self):
-        self.model_trainer_config = ModelTrainerConfig()   
+    def __init__(self, config: ModelTrainerConfig = None):
+        self.model_trainer_config = config or ModelTrainerConfig()   
+        # ModelSearch of the last parallel run , keeps the cv results and fit times of every candidate
+        self.model_search = None
+        # SearchCheckpoint of the last run , its summary() has the cv results and timings of every model
+        self.checkpoint = None
+        # latency , size , load time and test r2 of every candidate and the choice of the last run
+        self.selection_report = None
     
+    def get_models_and_params(self):
+        # make a dictionary for the models and model name 
+        models = {
+            'Decision Tree': DecisionTreeRegressor(),
+            'Random Forest': RandomForestRegressor(),
+            'Gradient Boosting': GradientBoostingRegressor(),
+            'Linear Regression': LinearRegression(),
+            'XGBoostRegressor': XGBRegressor(),
+            "CatBoosting Regressor": CatBoostRegressor(verbose=False),
+            'AdaBoost Regressor': AdaBoostRegressor(),
+        }
+        
+        # parameters for the hyparaparameters
+        params={
+            "Decision Tree": {
+                'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
+                # 'splitter':['best','random'],
+                # 'max_features':['sqrt','log2'],
+            },
+            "Random Forest":{
+                # 'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
+             
+                # 'max_features':['sqrt','log2',None],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "Gradient Boosting":{
+                # 'loss':['squared_error', 'huber', 'absolute_error', 'quantile'],
+                'learning_rate':[.1,.01,.05,.001],
+                'subsample':[0.6,0.7,0.75,0.8,0.85,0.9],
+                # 'criterion':['squared_error', 'friedman_mse'],
+                # 'max_features':['auto','sqrt','log2'],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+            "Linear Regression":{},
+            "XGBoostRegressor":{
+                'learning_rate':[.1,.01,.05,.001],
+                'n_estimators': [8,16,32,64,128,256]
+            },
+             "CatBoosting Regressor":{
+                 'depth': [6,8,10],
+                 'learning_rate': [0.01, 0.05, 0.1],
+                 'iterations': [30, 50, 100]
+             },
+            "AdaBoost Regressor":{
+                'learning_rate':[.1,.01,0.5,.001],
+                # 'loss':['linear','square','exponential'],
+                'n_estimators': [8,16,32,64,128,256]
+            }
+            
+        }
+        return models, params
+
     # this method is responsibale for the initializing the model trainer
     def initiate_model_trainer(self,train_array,test_array): # it take 3 positional arguments : train_arr , test_arr and preprocessor_path - where my actual pickle file is exist
         try:
@@ -55,85 +142,70 @@ class ModelTrainer:
                                              test_array[:,:-1],
                                              test_array[:,-1])   # split the train (X,y) and test (X,y) 
             
-            # make a dictionary for the models and model name 
-            models = {
-                'Decision Tree': DecisionTreeRegressor(),
-                'Random Forest': RandomForestRegressor(),
-                'Gradient Boosting': GradientBoostingRegressor(),
-                'Linear Regression': LinearRegression(),
-                'XGBoostRegressor': XGBRegressor(),
-                "CatBoosting Regressor": CatBoostRegressor(verbose=False),
-                'AdaBoost Regressor': AdaBoostRegressor(),
-            }
+            models, params = self.get_models_and_params()
+            if self.model_trainer_config.model_names:
+                models = {name: model for name, model in models.items() if name in self.model_trainer_config.model_names}
             
-            # parameters for the hyparaparameters
-            params={
-                "Decision Tree": {
-                    'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
-                    # 'splitter':['best','random'],
-                    # 'max_features':['sqrt','log2'],
-                },
-                "Random Forest":{
-                    # 'criterion':['squared_error', 'friedman_mse', 'absolute_error', 'poisson'],
-                 
-                    # 'max_features':['sqrt','log2',None],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "Gradient Boosting":{
-                    # 'loss':['squared_error', 'huber', 'absolute_error', 'quantile'],
-                    'learning_rate':[.1,.01,.05,.001],
-                    'subsample':[0.6,0.7,0.75,0.8,0.85,0.9],
-                    # 'criterion':['squared_error', 'friedman_mse'],
-                    # 'max_features':['auto','sqrt','log2'],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                "Linear Regression":{},
-                "XGBRegressor":{
-                    'learning_rate':[.1,.01,.05,.001],
-                    'n_estimators': [8,16,32,64,128,256]
-                },
-                 "CatBoosting Regressor":{
-                     'depth': [6,8,10],
-                     'learning_rate': [0.01, 0.05, 0.1],
-                     'iterations': [30, 50, 100]
-                 },
-                "AdaBoost Regressor":{
-                    'learning_rate':[.1,.01,0.5,.001],
-                    # 'loss':['linear','square','exponential'],
-                    'n_estimators': [8,16,32,64,128,256]
-                }
-                
-            }
             # evaluate model is a function which i have created in utils (which is common for all) it take 5 parameters
             #model_report contains the r2_score for each models which i have specify above 
-            model_report:dict = evaluate_models(X_train= X_train,y_train= y_train,
-                                               X_test = X_test , y_test = y_test,
-                                               models = models,params = params)
-            
-            # To get the best model from the dict
-            best_model_score = max(sorted(model_report.values()))
+            # the fold results depend on the data , the folds and the early stopping , nothing else of the search
+            search_config = self.model_trainer_config.search_config
+            parallel = self.model_trainer_config.search_mode == 'parallel'
+            self.checkpoint = SearchCheckpoint.open(self.model_trainer_config.checkpoint_config,
+                                                    arrays = (X_train , y_train , X_test , y_test),
+                                                    settings = {'cv': search_config.cv if parallel else 3,
+                                                                'early_stopping_rounds': search_config.early_stopping_rounds if parallel else None,
+                                                                'early_stopping_fraction': search_config.early_stopping_fraction,
+                                                                'random_state': search_config.random_state})
+            if parallel:
+                self.model_search = ModelSearch(search_config)
+                model_report:dict = self.model_search.run(X_train= X_train,y_train= y_train,
+                                                     X_test = X_test , y_test = y_test,
+                                                     models = models,params = params,
+                                                     checkpoint = self.checkpoint)
+            else:
+                model_report:dict = evaluate_models(X_train= X_train,y_train= y_train,
+                                                   X_test = X_test , y_test = y_test,
+                                                   models = models,params = params,
+                                                   checkpoint = self.checkpoint)
             
-            # To get the best model name from the dict
-            best_model_name = list(model_report.keys())[
-                list(model_report.values()).index(best_model_score)
-            ]                                                            # here i am just say that select the whose value or index is best_model_score . that's it 
+            # every candidate is measured (predict latency , size , load time) and the selection policy picks
+            # the model , 'r2' (default) is the model with the best test score like before
+            self.selection_report = select_model(models = models , model_report = model_report , X_test = X_test,
+                                                 config = self.model_trainer_config.selection_config,
+                                                 serializer_config = self.model_trainer_config.serializer_config)
+            best_model_name = self.selection_report['selected']
+            best_model_score = model_report[best_model_name]
             
             best_model = models[best_model_name] 
             logging.info(f"best model name is : {best_model_name}")
-            if best_model_score < 0.6 :
+            if best_model_score < self.model_trainer_config.min_r2_score :
                 raise CustomException("No Best Model Found")
             
             logging.info("Best Model found on both training and testing dataset.")
             
-            save_object(
-                file_path = self.model_trainer_config.trained_model_file_path,
-                obj = best_model
+            # artifacts/model.<format> + artifacts/model.manifest.json , the registry loads it from the manifest
+            save_model(
+                model = best_model,
+                model_path = self.model_trainer_config.trained_model_file_path,
+                config = self.model_trainer_config.serializer_config
             )
              
             predicted  = best_model.predict(X_test) 
             r2_square  = r2_score(y_test,predicted)
+
+            self.export_artifacts()
             
             return r2_square
         except Exception as e:
-            raise CustomException(e,sys)      
+            raise CustomException(e,sys)
+
+    def export_artifacts(self):
+        # the optional artifacts derived from the saved model (and preprocessor) , also used by the incremental training
+        if self.model_trainer_config.materialize_lookup_table:
+            materialize_lookup_table(LookupTableConfig(
+                model_path=self.model_trainer_config.trained_model_file_path))
+        if self.model_trainer_config.export_onnx:
+            export_onnx(OnnxExportConfig(
+                model_path=self.model_trainer_config.trained_model_file_path))      
     
\ No newline at end of file
@@ -0,0 +1,213 @@
+# checkpoint of the model search in a local sqlite file (artifacts/model_search.sqlite)
+# every (model , params , fold) cross validation result is written as soon as it finishes , with its timings ,
+# and the final estimator of every model is kept (pickled with dill) together with its test r2 ,
+# a search which is started again on the same data skips everything which is in the file already
+#   searches         one row per search : key , settings , when it ran
+#   fold_results     score , fit / score seconds , cpu seconds and peak memory of one fold of one candidate
+#   best_estimators  the fitted estimator of every model with its params , fit seconds and test r2
+# the search key is a hash of the train / test arrays and the settings which change the fold results
+# (folds , early stopping) , a candidate is identified by the class and all the params of its estimator
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from dataclasses import dataclass
+
+import dill
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+@dataclass
+class SearchCheckpointConfig:
+    # MODEL_SEARCH_CHECKPOINT=0 switches the checkpoint off (every run searches from scratch)
+    enabled: bool = os.environ.get('MODEL_SEARCH_CHECKPOINT', '1') != '0'
+    db_path: str = os.environ.get('MODEL_SEARCH_CHECKPOINT_PATH', os.path.join('artifacts', 'model_search.sqlite'))
+    # the fitted estimators of older searches are deleted , only the ones of the last few searches are kept
+    keep_searches: int = 3
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    search_key TEXT PRIMARY KEY,
+    settings TEXT,
+    started_at REAL,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS fold_results (
+    search_key TEXT,
+    candidate_key TEXT,
+    model TEXT,
+    params TEXT,
+    fold INTEGER,
+    score REAL,
+    fit_seconds REAL,
+    score_seconds REAL,
+    fit_cpu_seconds REAL,
+    fit_peak_memory_mb REAL,
+    created_at REAL,
+    PRIMARY KEY (search_key, candidate_key, fold)
+);
+CREATE TABLE IF NOT EXISTS best_estimators (
+    search_key TEXT,
+    model TEXT,
+    candidate_key TEXT,
+    params TEXT,
+    fit_seconds REAL,
+    test_score REAL,
+    estimator BLOB,
+    created_at REAL,
+    PRIMARY KEY (search_key, model)
+);
+"""
+
+FOLD_COLUMNS = ('score', 'fit_seconds', 'score_seconds', 'fit_cpu_seconds', 'fit_peak_memory_mb')
+
+
+def _to_json(value):
+    return json.dumps(value, sort_keys=True, default=repr)
+
+
+def search_key(arrays, settings):
+    """
+    Hash of the arrays (block by block , a sliced or memory mapped array is never copied as a whole)
+    and of the settings dict.
+    """
+    digest = hashlib.sha256(_to_json(settings).encode())
+    for array in arrays:
+        digest.update(f"{array.shape}{array.dtype}".encode())
+        rows_per_block = max(1, (1 << 24) // max(1, array[:1].nbytes))
+        for start in range(0, len(array), rows_per_block):
+            digest.update(np.ascontiguousarray(array[start:start + rows_per_block]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def candidate_key(estimator):
+    # class + all the params of the (unfitted) estimator , so a changed default of the zoo is a new candidate
+    model_class = type(estimator)
+    parts = f"{model_class.__module__}.{model_class.__qualname__}:{_to_json(estimator.get_params())}"
+    return hashlib.sha256(parts.encode()).hexdigest()[:16]
+
+
+class SearchCheckpoint:
+    def __init__(self, db_path, key, keep_searches=3):
+        self.db_path = db_path
+        self.key = key
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(db_path)
+        # WAL + synchronous NORMAL , a commit per finished fit costs no fsync of the whole file
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        self.keep_searches = keep_searches
+        # (candidate key , fold) -> dict of FOLD_COLUMNS , read once
+        self.completed = {}
+        rows = self.connection.execute(f"SELECT candidate_key, fold, {', '.join(FOLD_COLUMNS)} FROM fold_results "
+                                       "WHERE search_key = ?", (key,))
+        for row in rows:
+            self.completed[(row[0], row[1])] = dict(zip(FOLD_COLUMNS, row[2:]))
+
+    @classmethod
+    def open(cls, config: SearchCheckpointConfig, arrays, settings):
+        """
+        The checkpoint of the search over these arrays with these settings , None when it is switched off.
+        """
+        if not config.enabled:
+            return None
+        try:
+            started = time.perf_counter()
+            checkpoint = cls(config.db_path, search_key(arrays, settings), config.keep_searches)
+            now = time.time()
+            with checkpoint.connection:
+                checkpoint.connection.execute(
+                    "INSERT INTO searches VALUES (?, ?, ?, ?) ON CONFLICT(search_key) DO UPDATE SET updated_at = ?",
+                    (checkpoint.key, _to_json(settings), now, now, now))
+            checkpoint.prune()
+            logging.info(f"Search checkpoint {checkpoint.key} in {config.db_path} with {len(checkpoint.completed)} "
+                         f"fold results ({time.perf_counter() - started:.2f}s)")
+            return checkpoint
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def fold_result(self, key, fold):
+        return self.completed.get((key, fold))
+
+    def record_fold(self, model_name, key, params, fold, score, fit_seconds, score_seconds,
+                    fit_cpu_seconds=None, fit_peak_memory_mb=None):
+        values = (score, fit_seconds, score_seconds, fit_cpu_seconds, fit_peak_memory_mb)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO fold_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (self.key, key, model_name, _to_json(params), fold) + values + (time.time(),))
+        self.completed[(key, fold)] = dict(zip(FOLD_COLUMNS, values))
+
+    def best_estimator(self, model_name, key):
+        """
+        (fitted estimator , fit seconds) saved for the model with exactly this candidate , or None.
+        """
+        row = self.connection.execute("SELECT estimator, fit_seconds FROM best_estimators "
+                                      "WHERE search_key = ? AND model = ? AND candidate_key = ?",
+                                      (self.key, model_name, key)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        try:
+            return dill.loads(row[0]), row[1]
+        except Exception as e:
+            # e.g. pickled by another library version , it is fitted again
+            logging.info(f"Saved estimator of {model_name} could not be loaded: {e}")
+            return None
+
+    def save_best(self, model_name, key, params, estimator, fit_seconds):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO best_estimators VALUES (?, ?, ?, ?, ?, NULL, ?, ?)",
+                                    (self.key, model_name, key, _to_json(params), fit_seconds,
+                                     dill.dumps(estimator), time.time()))
+
+    def record_test_score(self, model_name, score):
+        with self.connection:
+            self.connection.execute("UPDATE best_estimators SET test_score = ? WHERE search_key = ? AND model = ?",
+                                    (score, self.key, model_name))
+
+    def prune(self):
+        # the estimators are the big part of the file , the fold results of old searches are kept
+        with self.connection:
+            self.connection.execute(
+                "UPDATE best_estimators SET estimator = NULL WHERE search_key NOT IN "
+                "(SELECT search_key FROM searches ORDER BY updated_at DESC LIMIT ?)", (self.keep_searches,))
+
+    def summary(self):
+        """
+        One dict per model : best params , mean cv score , summed cv fit seconds , final fit seconds , test r2.
+        """
+        rows = self.connection.execute(
+            "SELECT b.model, b.params, b.fit_seconds, b.test_score, AVG(f.score), SUM(f.fit_seconds), COUNT(f.fold) "
+            "FROM best_estimators b LEFT JOIN fold_results f "
+            "ON f.search_key = b.search_key AND f.candidate_key = b.candidate_key "
+            "WHERE b.search_key = ? GROUP BY b.model ORDER BY b.test_score DESC", (self.key,))
+        columns = ('model', 'params', 'fit_seconds', 'test_score', 'cv_score', 'cv_fit_seconds', 'folds')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+# results of the last search (python -m src.components.search_checkpoint)
+if __name__ == "__main__":
+    config = SearchCheckpointConfig()
+    connection = sqlite3.connect(config.db_path)
+    last = connection.execute("SELECT search_key, settings FROM searches ORDER BY updated_at DESC LIMIT 1").fetchone()
+    connection.close()
+    if last is None:
+        print(f"No search in {config.db_path}")
+        sys.exit(0)
+    checkpoint = SearchCheckpoint(config.db_path, last[0])
+    print(f"search {last[0]} {last[1]} , {len(checkpoint.completed)} fold results")
+    print(f"{'model':<24}{'cv r2':>8}{'test r2':>9}{'cv fit s':>10}{'fit s':>8}  params")
+    for row in checkpoint.summary():
+        print(f"{row['model']:<24}{row['cv_score'] if row['cv_score'] is not None else float('nan'):>8.4f}"
+              f"{row['test_score'] if row['test_score'] is not None else float('nan'):>9.4f}"
+              f"{row['cv_fit_seconds'] or 0:>10.2f}{row['fit_seconds'] or 0:>8.2f}  {row['params']}")
+    checkpoint.close()
@@ -0,0 +1,65 @@
+# chunked version of DataIngestion for the sources which are bigger than the memory
+# the source csv is read chunk by chunk and every row goes to train or test by the hash of its content ,
+# so the split is deterministic (same row -> same side on every run) and never needs the whole dataset
+import os
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+from src.logger import logging
+
+
+@dataclass
+class StreamingIngestionConfig:
+    train_data_path: str = os.path.join('artifacts', 'train.csv')
+    test_data_path: str = os.path.join('artifacts', 'test.csv')
+    source_data_path: str = os.path.join('notebook', 'data', 'stud.csv')
+    test_size: float = 0.2
+    random_state: int = 42
+    # rows per chunk , this is what bounds the memory
+    chunksize: int = int(os.environ.get('INGESTION_CHUNKSIZE', 100000))
+
+
+def hash_split(chunk, test_size, random_state):
+    # boolean mask of the test rows , from a seeded 64 bit hash of the row values (not of the position)
+    hash_key = f"{random_state:016d}"[-16:]
+    row_hashes = pd.util.hash_pandas_object(chunk, index=False, hash_key=hash_key).to_numpy()
+    return (row_hashes % np.uint64(10000)) < np.uint64(round(test_size * 10000))
+
+
+class StreamingDataIngestion:
+    def __init__(self, config: StreamingIngestionConfig = None):
+        self.ingestion_config = config or StreamingIngestionConfig()
+
+    def initiate_data_ingestion(self):
+        """
+        Stream the source into the train and test csv files.
+        Returns (train path , test path , train rows , test rows).
+        """
+        logging.info("Entered the streaming data ingestion")
+        try:
+            config = self.ingestion_config
+            os.makedirs(os.path.dirname(config.train_data_path), exist_ok=True)
+            # write into temporary files first , a failed run never leaves a half split behind
+            tmp_train_path = f"{config.train_data_path}.{os.getpid()}.tmp"
+            tmp_test_path = f"{config.test_data_path}.{os.getpid()}.tmp"
+
+            train_rows, test_rows = 0, 0
+            with open(tmp_train_path, 'w', newline='') as train_file, open(tmp_test_path, 'w', newline='') as test_file:
+                for chunk_index, chunk in enumerate(pd.read_csv(config.source_data_path, chunksize=config.chunksize)):
+                    test_mask = hash_split(chunk, config.test_size, config.random_state)
+                    header = chunk_index == 0
+                    chunk[~test_mask].to_csv(train_file, index=False, header=header)
+                    chunk[test_mask].to_csv(test_file, index=False, header=header)
+                    test_rows += int(test_mask.sum())
+                    train_rows += len(chunk) - int(test_mask.sum())
+
+            os.replace(tmp_train_path, config.train_data_path)
+            os.replace(tmp_test_path, config.test_data_path)
+            logging.info(f"Streaming ingestion completed , {train_rows} train rows and {test_rows} test rows")
+            return config.train_data_path, config.test_data_path, train_rows, test_rows
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -0,0 +1,189 @@
+# chunked version of DataTransformation
+# fit : one pass over the train csv collecting streaming statistics (mean / variance with Welford ,
+#       median from a reservoir sample sketch , counts of every category) , the result is the same
+#       CompiledPreprocessor which is used on the online path , so it is saved as preprocessor.pkl
+# transform : second pass writing the feature batches straight into .npy files (memory mapped)
+import os
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import save_object
+from src.components.data_transformation import NUMERICAL_FEATURES, CATEGORICAL_FEATURES, TARGET_COLUMN
+from src.pipeline.compiled_preprocessor import CompiledPreprocessor
+
+
+@dataclass
+class StreamingTransformationConfig:
+    preprocessor_obj_file_path: str = os.path.join('artifacts', 'preprocessor.pkl')
+    train_features_path: str = os.path.join('artifacts', 'train_features.npy')
+    test_features_path: str = os.path.join('artifacts', 'test_features.npy')
+    chunksize: int = int(os.environ.get('INGESTION_CHUNKSIZE', 100000))
+    # number of values kept for the median , below this many rows the median is exact
+    median_sample_size: int = 100000
+    random_state: int = 42
+
+
+class RunningMoments:
+    # mean and variance in one pass , chunks are merged with the parallel form of Welford's algorithm
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def merge(self, count, mean, m2):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def update(self, values):
+        if len(values):
+            chunk_mean = float(values.mean())
+            self.merge(len(values), chunk_mean, float(((values - chunk_mean) ** 2).sum()))
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+
+class ReservoirSample:
+    # fixed size uniform sample of a stream (Algorithm R , vectorized per chunk) , used as the median sketch
+    def __init__(self, size, random_state):
+        self.size = size
+        self.values = np.empty(0)
+        self.seen = 0
+        self._rng = np.random.default_rng(random_state)
+
+    def update(self, values):
+        free = self.size - len(self.values)
+        if free > 0:
+            self.values = np.concatenate([self.values, values[:free]])
+            self.seen += len(values[:free])
+            values = values[free:]
+        if len(values):
+            positions = self.seen + np.arange(1, len(values) + 1)
+            accepted = self._rng.random(len(values)) < self.size / positions
+            slots = self._rng.integers(0, self.size, int(accepted.sum()))
+            self.values[slots] = values[accepted]
+            self.seen += len(values)
+
+    def median(self):
+        return float(np.median(self.values)) if len(self.values) else np.nan
+
+
+class StreamingPreprocessorFitter:
+    def __init__(self, median_sample_size=100000, random_state=42):
+        self.moments = {column: RunningMoments() for column in NUMERICAL_FEATURES}
+        self.samples = {column: ReservoirSample(median_sample_size, random_state) for column in NUMERICAL_FEATURES}
+        self.missing = {column: 0 for column in NUMERICAL_FEATURES + CATEGORICAL_FEATURES}
+        self.category_counts = {column: {} for column in CATEGORICAL_FEATURES}
+
+    def partial_fit(self, chunk):
+        for column in NUMERICAL_FEATURES:
+            values = pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=float)
+            observed = values[~np.isnan(values)]
+            self.missing[column] += len(values) - len(observed)
+            self.moments[column].update(observed)
+            self.samples[column].update(observed)
+        for column in CATEGORICAL_FEATURES:
+            counts = chunk[column].value_counts(dropna=True)
+            self.missing[column] += int(chunk[column].isna().sum())
+            table = self.category_counts[column]
+            for category, count in counts.items():
+                table[str(category)] = table.get(str(category), 0) + int(count)
+
+    def finalize(self):
+        """
+        Build the CompiledPreprocessor with the same values the sklearn ColumnTransformer of
+        DataTransformation would learn (the imputed values are part of the scaler statistics too).
+        """
+        fill_values, means, inverse_scales = [], [], []
+        for column in NUMERICAL_FEATURES:
+            median = self.samples[column].median()
+            moments = RunningMoments()
+            moments.merge(self.moments[column].count, self.moments[column].mean, self.moments[column].m2)
+            # the scaler sees the missing values already replaced by the median
+            moments.merge(self.missing[column], median, 0.0)
+            scale = np.sqrt(moments.variance)
+            fill_values.append(median)
+            means.append(moments.mean)
+            inverse_scales.append(1.0 / scale if scale > 0 else 1.0)
+
+        offset = len(NUMERICAL_FEATURES)
+        categorical_fill_values, category_index, one_hot_values = [], [], [0.0] * offset
+        for column in CATEGORICAL_FEATURES:
+            counts = dict(self.category_counts[column])
+            # most frequent value , the smallest one on a tie like SimpleImputer
+            most_frequent = min(counts, key=lambda category: (-counts[category], category))
+            counts[most_frequent] += self.missing[column]
+            total = sum(counts.values())
+            categories = sorted(counts)
+            category_index.append({category: offset + i for i, category in enumerate(categories)})
+            for category in categories:
+                share = counts[category] / total
+                scale = np.sqrt(share * (1 - share))
+                one_hot_values.append(1.0 / scale if scale > 0 else 1.0)
+            categorical_fill_values.append(most_frequent)
+            offset += len(categories)
+
+        return CompiledPreprocessor(n_features=offset,
+                                    numerical_columns=NUMERICAL_FEATURES,
+                                    numerical_offset=0,
+                                    fill_values=fill_values,
+                                    means=means,
+                                    inverse_scales=inverse_scales,
+                                    categorical_columns=CATEGORICAL_FEATURES,
+                                    categorical_fill_values=categorical_fill_values,
+                                    category_index=category_index,
+                                    one_hot_values=one_hot_values)
+
+
+class StreamingDataTransformation:
+    def __init__(self, config: StreamingTransformationConfig = None):
+        self.transformation_config = config or StreamingTransformationConfig()
+
+    def fit(self, train_path):
+        config = self.transformation_config
+        fitter = StreamingPreprocessorFitter(config.median_sample_size, config.random_state)
+        for chunk in pd.read_csv(train_path, chunksize=config.chunksize):
+            fitter.partial_fit(chunk)
+        return fitter.finalize()
+
+    def transform_to_file(self, preprocessor, data_path, n_rows, output_path):
+        # features + target column , written batch by batch into a memory mapped .npy file
+        output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float64,
+                                           shape=(n_rows, preprocessor.n_features + 1))
+        position = 0
+        for chunk in pd.read_csv(data_path, chunksize=self.transformation_config.chunksize):
+            end = position + len(chunk)
+            output[position:end, :-1] = preprocessor.transform(chunk)
+            output[position:end, -1] = chunk[TARGET_COLUMN].to_numpy(dtype=float)
+            position = end
+        output.flush()
+        del output
+        return np.load(output_path, mmap_mode='r')
+
+    def initiate_data_transformation(self, train_path, test_path, train_rows, test_rows):
+        """
+        Returns (train_arr , test_arr , preprocessor path) like DataTransformation , the arrays are memory mapped.
+        """
+        logging.info("Streaming data transformation started")
+        try:
+            config = self.transformation_config
+            preprocessor = self.fit(train_path)
+            logging.info("Fitted the preprocessor from streaming statistics")
+            train_arr = self.transform_to_file(preprocessor, train_path, train_rows, config.train_features_path)
+            test_arr = self.transform_to_file(preprocessor, test_path, test_rows, config.test_features_path)
+            save_object(file_path=config.preprocessor_obj_file_path, obj=preprocessor)
+            logging.info("Saved preprocessed object")
+            return train_arr, test_arr, config.preprocessor_obj_file_path
+        except Exception as e:
+            raise CustomException(e, sys)
@@ -1,21 +1,339 @@
 import logging
+import logging.handlers
 from datetime import datetime
 import os
+import json
+import queue
+import struct
+import atexit
+import threading
+import socketserver
+import dataclasses
+from dataclasses import dataclass
 
-LOG_FILE  = f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log"
-logs_path = os.path.join(os.getcwd(),"logs",LOG_FILE)
-os.makedirs(logs_path,exist_ok = True)
+# LOG_MODE :
+#   async      (default) the log call only puts the record on a queue , a background thread of the process
+#              writes the records in batches into a rotating file , a forked child process (gunicorn worker ,
+#              ModelSearch worker) writes a file of its own , <log file>_<pid>.log
+#   collector  same queue + thread , but the thread sends the records to one collector process
+#              (python -m src.logger , started by gunicorn.conf.py) which is the only writer of the log file ,
+#              the records go as length prefixed json (not pickle like SocketHandler) , so nothing which
+#              connects to the collector can make it run code
+#   sync       the old behaviour , every log call writes and flushes the file itself
+LOG_FILE  = os.environ.get('LOG_FILE', f"{datetime.now().strftime('%m_%d_%Y_%H_%M_%S')}.log")
+LOG_FORMAT = '[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-LOG_FILE_PATH = os.path.join(logs_path,LOG_FILE)
 
-logging.basicConfig(
-    filename = LOG_FILE_PATH,
-    format = '[%(asctime)s] %(lineno)d %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    datefmt='%Y-%m-%d %H:%M:%S',
-    
-)
+@dataclass
+class LoggerConfig:
+    mode: str = os.environ.get('LOG_MODE', 'async')
+    log_dir: str = os.environ.get('LOG_DIR', os.path.join(os.getcwd(), "logs", LOG_FILE))
+    log_file: str = LOG_FILE
+    # LOG_JSON=1 writes one json object per line instead of the text format
+    json_format: bool = os.environ.get('LOG_JSON', '0') == '1'
+    # size based rotation , or time based when LOG_ROTATE_WHEN is set (e.g. midnight , H)
+    max_bytes: int = int(os.environ.get('LOG_MAX_BYTES', 10 * 2 ** 20))
+    backup_count: int = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    rotate_when: str = os.environ.get('LOG_ROTATE_WHEN')
+    # records waiting for the writer thread , when the queue is full new records are dropped (and counted)
+    queue_size: int = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # the file is flushed once per batch , at the latest after flush_interval seconds
+    batch_size: int = int(os.environ.get('LOG_BATCH_SIZE', 256))
+    flush_interval: float = float(os.environ.get('LOG_FLUSH_INTERVAL', 1.0))
+    # host:port of the collector process (collector mode)
+    collector_address: str = os.environ.get('LOG_COLLECTOR_ADDRESS', '127.0.0.1:9020')
 
-# for testing purposes
-# if __name__ == "__main__":
-#     logging.info("Logging has been set up successfully")
\ No newline at end of file
+    @property
+    def log_file_path(self):
+        return os.path.join(self.log_dir, self.log_file)
+
+
+class JsonFormatter(logging.Formatter):
+    # one json object per line , for log shippers
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, LOG_DATE_FORMAT),
+            'level': record.levelname,
+            'name': record.name,
+            'lineno': record.lineno,
+            'pid': record.process,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # formatted already by the process which sent the record to the collector
+            entry['exception'] = record.exc_text
+        return json.dumps(entry)
+
+
+class _BatchFlushMixin:
+    # StreamHandler.emit flushes the file after every record , here the writer thread flushes once per batch
+    # the directory is created on the first write , so importing the logger does not create it
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.flush()
+        finally:
+            self.release()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class BatchedRotatingFileHandler(_BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class BatchedTimedRotatingFileHandler(_BatchFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # never blocks the caller , a full queue drops the record
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # cheaper than QueueHandler.prepare (no formatting and no copy on the caller thread) , only the
+        # arguments are merged into the message now , the writer thread formats the rest
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    # writer thread : takes the records from the queue in batches and flushes the handlers once per batch
+    _STOP = object()
+
+    def __init__(self, record_queue, handlers, batch_size=256, flush_interval=1.0):
+        self.queue = record_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # writes everything which is still in the queue
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(self._STOP)
+            self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            for record in batch:
+                if record is self._STOP:
+                    stop = True
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                if hasattr(handler, 'flush_batch'):
+                    handler.flush_batch()
+                else:
+                    handler.flush()
+            if stop:
+                return
+
+
+class JsonSocketHandler(logging.handlers.SocketHandler):
+    # the frames of SocketHandler (4 byte length + payload) with the record dict as json instead of pickle
+    def makePickle(self, record):
+        entry = dict(record.__dict__)
+        entry['msg'] = record.getMessage()
+        entry['args'] = None
+        if record.exc_info:
+            # the traceback can not be sent , its text can
+            entry['exc_text'] = record.exc_text or logging.Formatter().formatException(record.exc_info)
+        entry['exc_info'] = None
+        # extra fields which are not json types are sent as their str
+        data = json.dumps(entry, default=str).encode('utf-8')
+        return struct.pack('>L', len(data)) + data
+
+
+def _formatter(config):
+    return JsonFormatter() if config.json_format else logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
+
+
+def file_handler(config):
+    if config.rotate_when:
+        handler = BatchedTimedRotatingFileHandler(config.log_file_path, when=config.rotate_when,
+                                                  backupCount=config.backup_count, delay=True)
+    else:
+        handler = BatchedRotatingFileHandler(config.log_file_path, maxBytes=config.max_bytes,
+                                             backupCount=config.backup_count, delay=True)
+    handler.setFormatter(_formatter(config))
+    return handler
+
+
+def _collector_host_port(config):
+    host, port = config.collector_address.rsplit(':', 1)
+    return host, int(port)
+
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(config: LoggerConfig = None):
+    """
+    Configure the root logger for the given mode , called once on import.
+    """
+    global _listener, _queue_handler
+    config = config or LoggerConfig()
+    root = logging.getLogger()
+    if config.mode == 'sync':
+        os.makedirs(config.log_dir, exist_ok=True)
+        logging.basicConfig(filename=config.log_file_path, format=LOG_FORMAT, level=logging.INFO, datefmt=LOG_DATE_FORMAT)
+        return
+
+    if config.mode == 'collector':
+        target = JsonSocketHandler(*_collector_host_port(config))
+    else:
+        target = file_handler(config)
+    record_queue = queue.Queue(maxsize=config.queue_size)
+    _queue_handler = DroppingQueueHandler(record_queue)
+    _listener = BatchingQueueListener(record_queue, [target], config.batch_size, config.flush_interval)
+    _listener.start()
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.INFO)
+
+    def flush_before_fork():
+        # the child gets a copy of the buffered stream , it is flushed and the writer thread is held off until
+        # the fork is done , so the child never writes the records of the parent a second time
+        if isinstance(target, logging.FileHandler):
+            target.acquire()
+            if target.stream is not None:
+                target.stream.flush()
+
+    def release_after_fork():
+        if isinstance(target, logging.FileHandler):
+            target.release()
+
+    def restart_after_fork():
+        # the writer thread does not survive a fork (gunicorn --preload , the ModelSearch pool) , every child
+        # gets a fresh queue and thread
+        global _listener
+        nonlocal target
+        if isinstance(target, logging.handlers.SocketHandler) and target.sock is not None:
+            # the connection of the parent (preloading gunicorn master) must not be shared , the records of
+            # several processes would interleave on it , closing only drops the copy of this process
+            target.sock.close()
+            target.sock = None
+        if isinstance(target, logging.FileHandler):
+            # two processes must not rotate the same file , every child writes <log file>_<pid> of its own
+            # (the collector mode keeps one file for all of them) , the copy of the parent's file is closed
+            target.close()
+            stem, extension = os.path.splitext(config.log_file)
+            target = file_handler(dataclasses.replace(config, log_file=f"{stem}_{os.getpid()}{extension}"))
+        fresh_queue = queue.Queue(maxsize=config.queue_size)
+        _queue_handler.queue = fresh_queue
+        _listener = BatchingQueueListener(fresh_queue, [target], config.batch_size, config.flush_interval)
+        _listener.start()
+
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(before=flush_before_fork, after_in_parent=release_after_fork,
+                            after_in_child=restart_after_fork)
+    atexit.register(lambda: _listener.stop())
+
+
+def dropped_records():
+    # records which were dropped because the queue was full
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+# a larger frame is not a log record , the connection is closed
+MAX_FRAME_BYTES = 16 * 2 ** 20
+
+
+class _LogRecordStreamHandler(socketserver.StreamRequestHandler):
+    # length prefixed json LogRecord dicts of JsonSocketHandler
+    def handle(self):
+        while True:
+            header = self._receive(4)
+            if header is None:
+                return
+            length = struct.unpack('>L', header)[0]
+            if length > MAX_FRAME_BYTES:
+                return
+            data = self._receive(length)
+            if data is None:
+                return
+            try:
+                entry = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(entry, dict):
+                self.server.record_queue.put(logging.makeLogRecord(entry))
+
+    def _receive(self, length):
+        # recv can return less than asked for (also for the 4 byte header) , None when the sender is gone
+        data = b''
+        while len(data) < length:
+            chunk = self.connection.recv(length - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+class _CollectorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve_collector(config: LoggerConfig = None):
+    """
+    Collector process of the collector mode : receives the records of all the workers and is the only
+    writer of the (rotating) log file. It only listens on localhost by default.
+    """
+    config = config or LoggerConfig()
+    record_queue = queue.Queue()
+    listener = BatchingQueueListener(record_queue, [file_handler(config)], config.batch_size, config.flush_interval)
+    listener.start()
+    server = _CollectorServer(_collector_host_port(config), _LogRecordStreamHandler)
+    server.record_queue = record_queue
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        listener.stop()
+
+
+LOG_FILE_PATH = LoggerConfig().log_file_path
+
+# python -m src.logger runs the collector of the collector mode (it is a writer itself , so no setup_logging there)
+if __name__ == "__main__":
+    serve_collector()
+else:
+    setup_logging()
@@ -0,0 +1,237 @@
+# pluggable serializer for the trained model
+# dill pickles the whole python object , loading it is slow and can not be memory mapped ,
+# so the model is saved in the native format of its library where there is one :
+#   xgboost_ubj / xgboost_json   XGBModel.save_model (universal binary json / json) , no pickle at all
+#   catboost_cbm                 CatBoost.save_model in the .cbm format , no pickle at all
+#   joblib                       the sklearn estimators , the numpy arrays are stored raw and loaded with mmap_mode
+#   dill                         fallback for the objects which joblib can not pickle (lambdas , closures)
+# joblib is pickle too , loading a joblib or dill file runs code from it , so only load model files you trust
+# every save writes <model>.manifest.json next to the payload (format , class , sha256 , size , library versions) ,
+# the manifest is written last and is what the registry watches , a plain model.pkl without a manifest is
+# still loaded with dill (artifacts of the older trainer) , it is tracked in git and never deleted here
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import importlib
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import load_object
+
+# format -> file extension of the payload
+SERIALIZER_FORMATS = {'xgboost_ubj': '.ubj',
+                      'xgboost_json': '.json',
+                      'catboost_cbm': '.cbm',
+                      'joblib': '.joblib',
+                      'dill': '.pkl'}
+# the native formats rebuild the model class named in the manifest , only classes of this library are accepted
+NATIVE_FORMAT_MODULES = {'xgboost_ubj': 'xgboost', 'xgboost_json': 'xgboost', 'catboost_cbm': 'catboost'}
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+@dataclass
+class ModelSerializerConfig:
+    # 'auto' = native format of xgboost / catboost , joblib for the rest (dill if joblib fails) ,
+    # or one of SERIALIZER_FORMATS for every model
+    serializer: str = os.environ.get('MODEL_SERIALIZER', 'auto')
+    # joblib loads the numpy arrays of the model memory mapped ('' loads them into memory)
+    mmap_mode: str = os.environ.get('MODEL_MMAP_MODE', 'r')
+    # compare the sha256 of the payload with the manifest before loading it
+    verify_checksum: bool = os.environ.get('MODEL_VERIFY_CHECKSUM', '1') != '0'
+
+
+def manifest_path_of(model_path):
+    # artifacts/model.pkl -> artifacts/model.manifest.json
+    if model_path.endswith(MANIFEST_SUFFIX):
+        return model_path
+    return os.path.splitext(model_path)[0] + MANIFEST_SUFFIX
+
+
+def resolve_model_path(model_path):
+    """
+    The file which identifies the saved model : its manifest when there is one , else the (dill) model file itself.
+    The registry stamps and fingerprints this file.
+    """
+    manifest_path = manifest_path_of(model_path)
+    return manifest_path if os.path.exists(manifest_path) else model_path
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_obj:
+        for block in iter(lambda: file_obj.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def class_path(model):
+    model_class = type(model)
+    return f"{model_class.__module__}.{model_class.__qualname__}"
+
+
+def choose_format(model):
+    # by the module of the class , so xgboost / catboost are not imported for a sklearn model
+    module = type(model).__module__.split('.')[0]
+    if module == 'xgboost' and hasattr(model, 'save_model'):
+        return 'xgboost_ubj'
+    if module == 'catboost' and hasattr(model, 'save_model'):
+        return 'catboost_cbm'
+    return 'joblib'
+
+
+def library_versions(serializer):
+    # versions of the libraries which the payload depends on , a mismatch on load is logged
+    from importlib.metadata import version, PackageNotFoundError
+    names = ['numpy', 'scikit-learn']
+    names += {'xgboost_ubj': ['xgboost'], 'xgboost_json': ['xgboost'], 'catboost_cbm': ['catboost'],
+              'joblib': ['joblib'], 'dill': ['dill']}[serializer]
+    versions = {}
+    for name in names:
+        try:
+            versions[name] = version(name)
+        except PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def _write_payload(model, serializer, tmp_file_path):
+    if serializer in ('xgboost_ubj', 'xgboost_json'):
+        # xgboost picks the format from the extension of the file name
+        model.save_model(tmp_file_path)
+    elif serializer == 'catboost_cbm':
+        model.save_model(tmp_file_path, format='cbm')
+    elif serializer == 'joblib':
+        import joblib
+        # uncompressed , a compressed file can not be memory mapped
+        joblib.dump(model, tmp_file_path)
+    else:
+        import dill
+        with open(tmp_file_path, 'wb') as file_obj:
+            dill.dump(model, file_obj)
+
+
+def save_model(model, model_path, config: ModelSerializerConfig = None):
+    """
+    Save the model next to model_path in the configured format and write its manifest.
+    Returns the manifest.
+    """
+    try:
+        config = config or ModelSerializerConfig()
+        serializer = choose_format(model) if config.serializer == 'auto' else config.serializer
+        if serializer not in SERIALIZER_FORMATS:
+            raise ValueError(f"Unknown model serializer {serializer} , use one of {list(SERIALIZER_FORMATS)}")
+        if serializer in NATIVE_FORMAT_MODULES and \
+                type(model).__module__.split('.')[0] != NATIVE_FORMAT_MODULES[serializer]:
+            raise ValueError(f"{serializer} can not save a {class_path(model)}")
+
+        dir_path = os.path.dirname(model_path) or '.'
+        os.makedirs(dir_path, exist_ok=True)
+        manifest_path = manifest_path_of(model_path)
+        stem = manifest_path[:-len(MANIFEST_SUFFIX)]
+        previous_payload = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file_obj:
+                previous_payload = os.path.join(dir_path, json.load(file_obj)['file'])
+
+        started = time.perf_counter()
+        try:
+            payload_path = stem + SERIALIZER_FORMATS[serializer]
+            # the temporary file keeps the extension , xgboost needs it
+            tmp_file_path = f"{stem}.{os.getpid()}.tmp{SERIALIZER_FORMATS[serializer]}"
+            _write_payload(model, serializer, tmp_file_path)
+        except Exception as e:
+            if config.serializer != 'auto' or serializer != 'joblib':
+                raise
+            logging.info(f"joblib can not save {class_path(model)} ({e}) , falling back to dill")
+            if os.path.exists(tmp_file_path):
+                os.remove(tmp_file_path)
+            serializer = 'dill'
+            payload_path = stem + SERIALIZER_FORMATS[serializer]
+            tmp_file_path = f"{stem}.{os.getpid()}.tmp{SERIALIZER_FORMATS[serializer]}"
+            _write_payload(model, serializer, tmp_file_path)
+        os.replace(tmp_file_path, payload_path)
+
+        manifest = {'format': serializer,
+                    'file': os.path.basename(payload_path),
+                    'class': class_path(model),
+                    'sha256': file_sha256(payload_path),
+                    'size_bytes': os.path.getsize(payload_path),
+                    'python': platform.python_version(),
+                    'libraries': library_versions(serializer),
+                    'created_at': time.time()}
+        # the manifest is written last , a reader never sees a manifest of a half written payload
+        tmp_manifest_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest_path, 'w') as file_obj:
+            json.dump(manifest, file_obj, indent=2)
+        os.replace(tmp_manifest_path, manifest_path)
+
+        # the payload of the previous format is not referenced any more , model_path itself (model.pkl of the
+        # older trainer , tracked in git) stays , the manifest takes precedence over it
+        if previous_payload and os.path.abspath(previous_payload) not in \
+                (os.path.abspath(payload_path), os.path.abspath(model_path)) and os.path.exists(previous_payload):
+            os.remove(previous_payload)
+        logging.info(f"Model {manifest['class']} saved as {serializer} ({manifest['size_bytes']} bytes) "
+                     f"in {time.perf_counter() - started:.2f}s")
+        return manifest
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path) as file_obj:
+        return json.load(file_obj)
+
+
+def _native_model_class(manifest):
+    module_name, _, class_name = manifest['class'].rpartition('.')
+    if module_name.split('.')[0] != NATIVE_FORMAT_MODULES[manifest['format']]:
+        raise ValueError(f"{manifest['class']} is not a {manifest['format']} model")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def load_model(model_path, config: ModelSerializerConfig = None):
+    """
+    Load the model saved by save_model (model_path may be the model file or its manifest) ,
+    or a plain dill model.pkl when there is no manifest.
+    """
+    try:
+        config = config or ModelSerializerConfig()
+        manifest_path = resolve_model_path(model_path)
+        if not manifest_path.endswith(MANIFEST_SUFFIX):
+            return load_object(file_path=manifest_path)
+
+        manifest = read_manifest(manifest_path)
+        payload_path = os.path.join(os.path.dirname(manifest_path), manifest['file'])
+        if config.verify_checksum and file_sha256(payload_path) != manifest['sha256']:
+            raise ValueError(f"Checksum of {payload_path} does not match the manifest")
+        installed = library_versions(manifest['format'])
+        for name, saved_version in manifest.get('libraries', {}).items():
+            if installed.get(name) != saved_version:
+                logging.info(f"Model was saved with {name} {saved_version} , loading it with {installed.get(name)}")
+
+        serializer = manifest['format']
+        if serializer in NATIVE_FORMAT_MODULES:
+            model = _native_model_class(manifest)()
+            if serializer == 'catboost_cbm':
+                model.load_model(payload_path, format='cbm')
+            else:
+                model.load_model(payload_path)
+            return model
+        if serializer == 'joblib':
+            import joblib
+            return joblib.load(payload_path, mmap_mode=config.mmap_mode or None)
+        if serializer == 'dill':
+            return load_object(file_path=payload_path)
+        raise ValueError(f"Unknown model format {serializer} in {manifest_path}")
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+if __name__ == "__main__":
+    # convert the current model to the configured format , e.g. MODEL_SERIALIZER=auto python -m src.model_serializer
+    model_path = os.path.join('artifacts', 'model.pkl')
+    print(json.dumps(save_model(load_model(model_path), model_path), indent=2))
@@ -0,0 +1,171 @@
+# request handling of the prediction api , shared by the flask apps (app.py , application.py) and asgi.py
+# the handlers get the raw request (body bytes , form fields) and return an ApiResponse , a front end only
+# turns it into its own response object , so both servers parse , validate and answer the same way
+# the CPU bound part (predict_*) is separate from the parsing , the ASGI app runs it in its thread pool
+import os
+import json
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.predict_pipeline import InvalidRecord, parse_batch_records
+from src.pipeline.metrics import metrics, STAGE_METRIC
+
+# upper limit of the records in one /api/predict/batch request
+MAX_BATCH_SIZE = int(os.environ.get('PREDICT_MAX_BATCH_SIZE', 100000))
+# race_ethnicity is called ethnicity in the json api
+REQUIRED_FIELDS = ['gender', 'ethnicity', 'parental_level_of_education',
+                   'lunch', 'test_preparation_course', 'reading_score', 'writing_score']
+# the fields of the html form
+FORM_FIELDS = ['gender', 'race_ethnicity', 'parental_level_of_education', 'lunch', 'test_preparation_course',
+               'reading_score', 'writing_score']
+
+
+@dataclass(frozen=True)
+class ApiResponse:
+    status: int
+    payload: dict
+    mode: str = 'single'        # 'single' or 'batch' , the mode of the serialize stage timing
+    error_class: str = None     # class of a 5xx answer for http_request_errors_total
+
+
+def ok(payload, mode='single'):
+    return ApiResponse(200, payload, mode)
+
+
+def error(status, message, mode='single', error_class=None):
+    return ApiResponse(status, {'success': False, 'error': message}, mode, error_class)
+
+
+def parse_predict_request(body):
+    """
+    Parse and validate the body of /api/predict.
+    Returns (record , None) , or (None , ApiResponse of the 400) when the body is not a valid record.
+    """
+    try:
+        with metrics.time(STAGE_METRIC, stage='parse', mode='single'):
+            data = json.loads(body)
+    except ValueError:
+        return None, error(400, 'Invalid JSON body')
+    if not isinstance(data, dict):
+        return None, error(400, 'Record must be a JSON object')
+    for field in REQUIRED_FIELDS:
+        if data.get(field) is None:
+            return None, error(400, f'Missing required field: {field}')
+    try:
+        reading_score = float(data['reading_score'])
+        writing_score = float(data['writing_score'])
+    except (TypeError, ValueError):
+        return None, error(400, 'Invalid score values')
+    if not (0 <= reading_score <= 100) or not (0 <= writing_score <= 100):
+        return None, error(400, 'Scores must be between 0 and 100')
+    return dict(data, reading_score=reading_score, writing_score=writing_score), None
+
+
+def predict_single(predict_pipeline, record, micro_batcher=None):
+    # prediction of one record of parse_predict_request
+    try:
+        if micro_batcher is not None and micro_batcher.enabled:
+            # concurrent requests are predicted together in one batch
+            result = micro_batcher.predict(record)
+            if not result['success']:
+                return error(400, result['error'])
+            prediction = result['prediction']
+        else:
+            # single record goes through the compiled preprocessor without building a DataFrame
+            prediction = round(float(predict_pipeline.predict_record(record)), 1)
+        return ok({'success': True, 'prediction': prediction, 'message': 'Prediction completed successfully'})
+    except InvalidRecord as e:
+        # unknown categorical value , the same check as the batch validation
+        return error(400, str(e))
+    except CustomException as e:
+        logging.info(f"Custom API prediction error: {e}")
+        return error(500, 'Model prediction error', error_class='CustomException')
+    except Exception as e:
+        logging.info(f"API prediction error: {e}")
+        return error(500, 'Internal server error', error_class=type(e).__name__)
+
+
+def parse_batch_request(body, content_type=''):
+    """
+    Parse the body of /api/predict/batch , a JSON array of records or NDJSON.
+    Returns (records , None) , or (None , ApiResponse of the 400 / 413).
+    """
+    try:
+        with metrics.time(STAGE_METRIC, stage='parse', mode='batch'):
+            records = parse_batch_records(body, content_type)
+    except ValueError:
+        return None, error(400, 'Body must be a JSON array or NDJSON', 'batch')
+    if not records:
+        return None, error(400, 'No records to predict', 'batch')
+    if len(records) > MAX_BATCH_SIZE:
+        return None, error(413, f'Batch is larger than {MAX_BATCH_SIZE} records', 'batch')
+    return records, None
+
+
+def predict_batch(predict_pipeline, records):
+    # invalid records get an error in their result , they do not fail the request
+    try:
+        results = predict_pipeline.predict_batch(records)
+        failed = sum(1 for result in results if not result['success'])
+        return ok({'success': True, 'model_version': predict_pipeline.model_version,
+                   'count': len(results), 'failed': failed, 'results': results}, 'batch')
+    except CustomException as e:
+        logging.info(f"Custom API batch prediction error: {e}")
+        return error(500, 'Model prediction error', 'batch', 'CustomException')
+    except Exception as e:
+        logging.info(f"API batch prediction error: {e}")
+        return error(500, 'Internal server error', 'batch', type(e).__name__)
+
+
+def parse_form(form):
+    """
+    Validate the fields of the html form (dict like).
+    Returns (record , None) , or (None , message for the page).
+    """
+    record = {field: form.get(field) for field in FORM_FIELDS}
+    if not all(record.values()):
+        return None, "Please Fill In All  Fields"
+    try:
+        record['reading_score'] = float(record['reading_score'])
+        record['writing_score'] = float(record['writing_score'])
+    except ValueError:
+        return None, "Invalid Input Values"
+    if not (0 <= record['reading_score'] <= 100) or not (0 <= record['writing_score'] <= 100):
+        return None, "Score must be Between 0 To 100."
+    return record, None
+
+
+def predict_form(predict_pipeline, record):
+    """
+    Prediction for the html page , returns (results , error , error class of a failed prediction).
+    """
+    try:
+        return round(float(predict_pipeline.predict_record(record)), 1), False, None
+    except InvalidRecord as e:
+        return str(e), True, None
+    except Exception as e:
+        logging.info(f"Prediction error {e}")
+        return "Error Occurred during prediction", True, type(e).__name__
+
+
+def liveness():
+    # the process answers , nothing is loaded for this
+    return ok({'status': 'alive', 'pid': os.getpid()})
+
+
+def readiness(registry):
+    # ready once the model and the preprocessor are loaded , 503 while they are still loading
+    if registry.is_loaded:
+        return ok({'status': 'ready', 'model_version': registry.version})
+    registry.warm_up()
+    return ApiResponse(503, {'status': 'loading', 'error': registry.last_error})
+
+
+def health(predict_pipeline):
+    # the first call loads model and preprocessor
+    try:
+        predict_pipeline.registry.get()
+        return ok({'status': 'healthy', 'pipeline_loaded': True, 'model_version': predict_pipeline.model_version})
+    except Exception as e:
+        return ApiResponse(500, {'status': 'unhealthy', 'error': str(e), 'pipeline_loaded': False})
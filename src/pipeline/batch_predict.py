@@ -0,0 +1,195 @@
+# offline bulk scoring of a csv / parquet file with the saved model.pkl and preprocessor.pkl
+# python -m src.pipeline.batch_predict input.csv predictions.csv --workers 4 --chunksize 50000 [--resume]
+# the input is streamed chunk by chunk , chunks are predicted in a process pool (artifacts are loaded once
+# per worker) and the predictions are appended to the output in order , a progress file next to the output
+# remembers how far we are , so --resume continues after a crash without predicting anything twice
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+from src.pipeline.predict_pipeline import PredictPipeline
+
+
+@dataclass
+class BatchPredictConfig:
+    input_path: str
+    output_path: str
+    model_path: str = os.path.join('artifacts', 'model.pkl')
+    preprocessor_path: str = os.path.join('artifacts', 'preprocessor.pkl')
+    chunksize: int = 50000
+    workers: int = os.cpu_count() or 1
+    resume: bool = False
+
+
+# pipeline of the worker process , loaded once by the pool initializer
+_worker_pipeline = None
+
+
+def _init_worker(model_path, preprocessor_path):
+    global _worker_pipeline
+    # a batch run always uses the version it started with , so the files are never checked again
+    registry = ModelRegistry(ModelRegistryConfig(model_path=model_path,
+                                                 preprocessor_path=preprocessor_path,
+                                                 check_interval=float('inf')))
+    registry.get()
+    _worker_pipeline = PredictPipeline(registry)
+
+
+def _predict_chunk(chunk_index, first_row, chunk):
+    predictions, errors = _worker_pipeline.predict_frame(chunk)
+    result = pd.DataFrame({'row': range(first_row, first_row + len(chunk)),
+                           'prediction': predictions.round(1),
+                           'error': errors.to_numpy()})
+    return chunk_index, result
+
+
+def read_chunks(input_path, chunksize, skip_rows=0):
+    # (first row number , DataFrame) of every chunk after the first skip_rows rows
+    extension = os.path.splitext(input_path)[1]
+    if extension == '.parquet':
+        import pyarrow.parquet as pq
+        position = 0
+        for batch in pq.ParquetFile(input_path).iter_batches(batch_size=chunksize):
+            if position + batch.num_rows <= skip_rows:
+                position += batch.num_rows
+                continue
+            if not batch.num_rows:
+                continue
+            chunk = batch.to_pandas()
+            if position < skip_rows:
+                chunk = chunk.iloc[skip_rows - position:]
+                position = skip_rows
+            yield position, chunk
+            position += len(chunk)
+        return
+    # csv , the already scored rows are skipped without parsing them into a DataFrame
+    reader = pd.read_csv(input_path, chunksize=chunksize, skiprows=range(1, skip_rows + 1))
+    position = skip_rows
+    for chunk in reader:
+        # a finished run which is resumed gets one empty chunk
+        if not len(chunk):
+            continue
+        yield position, chunk
+        position += len(chunk)
+
+
+class BatchPredictor:
+    def __init__(self, config: BatchPredictConfig):
+        self.batch_config = config
+        self.progress_path = f"{config.output_path}.progress.json"
+
+    def _load_progress(self, model_version):
+        fresh = {'input_path': os.path.abspath(self.batch_config.input_path),
+                 'model_version': model_version,
+                 'rows_done': 0,
+                 'output_bytes': 0}
+        if not self.batch_config.resume or not os.path.exists(self.progress_path):
+            return fresh
+        with open(self.progress_path) as file_obj:
+            progress = json.load(file_obj)
+        if progress['input_path'] != fresh['input_path']:
+            raise ValueError(f"{self.progress_path} belongs to another input: {progress['input_path']}")
+        if progress['model_version'] != model_version:
+            raise ValueError(f"Output was started with model version {progress['model_version']} , "
+                             f"the artifacts are version {model_version} now")
+        output_path = self.batch_config.output_path
+        if not os.path.exists(output_path) or os.path.getsize(output_path) < progress['output_bytes']:
+            # the rows of the progress file are not in the output any more , it is scored from the start
+            logging.info(f"{output_path} is missing or shorter than {self.progress_path} says , starting over")
+            return fresh
+        return progress
+
+    def _save_progress(self, progress):
+        tmp_path = f"{self.progress_path}.tmp"
+        with open(tmp_path, 'w') as file_obj:
+            json.dump(progress, file_obj, indent=2)
+        os.replace(tmp_path, self.progress_path)
+
+    def run(self):
+        """
+        Score the whole input , returns a summary dict with the rows and rows per second.
+        """
+        try:
+            config = self.batch_config
+            model_version = ModelRegistry(ModelRegistryConfig(model_path=config.model_path,
+                                                              preprocessor_path=config.preprocessor_path)).get().version
+            progress = self._load_progress(model_version)
+            os.makedirs(os.path.dirname(os.path.abspath(config.output_path)), exist_ok=True)
+
+            # rows written after the last saved progress (crash in between) are cut off and predicted again
+            mode = 'r+b' if progress['rows_done'] and os.path.exists(config.output_path) else 'wb'
+            output = open(config.output_path, mode)
+            output.truncate(progress['output_bytes'])
+            output.seek(progress['output_bytes'])
+
+            started = time.perf_counter()
+            rows_scored, failed_rows = 0, 0
+            max_in_flight = 2 * config.workers
+            with output, ProcessPoolExecutor(max_workers=config.workers,
+                                             initializer=_init_worker,
+                                             initargs=(config.model_path, config.preprocessor_path)) as executor:
+                in_flight = deque()
+                chunks = read_chunks(config.input_path, config.chunksize, progress['rows_done'])
+
+                def write_next():
+                    nonlocal rows_scored, failed_rows
+                    _, result = in_flight.popleft().result()
+                    result.to_csv(output, index=False, header=output.tell() == 0)
+                    output.flush()
+                    os.fsync(output.fileno())
+                    rows_scored += len(result)
+                    failed_rows += int(result['error'].notna().sum())
+                    progress['rows_done'] = int(result['row'].iloc[-1]) + 1
+                    progress['output_bytes'] = output.tell()
+                    self._save_progress(progress)
+                    elapsed = time.perf_counter() - started
+                    logging.info(f"Batch predict: {progress['rows_done']} rows done , {rows_scored / elapsed:.0f} rows/sec")
+
+                for chunk_index, (first_row, chunk) in enumerate(chunks):
+                    # bounded number of chunks in memory , results are written in input order
+                    in_flight.append(executor.submit(_predict_chunk, chunk_index, first_row, chunk))
+                    if len(in_flight) >= max_in_flight:
+                        write_next()
+                while in_flight:
+                    write_next()
+
+            elapsed = time.perf_counter() - started
+            return {'rows': rows_scored,
+                    'failed_rows': failed_rows,
+                    'total_rows': progress['rows_done'],
+                    'seconds': elapsed,
+                    'rows_per_second': rows_scored / elapsed if elapsed else 0.0,
+                    'model_version': model_version}
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a csv / parquet file with the saved model")
+    parser.add_argument('input_path')
+    parser.add_argument('output_path')
+    parser.add_argument('--model-path', default=os.path.join('artifacts', 'model.pkl'))
+    parser.add_argument('--preprocessor-path', default=os.path.join('artifacts', 'preprocessor.pkl'))
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted run of the same input")
+    args = parser.parse_args(argv)
+
+    summary = BatchPredictor(BatchPredictConfig(**vars(args))).run()
+    print(f"Scored {summary['rows']} rows ({summary['failed_rows']} invalid) in {summary['seconds']:.1f}s , "
+          f"{summary['rows_per_second']:.0f} rows/sec with model version {summary['model_version']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+# "compiled" version of the fitted ColumnTransformer from data_transformation.py
+# all the fitted values (medians , means , scales , one hot categories) are read once from preprocessor.pkl
+# and kept as flat numpy vectors + category -> column index tables , so one record (a plain dict)
+# goes straight to the feature vector without building a DataFrame and without walking the sklearn pipelines
+import sys
+
+import numpy as np
+
+from src.exception import CustomException
+
+
+class CompiledPreprocessor:
+    def __init__(self,
+                 n_features,
+                 numerical_columns, numerical_offset, fill_values, means, inverse_scales,
+                 categorical_columns, categorical_fill_values, category_index, one_hot_values):
+        self.n_features = n_features
+        # numerical block : impute -> (x - mean) * (1 / scale) , written at numerical_offset
+        self.numerical_columns = list(numerical_columns)
+        self.numerical_offset = numerical_offset
+        self.fill_values = np.asarray(fill_values, dtype=float)
+        self.means = np.asarray(means, dtype=float)
+        self.inverse_scales = np.asarray(inverse_scales, dtype=float)
+        # categorical block : for every column a dict category -> output column index
+        self.categorical_columns = list(categorical_columns)
+        self.categorical_fill_values = list(categorical_fill_values)
+        self.category_index = [dict(table) for table in category_index]
+        # value written at the one hot column , it is 1 / scale of the StandardScaler(with_mean=False)
+        self.one_hot_values = np.asarray(one_hot_values, dtype=float)
+
+    @property
+    def columns(self):
+        return self.numerical_columns + self.categorical_columns
+
+    def transform_record(self, record):
+        """
+        Map one record (dict of column -> value) to a (1, n_features) feature array.
+        """
+        features = np.zeros((1, self.n_features))
+        row = features[0]
+
+        numbers = np.array([_to_float(record.get(column)) for column in self.numerical_columns])
+        missing = np.isnan(numbers)
+        if missing.any():
+            numbers[missing] = self.fill_values[missing]
+        end = self.numerical_offset + len(self.numerical_columns)
+        row[self.numerical_offset:end] = (numbers - self.means) * self.inverse_scales
+
+        for column, fill_value, table in zip(self.categorical_columns, self.categorical_fill_values, self.category_index):
+            value = record.get(column)
+            # SimpleImputer only sees NaN as missing in object columns , None ends up as an unknown category
+            if _is_nan(value):
+                value = fill_value
+            index = table.get(str(value))
+            # unknown category -> all zeros , same as OneHotEncoder(handle_unknown='ignore') , the predict
+            # pipeline rejects such records before they get here (check_categories)
+            if index is not None:
+                row[index] = self.one_hot_values[index]
+        return features
+
+    def transform(self, features):
+        """
+        Vectorized transform of a DataFrame , same output as ColumnTransformer.transform.
+        """
+        features_out = np.zeros((len(features), self.n_features))
+        numbers = features[self.numerical_columns].to_numpy(dtype=float, na_value=np.nan)
+        numbers = np.where(np.isnan(numbers), self.fill_values, numbers)
+        end = self.numerical_offset + len(self.numerical_columns)
+        features_out[:, self.numerical_offset:end] = (numbers - self.means) * self.inverse_scales
+
+        rows = np.arange(len(features))
+        for column, fill_value, table in zip(self.categorical_columns, self.categorical_fill_values, self.category_index):
+            values = features[column].to_numpy(dtype=object)
+            values = np.where(values != values, fill_value, values)    # only NaN is missing , like the imputer
+            indexes = np.array([table.get(str(value), np.nan) for value in values], dtype=float)
+            known = ~np.isnan(indexes)
+            indexes = indexes[known].astype(np.intp)
+            features_out[rows[known], indexes] = self.one_hot_values[indexes]
+        return features_out
+
+    @classmethod
+    def from_column_transformer(cls, preprocessor):
+        """
+        Read the fitted values out of the ColumnTransformer built by DataTransformation.
+        Raises ValueError when the transformer has a step or a setting which is not supported.
+        """
+        numerical, categorical = None, None
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == 'drop' or len(columns) == 0:
+                continue
+            if transformer == 'passthrough':
+                raise ValueError(f"Passthrough columns are not supported ({name})")
+            steps = dict((type(step).__name__, step) for _, step in transformer.steps)
+            if 'OneHotEncoder' in steps:
+                if categorical is not None:
+                    raise ValueError("Only one categorical pipeline is supported")
+                categorical = _compile_categorical(steps, columns, offset)
+                offset += categorical['width']
+            else:
+                if numerical is not None:
+                    raise ValueError("Only one numerical pipeline is supported")
+                numerical = _compile_numerical(steps, columns, offset)
+                offset += len(columns)
+        if numerical is None or categorical is None:
+            raise ValueError("Expected one numerical and one categorical pipeline")
+
+        return cls(n_features=offset,
+                   numerical_columns=numerical['columns'],
+                   numerical_offset=numerical['offset'],
+                   fill_values=numerical['fill_values'],
+                   means=numerical['means'],
+                   inverse_scales=numerical['inverse_scales'],
+                   categorical_columns=categorical['columns'],
+                   categorical_fill_values=categorical['fill_values'],
+                   category_index=categorical['category_index'],
+                   one_hot_values=np.concatenate([np.zeros(categorical['offset']), categorical['values']]))
+
+
+def _to_float(value):
+    if _is_missing(value):
+        return np.nan
+    return float(value)
+
+
+def _is_missing(value):
+    return value is None or _is_nan(value)
+
+
+def _is_nan(value):
+    return isinstance(value, float) and value != value
+
+
+def _check_steps(steps, allowed):
+    unknown = set(steps) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unsupported preprocessing steps: {sorted(unknown)}")
+
+
+def _compile_numerical(steps, columns, offset):
+    _check_steps(steps, ['SimpleImputer', 'StandardScaler'])
+    n_columns = len(columns)
+    fill_values = np.full(n_columns, np.nan)
+    if 'SimpleImputer' in steps:
+        fill_values = np.asarray(steps['SimpleImputer'].statistics_, dtype=float)
+    means = np.zeros(n_columns)
+    inverse_scales = np.ones(n_columns)
+    if 'StandardScaler' in steps:
+        scaler = steps['StandardScaler']
+        if scaler.mean_ is not None and scaler.with_mean:
+            means = np.asarray(scaler.mean_, dtype=float)
+        if scaler.scale_ is not None:
+            inverse_scales = 1.0 / np.asarray(scaler.scale_, dtype=float)
+    return {'columns': list(columns), 'offset': offset, 'fill_values': fill_values,
+            'means': means, 'inverse_scales': inverse_scales}
+
+
+def _compile_categorical(steps, columns, offset):
+    _check_steps(steps, ['SimpleImputer', 'OneHotEncoder', 'StandardScaler'])
+    encoder = steps['OneHotEncoder']
+    if encoder.drop is not None or getattr(encoder, '_infrequent_enabled', False):
+        raise ValueError("OneHotEncoder with drop or infrequent categories is not supported")
+    if encoder.handle_unknown != 'ignore':
+        raise ValueError("Only OneHotEncoder(handle_unknown='ignore') is supported")
+
+    fill_values = [None] * len(columns)
+    if 'SimpleImputer' in steps:
+        fill_values = list(steps['SimpleImputer'].statistics_)
+
+    category_index = []
+    position = offset
+    for categories in encoder.categories_:
+        category_index.append({str(category): position + i for i, category in enumerate(categories)})
+        position += len(categories)
+    width = position - offset
+
+    values = np.ones(width)
+    if 'StandardScaler' in steps:
+        scaler = steps['StandardScaler']
+        if scaler.with_mean:
+            raise ValueError("StandardScaler(with_mean=True) after OneHotEncoder is not supported")
+        if scaler.scale_ is not None:
+            values = 1.0 / np.asarray(scaler.scale_, dtype=float)
+    return {'columns': list(columns), 'offset': offset, 'width': width, 'fill_values': fill_values,
+            'category_index': category_index, 'values': values}
+
+
+def compile_preprocessor(preprocessor):
+    # returns None when the preprocessor can not be compiled , then the caller keeps the sklearn path
+    if isinstance(preprocessor, CompiledPreprocessor):
+        return preprocessor
+    try:
+        return CompiledPreprocessor.from_column_transformer(preprocessor)
+    except Exception:
+        return None
+
+
+def known_categories(preprocessor):
+    """
+    column -> frozenset of the fitted categories (as str) of a compiled , ONNX or sklearn preprocessor.
+    None when they are not known , then the categorical values can not be checked.
+    """
+    if isinstance(preprocessor, CompiledPreprocessor):
+        return {column: frozenset(table) for column, table in zip(preprocessor.categorical_columns,
+                                                                   preprocessor.category_index)}
+    # OnnxPipeline keeps the categories in its manifest
+    categories = getattr(preprocessor, 'categories', None)
+    if categories is not None:
+        return {column: frozenset(values) for column, values in zip(preprocessor.categorical_columns, categories)}
+    known = {}
+    for _, transformer, columns in getattr(preprocessor, 'transformers_', ()):
+        for step in getattr(transformer, 'named_steps', {}).values():
+            if hasattr(step, 'categories_'):
+                known.update((column, frozenset(str(category) for category in values))
+                             for column, values in zip(columns, step.categories_))
+    return known or None
+
+
+def check_parity(preprocessor, features, atol=1e-9):
+    """
+    Compare the compiled transform with ColumnTransformer.transform on a DataFrame,
+    both the vectorized transform and record by record. Raises AssertionError on a mismatch.
+    """
+    try:
+        compiled = CompiledPreprocessor.from_column_transformer(preprocessor)
+        expected = preprocessor.transform(features)
+        if hasattr(expected, 'toarray'):
+            expected = expected.toarray()
+        np.testing.assert_allclose(compiled.transform(features), expected, rtol=0, atol=atol)
+        for position, record in enumerate(features.to_dict(orient='records')):
+            np.testing.assert_allclose(compiled.transform_record(record), expected[position:position + 1],
+                                       rtol=0, atol=atol)
+        return True
+    except AssertionError:
+        raise
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+# parity check against the saved preprocessor (python -m src.pipeline.compiled_preprocessor)
+if __name__ == "__main__":
+    import os
+    import pandas as pd
+    from src.utils import load_object
+
+    preprocessor = load_object(os.path.join('artifacts', 'preprocessor.pkl'))
+    features = pd.concat([pd.read_csv(os.path.join('artifacts', 'train.csv')),
+                          pd.read_csv(os.path.join('artifacts', 'test.csv'))], ignore_index=True)
+    features = features.drop(columns=['math_score'])
+    # edge cases : missing values and a category which was never seen while fitting
+    edge_cases = features.head(4).copy()
+    edge_cases.loc[0, 'reading_score'] = np.nan
+    edge_cases.loc[1, 'gender'] = np.nan
+    edge_cases.loc[2, 'race_ethnicity'] = 'group Z'
+    edge_cases.loc[3, ['writing_score', 'lunch']] = [np.nan, None]
+    features = pd.concat([features, edge_cases], ignore_index=True)
+
+    check_parity(preprocessor, features)
+    print(f"Compiled preprocessor matches sklearn on {len(features)} rows")
@@ -0,0 +1,208 @@
+# the input domain of the model is finite : 2 genders x 5 groups x 6 education levels x 2 lunch x 2 test prep
+# x 101 reading x 101 writing scores (about 2.4M records) , so the whole domain can be predicted once after
+# training and saved as one float32 array indexed by the mixed radix key of the record
+# serving from it is an array lookup (np.load with mmap_mode , the pages are shared by all the workers) ,
+# records outside of the domain (unknown category , missing value , non integer score) still go to the model
+# the manifest keeps the fingerprint of model + preprocessor , a table of another model is never used
+import os
+import sys
+import json
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+
+LOOKUP_TABLE_FILE = 'lookup_table.npy'
+LOOKUP_MANIFEST_FILE = 'lookup_table.json'
+
+
+@dataclass
+class LookupTableConfig:
+    model_path: str = os.path.join('artifacts', 'model.pkl')
+    preprocessor_path: str = os.path.join('artifacts', 'preprocessor.pkl')
+    # integer scores in [score_min , score_max] are materialized
+    score_min: int = 0
+    score_max: int = 100
+    # records predicted in one vectorized transform + predict call
+    batch_rows: int = int(os.environ.get('LOOKUP_TABLE_BATCH_ROWS', 200000))
+
+    @property
+    def table_path(self):
+        return lookup_table_path(os.path.dirname(self.model_path))
+
+    @property
+    def manifest_path(self):
+        return lookup_manifest_path(os.path.dirname(self.model_path))
+
+
+def lookup_table_path(artifacts_dir):
+    return os.path.join(artifacts_dir, LOOKUP_TABLE_FILE)
+
+
+def lookup_manifest_path(artifacts_dir):
+    return os.path.join(artifacts_dir, LOOKUP_MANIFEST_FILE)
+
+
+class LookupTable:
+    def __init__(self, table, manifest):
+        self.table = table                      # (n categories ... , n scores , n scores) float32 memmap
+        self.flat_table = table.reshape(-1)
+        self.manifest = manifest
+        self.version = manifest['version']
+        self.categorical_columns = [column for column, _ in manifest['categories']]
+        # category -> position on its axis
+        self.category_codes = [{category: code for code, category in enumerate(categories)}
+                               for _, categories in manifest['categories']]
+        self.score_columns = list(manifest['score_columns'])
+        self.score_min = manifest['score_min']
+        self.score_max = manifest['score_max']
+
+    def lookup(self, record):
+        """
+        Prediction of one normalized record , None when the record is outside of the materialized domain.
+        """
+        key = []
+        for column, codes in zip(self.categorical_columns, self.category_codes):
+            code = codes.get(str(record.get(column)))
+            if code is None:
+                return None
+            key.append(code)
+        for column in self.score_columns:
+            try:
+                score = float(record.get(column))
+            except (TypeError, ValueError):
+                return None
+            if not score.is_integer() or score < self.score_min or score > self.score_max:
+                return None
+            key.append(int(score) - self.score_min)
+        return float(self.table[tuple(key)])
+
+    def lookup_frame(self, features):
+        """
+        Vectorized lookup of a validated DataFrame.
+        Returns (predictions with NaN outside of the domain , boolean mask of the rows which were found).
+        """
+        found = np.ones(len(features), dtype=bool)
+        keys = []
+        for column, codes in zip(self.categorical_columns, self.category_codes):
+            code = features[column].map(codes).to_numpy(dtype=float)
+            found &= ~np.isnan(code)
+            keys.append(code)
+        for column in self.score_columns:
+            # the frame is validated , the scores are numbers already
+            score = features[column].to_numpy(dtype=float)
+            found &= (score == np.floor(score)) & (score >= self.score_min) & (score <= self.score_max)
+            keys.append(score - self.score_min)
+        keys = [np.where(found, key, 0).astype(np.intp) for key in keys]
+        predictions = np.full(len(features), np.nan)
+        if found.any():
+            flat_index = np.ravel_multi_index(keys, self.table.shape)
+            predictions[found] = self.flat_table[flat_index[found]]
+        return predictions, found
+
+
+def domain_axes(compiled_preprocessor, config: LookupTableConfig):
+    # (categorical axes from the fitted one hot categories , score columns) of the materialized domain
+    if len(compiled_preprocessor.numerical_columns) == 0:
+        raise ValueError("Preprocessor has no score columns")
+    categories = []
+    for column, table in zip(compiled_preprocessor.categorical_columns, compiled_preprocessor.category_index):
+        categories.append([column, [category for category, _ in sorted(table.items(), key=lambda item: item[1])]])
+    return categories, list(compiled_preprocessor.numerical_columns)
+
+
+def materialize_lookup_table(config: LookupTableConfig = None):
+    """
+    Predict the whole input domain with the saved model + preprocessor and write the table and its manifest
+    next to the model. Returns the manifest.
+    """
+    # imported here , the registry imports this module for the serving side
+    import pandas as pd
+    from src.utils import load_object
+    from src.model_serializer import load_model, resolve_model_path
+    from src.pipeline.model_registry import fingerprint_files
+    from src.pipeline.compiled_preprocessor import compile_preprocessor
+    try:
+        config = config or LookupTableConfig()
+        started = time.perf_counter()
+        # same files as the registry fingerprints , so the versions match
+        model_path = resolve_model_path(config.model_path)
+        version = fingerprint_files(model_path, config.preprocessor_path)
+        model = load_model(model_path)
+        preprocessor = load_object(file_path=config.preprocessor_path)
+        compiled = compile_preprocessor(preprocessor)
+        if compiled is None:
+            raise ValueError("Preprocessor can not be compiled , the domain of the lookup table is unknown")
+
+        categories, score_columns = domain_axes(compiled, config)
+        scores = np.arange(config.score_min, config.score_max + 1, dtype=float)
+        shape = tuple(len(values) for _, values in categories) + (len(scores),) * len(score_columns)
+        n_rows = int(np.prod(shape))
+        columns = [column for column, _ in categories] + score_columns
+        axis_values = [np.array(values, dtype=object) for _, values in categories] + [scores] * len(score_columns)
+
+        # written into a temporary file and renamed , like save_object
+        tmp_table_path = f"{config.table_path}.{os.getpid()}.tmp"
+        table = np.lib.format.open_memmap(tmp_table_path, mode='w+', dtype=np.float32, shape=shape)
+        flat_table = table.reshape(-1)
+        for start in range(0, n_rows, config.batch_rows):
+            flat_index = np.arange(start, min(start + config.batch_rows, n_rows))
+            keys = np.unravel_index(flat_index, shape)
+            features = pd.DataFrame({column: values[key] for column, values, key in zip(columns, axis_values, keys)})
+            flat_table[flat_index] = model.predict(compiled.transform(features))
+        table.flush()
+        del table, flat_table
+        os.replace(tmp_table_path, config.table_path)
+
+        manifest = {'version': version,
+                    'model_path': config.model_path,
+                    'preprocessor_path': config.preprocessor_path,
+                    'categories': categories,
+                    'score_columns': score_columns,
+                    'score_min': config.score_min,
+                    'score_max': config.score_max,
+                    'shape': list(shape),
+                    'dtype': 'float32',
+                    'rows': n_rows,
+                    'created_at': time.time()}
+        # the manifest is written last , a table without a matching manifest is never served
+        tmp_manifest_path = f"{config.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest_path, 'w') as file_obj:
+            json.dump(manifest, file_obj, indent=2)
+        os.replace(tmp_manifest_path, config.manifest_path)
+        logging.info(f"Lookup table of {n_rows} records for model {version} written in "
+                     f"{time.perf_counter() - started:.1f}s")
+        return manifest
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def load_lookup_table(artifacts_dir, version):
+    """
+    Memory mapped LookupTable of the given model version , None when there is no table or it belongs to another model.
+    """
+    manifest_path = lookup_manifest_path(artifacts_dir)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as file_obj:
+            manifest = json.load(file_obj)
+        if manifest.get('version') != version:
+            logging.info(f"Lookup table is for model {manifest.get('version')} , not {version} , not used")
+            return None
+        table = np.load(lookup_table_path(artifacts_dir), mmap_mode='r')
+        if list(table.shape) != manifest['shape']:
+            raise ValueError(f"Lookup table shape {table.shape} does not match the manifest")
+        return LookupTable(table, manifest)
+    except Exception as e:
+        # the model is still there , so a broken table only costs the fast path
+        logging.info(f"Lookup table not loaded: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    # materialize the table for the current artifacts , e.g. python -m src.pipeline.lookup_table
+    print(json.dumps(materialize_lookup_table(), indent=2))
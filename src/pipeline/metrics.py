@@ -0,0 +1,416 @@
+# prometheus style metrics of the prediction service (counters , histograms and gauges)
+# every worker process keeps its own values in memory (one lock + a list update per observation) and a
+# background thread writes a snapshot of them into a directory shared by all the workers of one gunicorn master ,
+# /metrics merges the snapshots of all the workers , so whichever worker answers the scrape the totals are right
+# counters and histograms of workers which are gone stay in the totals (they must never go down) : the snapshot
+# of an exited worker is folded into retired.json and removed (gunicorn child_exit , or the next /metrics for
+# workers which died without the hook) , so a recycled pid never mixes with an old snapshot ,
+# gauges are only reported for the living workers , with a pid label
+import os
+import json
+import time
+import tempfile
+import threading
+try:
+    import fcntl
+except ImportError:     # windows , no gunicorn there , the snapshots are not locked
+    fcntl = None
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from src.logger import logging, dropped_records
+from src.utils import process_memory_mb, process_smaps_mb
+
+
+@dataclass
+class MetricsConfig:
+    # METRICS_ENABLED=0 turns every observation into a no-op
+    enabled: bool = os.environ.get('METRICS_ENABLED', '1') != '0'
+    # directory of the worker snapshots , by default one temporary directory per gunicorn master process
+    metrics_dir: str = os.environ.get('METRICS_DIR')
+    # how often (seconds) a worker writes its snapshot , /metrics always writes the own one first
+    flush_interval: float = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+
+# seconds , from 0.1 ms (compiled transform of one record) to 2.5 s (big batches)
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+STAGE_METRIC = 'predict_stage_duration_seconds'
+
+
+class Histogram:
+    # cumulative bucket counts like prometheus , buckets are the upper bounds
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last one is +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.total, self.count
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.buckets + ['+Inf'], counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {'buckets': buckets, 'sum': total, 'count': count}
+
+    def _after_fork(self):
+        # the values of the parent belong to the parent , and its lock may have been held during the fork
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+
+class _Timer:
+    # context manager observing the elapsed seconds into a histogram (a plain class is cheaper than @contextmanager)
+    __slots__ = ('registry', 'name', 'labels', 'started')
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.started, self.labels)
+        return False
+
+
+def _process_started(pid):
+    # start time of the process (clock ticks after boot) , it tells a recycled pid apart
+    try:
+        with open(f'/proc/{pid}/stat') as file_obj:
+            return file_obj.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return '0'
+
+
+def worker_metrics_dir(master_pid=None):
+    """
+    Snapshot directory of the workers of a master (by default the parent of this process , i.e. this is a worker).
+    """
+    config = MetricsConfig()
+    if config.metrics_dir:
+        return config.metrics_dir
+    # the workers of one gunicorn master share its pid as parent , the start time of the master
+    # keeps the directories of earlier runs with a recycled pid apart
+    master_pid = master_pid or os.getppid()
+    return os.path.join(tempfile.gettempdir(), f'mlproject_metrics_{master_pid}_{_process_started(master_pid)}')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class MetricsRegistry:
+    def __init__(self, config: MetricsConfig = None):
+        self.metrics_config = config or MetricsConfig()
+        self._descriptions = {}   # name -> (type , help)
+        self._counters = {}       # (name , labels) -> value
+        self._histograms = {}     # (name , labels) -> Histogram
+        self._registered = {}     # (name , labels) -> Histogram owned by another component
+        self._gauges = {}         # name -> function returning the current value
+        self._lock = threading.Lock()
+        self._metrics_dir = None
+        self._snapshot_name = None
+        self._flusher = None
+
+    @property
+    def enabled(self):
+        return self.metrics_config.enabled
+
+    @property
+    def metrics_dir(self):
+        if self._metrics_dir is None:
+            self._metrics_dir = self.metrics_config.metrics_dir or worker_metrics_dir()
+        return self._metrics_dir
+
+    @property
+    def snapshot_name(self):
+        # worker_<pid>_<start time>.json
+        if self._snapshot_name is None:
+            pid = os.getpid()
+            self._snapshot_name = f'worker_{pid}_{_process_started(pid)}.json'
+        return self._snapshot_name
+
+    def describe(self, name, metric_type, help_text):
+        self._descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name, labels=None, value=1):
+        if not self.metrics_config.enabled:
+            return
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        if not self.metrics_config.enabled:
+            return
+        key = (name, tuple(sorted((labels or {}).items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def time(self, name, **labels):
+        # with metrics.time(STAGE_METRIC , stage='transform'): ...
+        return _Timer(self, name, labels)
+
+    def register_histogram(self, name, help_text, histogram, labels=None):
+        # histograms which are owned by another component (e.g. the micro batcher)
+        self.describe(name, 'histogram', help_text)
+        with self._lock:
+            self._registered[(name, tuple(sorted((labels or {}).items())))] = histogram
+
+    def register_gauge(self, name, help_text, function):
+        self.describe(name, 'gauge', help_text)
+        self._gauges[name] = function
+
+    def snapshot(self):
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = list(self._histograms.items()) + list(self._registered.items())
+        gauges = []
+        for name, function in self._gauges.items():
+            try:
+                gauges.append({'name': name, 'labels': {}, 'value': float(function())})
+            except Exception:
+                continue
+        return {'pid': os.getpid(),
+                'descriptions': self._descriptions,
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in counters],
+                'histograms': [dict(histogram.snapshot(), name=name, labels=dict(labels))
+                               for (name, labels), histogram in histograms],
+                'gauges': gauges}
+
+    def _ensure_flusher(self):
+        # threads do not survive the fork of gunicorn workers , so the flusher is started lazily in every process
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.metrics_config.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.info(f"Metrics snapshot could not be written: {e}")
+
+    def maybe_start(self):
+        # called on every request , cheap once the flusher runs
+        if self.metrics_config.enabled and (self._flusher is None or not self._flusher.is_alive()):
+            self._ensure_flusher()
+
+    def flush(self):
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        file_path = os.path.join(self.metrics_dir, self.snapshot_name)
+        tmp_path = f'{file_path}.tmp'
+        with open(tmp_path, 'w') as file_obj:
+            json.dump(self.snapshot(), file_obj)
+        with _DirectoryLock(self.metrics_dir, shared=True):
+            os.replace(tmp_path, file_path)
+
+    def collect(self):
+        """
+        Snapshots of all the workers (the own one is always fresh) and the retired totals of the exited ones.
+        """
+        self.flush()
+        retire_workers(self.metrics_dir)
+        with _DirectoryLock(self.metrics_dir, shared=True):
+            return [snapshot for _, snapshot in _read_snapshots(self.metrics_dir)]
+
+    def render(self):
+        """
+        Prometheus text exposition format of the merged snapshots of all the workers.
+        """
+        return render_snapshots(self.collect())
+
+    def _after_fork(self):
+        # a forked worker starts with empty metrics and without the flusher thread of the parent
+        self._counters = {}
+        self._histograms = {}
+        # the registered histograms stay registered (their owner , e.g. the micro batcher , was created before
+        # the fork and keeps observing into them) , only the values of the parent are dropped
+        for histogram in self._registered.values():
+            histogram._after_fork()
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._metrics_dir = None
+        self._snapshot_name = None
+
+
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+class _DirectoryLock:
+    # flock of the snapshot directory : the snapshots are read and replaced under the shared lock , folded into
+    # the retired totals under the exclusive one , so a scrape never counts a worker twice or not at all
+    def __init__(self, metrics_dir, shared=False):
+        self.lock_path = os.path.join(metrics_dir, '.lock')
+        self.shared = shared
+        self.file_obj = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file_obj = open(self.lock_path, 'a')
+            fcntl.flock(self.file_obj, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file_obj is not None:
+            self.file_obj.close()
+        return False
+
+
+def _read_snapshots(metrics_dir):
+    # (file name , snapshot) of the workers and of the retired totals
+    snapshots = []
+    for file_name in os.listdir(metrics_dir):
+        if not ((file_name.startswith('worker_') and file_name.endswith('.json')) or file_name == RETIRED_SNAPSHOT):
+            continue
+        try:
+            with open(os.path.join(metrics_dir, file_name)) as file_obj:
+                snapshots.append((file_name, json.load(file_obj)))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _snapshot_alive(file_name):
+    # worker_<pid>_<start time>.json of a process which is still running (and not a recycled pid)
+    try:
+        pid, started = file_name[len('worker_'):-len('.json')].split('_')
+        pid = int(pid)
+    except ValueError:
+        return False
+    return _pid_alive(pid) and _process_started(pid) == started
+
+
+def retire_workers(metrics_dir, pid=None):
+    """
+    Fold the counters and histograms of exited workers into retired.json and remove their snapshots.
+    pid is the worker which has just exited (gunicorn child_exit) , without it every dead worker is retired.
+    """
+    if not os.path.isdir(metrics_dir):
+        return
+    with _DirectoryLock(metrics_dir):
+        snapshots = _read_snapshots(metrics_dir)
+        exited = [(file_name, snapshot) for file_name, snapshot in snapshots if file_name != RETIRED_SNAPSHOT and
+                  (file_name.startswith(f'worker_{pid}_') if pid is not None else not _snapshot_alive(file_name))]
+        if not exited:
+            return
+        retired = [snapshot for file_name, snapshot in snapshots if file_name == RETIRED_SNAPSHOT]
+        descriptions, counters, histograms, _ = merge_snapshots(retired + [snapshot for _, snapshot in exited])
+        merged = {'pid': None,
+                  'descriptions': descriptions,
+                  'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                               for (name, labels), value in counters.items()],
+                  'histograms': [dict(histogram, name=name, labels=dict(labels))
+                                 for (name, labels), histogram in histograms.items()],
+                  'gauges': []}
+        file_path = os.path.join(metrics_dir, RETIRED_SNAPSHOT)
+        with open(f'{file_path}.tmp', 'w') as file_obj:
+            json.dump(merged, file_obj)
+        os.replace(f'{file_path}.tmp', file_path)
+        for file_name, _ in exited:
+            os.remove(os.path.join(metrics_dir, file_name))
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    escaped = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                       for name, value in sorted(labels.items()))
+    return '{' + escaped + '}'
+
+
+def merge_snapshots(snapshots):
+    # counters and histograms are summed over the workers , gauges of the living workers get a pid label
+    descriptions, counters, histograms, gauges = {}, {}, {}, []
+    for snapshot in snapshots:
+        descriptions.update(snapshot.get('descriptions', {}))
+        for counter in snapshot['counters']:
+            key = (counter['name'], tuple(sorted(counter['labels'].items())))
+            counters[key] = counters.get(key, 0) + counter['value']
+        for histogram in snapshot['histograms']:
+            key = (histogram['name'], tuple(sorted(histogram['labels'].items())))
+            merged = histograms.setdefault(key, {'buckets': {}, 'sum': 0.0, 'count': 0})
+            for bound, count in histogram['buckets'].items():
+                merged['buckets'][bound] = merged['buckets'].get(bound, 0) + count
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+        if snapshot['gauges'] and _pid_alive(snapshot['pid']):
+            for gauge in snapshot['gauges']:
+                gauges.append(dict(gauge, labels=dict(gauge['labels'], pid=snapshot['pid'])))
+    return descriptions, counters, histograms, gauges
+
+
+def render_snapshots(snapshots):
+    descriptions, counters, histograms, gauges = merge_snapshots(snapshots)
+    lines, described = [], set()
+
+    def header(name, default_type):
+        if name in described:
+            return
+        described.add(name)
+        metric_type, help_text = descriptions.get(name, (default_type, name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f'{name}{_label_text(dict(labels))} {value}')
+    for (name, labels), histogram in sorted(histograms.items()):
+        header(name, 'histogram')
+        labels = dict(labels)
+        # +Inf last , the other bounds in numeric order
+        bounds = sorted(histogram['buckets'], key=lambda bound: float('inf') if bound == '+Inf' else float(bound))
+        for bound in bounds:
+            lines.append(f'{name}_bucket{_label_text(dict(labels, le=bound))} {histogram["buckets"][bound]}')
+        lines.append(f'{name}_sum{_label_text(labels)} {histogram["sum"]}')
+        lines.append(f'{name}_count{_label_text(labels)} {histogram["count"]}')
+    for gauge in sorted(gauges, key=lambda gauge: (gauge['name'], gauge['labels']['pid'])):
+        header(gauge['name'], 'gauge')
+        lines.append(f'{gauge["name"]}{_label_text(gauge["labels"])} {gauge["value"]}')
+    return '\n'.join(lines) + '\n'
+
+
+# metrics of this process , shared by the app and the prediction pipeline
+metrics = MetricsRegistry()
+metrics.describe('http_requests_total', 'counter', 'Requests by route , method and status')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Request latency by route')
+metrics.describe('http_request_errors_total', 'counter', 'Failed requests by route and error class')
+metrics.describe(STAGE_METRIC, 'histogram', 'Latency of the prediction stages (parse , dataframe , transform , predict , serialize , render)')
+metrics.register_gauge('log_records_dropped', 'Log records dropped because the log queue was full', dropped_records)
+# memory of every worker , with a preloaded master the Pss shows how much of it is really shared
+metrics.register_gauge('process_resident_memory_bytes', 'Resident set size of the worker process',
+                       lambda: process_memory_mb() * 2 ** 20)
+metrics.register_gauge('process_proportional_memory_bytes', 'Proportional set size (shared pages split between the processes)',
+                       lambda: process_smaps_mb() * 2 ** 20)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._after_fork)
@@ -0,0 +1,123 @@
+# micro batching for the online /api/predict path
+# concurrent requests inside one worker are collected for a few milliseconds (or until the batch is full)
+# and predicted together with PredictPipeline.predict_batch , every caller gets back its own row
+# it only helps when a worker serves requests concurrently (gunicorn -k gthread --threads N)
+import os
+import sys
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.pipeline.metrics import Histogram
+
+
+@dataclass
+class MicroBatcherConfig:
+    # off by default , set PREDICT_MICRO_BATCH=1 to enable it
+    enabled: bool = os.environ.get('PREDICT_MICRO_BATCH', '0') == '1'
+    # how long the first request of a batch waits for the others
+    max_wait_ms: float = float(os.environ.get('PREDICT_MICRO_BATCH_MAX_WAIT_MS', 5))
+    # batch is predicted as soon as it has this many rows
+    max_batch_size: int = int(os.environ.get('PREDICT_MICRO_BATCH_MAX_SIZE', 64))
+    # a caller never waits longer than this for its result
+    result_timeout: float = float(os.environ.get('PREDICT_MICRO_BATCH_TIMEOUT', 5))
+
+
+class MicroBatcher:
+    def __init__(self, predict_pipeline, config: MicroBatcherConfig = None):
+        self.predict_pipeline = predict_pipeline
+        self.batcher_config = config or MicroBatcherConfig()
+        self.batch_size_histogram = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+        self.queue_depth_histogram = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+        self.queue_wait_histogram = Histogram([0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1])
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.batcher_config.enabled
+
+    def _ensure_started(self):
+        # threads do not survive the fork of gunicorn workers , so start the worker lazily in every process
+        if self._pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._pid = os.getpid()
+            self._worker.start()
+
+    def submit(self, record):
+        # returns a Future which will get the result dict of predict_batch for this record
+        self._ensure_started()
+        future = Future()
+        self._queue.put((record, future, time.monotonic()))
+        return future
+
+    def predict(self, record):
+        try:
+            return self.submit(record).result(timeout=self.batcher_config.result_timeout)
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def _collect(self):
+        # block for the first request , then wait max_wait_ms for more (or until the batch is full)
+        batch = [self._queue.get()]
+        self.queue_depth_histogram.observe(self._queue.qsize())
+        deadline = time.monotonic() + self.batcher_config.max_wait_ms / 1000
+        while len(batch) < self.batcher_config.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            self.batch_size_histogram.observe(len(batch))
+            for _, _, enqueued in batch:
+                self.queue_wait_histogram.observe(started - enqueued)
+            try:
+                results = self.predict_pipeline.predict_batch([record for record, _, _ in batch])
+            except Exception as e:
+                logging.info(f"Micro batch of {len(batch)} records failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def register_metrics(self, registry):
+        # the histograms and the queue depth of this batcher are reported on /metrics too
+        registry.register_histogram('micro_batch_size', 'Records per micro batch', self.batch_size_histogram)
+        registry.register_histogram('micro_batch_queue_depth_at_start', 'Waiting requests when a micro batch starts',
+                                    self.queue_depth_histogram)
+        registry.register_histogram('micro_batch_queue_wait_seconds', 'Time a request waits for its micro batch',
+                                    self.queue_wait_histogram)
+        registry.register_gauge('micro_batch_queue_depth', 'Requests waiting for the micro batcher',
+                                self.queue_depth)
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'max_wait_ms': self.batcher_config.max_wait_ms,
+            'max_batch_size': self.batcher_config.max_batch_size,
+            'queue_depth': self.queue_depth(),
+            'batch_size': self.batch_size_histogram.snapshot(),
+            'queue_depth_at_batch_start': self.queue_depth_histogram.snapshot(),
+            'queue_wait_seconds': self.queue_wait_histogram.snapshot(),
+        }
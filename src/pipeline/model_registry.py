@@ -0,0 +1,247 @@
+# process level registry for the trained model and the preprocessor
+# every gunicorn worker loads both artifacts only once, and after that it just
+# stat() the files time to time, whenever the trainer writes new artifacts the registry
+# loads them in a background thread and swap the whole snapshot in one assignment
+import os
+import sys
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.utils import load_object
+from src.model_serializer import load_model, resolve_model_path
+from src.pipeline.compiled_preprocessor import compile_preprocessor, known_categories
+from src.pipeline.lookup_table import load_lookup_table, lookup_manifest_path
+from src.pipeline.onnx_pipeline import load_onnx_pipeline, onnx_manifest_path
+
+
+@dataclass
+class ModelRegistryConfig:
+    # artifacts which are written by the training pipeline
+    model_path: str = os.path.join('artifacts', 'model.pkl')
+    preprocessor_path: str = os.path.join('artifacts', 'preprocessor.pkl')
+    # how often (in seconds) the artifact files are checked for a change , 0 means on every request
+    check_interval: float = float(os.environ.get('MODEL_REGISTRY_CHECK_INTERVAL', 5))
+    # serve from the materialized lookup table of the model when there is one (PREDICT_LOOKUP_TABLE=0 turns it off)
+    use_lookup_table: bool = os.environ.get('PREDICT_LOOKUP_TABLE', '1') != '0'
+    # MODEL_WARM_UP=0 keeps warm_up() from loading in the background (e.g. to measure the import time alone)
+    warm_up: bool = os.environ.get('MODEL_WARM_UP', '1') != '0'
+    # PREDICT_BACKEND=onnx serves the exported ONNX graph with onnxruntime (sklearn is not even imported) ,
+    # the sklearn artifacts are loaded when there is no graph of the current model
+    backend: str = os.environ.get('PREDICT_BACKEND', 'sklearn')
+    # intra op threads of the onnxruntime session
+    onnx_threads: int = int(os.environ.get('ONNX_THREADS', 1))
+
+
+@dataclass(frozen=True)
+class LoadedArtifacts:
+    # one immutable snapshot , requests keep the snapshot they started with even if a swap happens meanwhile
+    model: object
+    preprocessor: object
+    compiled_preprocessor: object   # pandas free fast path of the preprocessor , None if it can not be compiled
+    lookup_table: object            # LookupTable of this model version , None if there is no materialized table
+    categories: object              # column -> fitted categories for the validation , None if they are not known
+    backend: str        # 'sklearn' or 'onnx' (model , preprocessor and compiled_preprocessor are one OnnxPipeline)
+    version: str        # content fingerprint of model + preprocessor
+    file_stamp: tuple   # (mtime_ns, size) of both files (+ lookup table manifest) , cheap check for the changes
+    loaded_at: float
+
+
+def file_stamp(*file_paths):
+    # mtime and size of the files , this is what we compare on every check
+    stamps = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        stamps.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+def fingerprint_files(*file_paths):
+    # sha256 over the content of all the files , first 12 hex chars are enough as a version
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as file_obj:
+            for block in iter(lambda: file_obj.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    def __init__(self, config: ModelRegistryConfig = None):
+        self.registry_config = config or ModelRegistryConfig()
+        self._current = None            # LoadedArtifacts which is served right now
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._listeners = []            # called with (old version , new version) after a hot swap
+        self.last_error = None          # why the last load failed , for the readiness check
+
+    def add_listener(self, listener):
+        # e.g. the prediction cache drops the results of the old model
+        self._listeners.append(listener)
+
+    @property
+    def version(self):
+        current = self._current
+        return current.version if current is not None else None
+
+    @property
+    def is_loaded(self):
+        return self._current is not None
+
+    def _artifact_paths(self):
+        # the manifest of the model when it was saved by save_model , it changes with every new payload
+        return (resolve_model_path(self.registry_config.model_path), self.registry_config.preprocessor_path)
+
+    def _stamp(self):
+        stamp = file_stamp(*self._artifact_paths())
+        if self.registry_config.use_lookup_table:
+            # the lookup table is materialized after the model is saved , so a new manifest is a change too
+            manifest_path = lookup_manifest_path(os.path.dirname(self.registry_config.model_path))
+            stamp += file_stamp(manifest_path) if os.path.exists(manifest_path) else (None,)
+        if self.registry_config.backend == 'onnx':
+            # same for the ONNX graph , it is exported after the model is saved
+            manifest_path = onnx_manifest_path(os.path.dirname(self.registry_config.model_path))
+            stamp += file_stamp(manifest_path) if os.path.exists(manifest_path) else (None,)
+        return stamp
+
+    def _load(self):
+        paths = self._artifact_paths()
+        stamp_before = self._stamp()
+        version = fingerprint_files(*paths)
+        artifacts_dir = os.path.dirname(self.registry_config.model_path)
+        onnx_pipeline = None
+        if self.registry_config.backend == 'onnx':
+            onnx_pipeline = load_onnx_pipeline(artifacts_dir, version, self.registry_config.onnx_threads)
+            if onnx_pipeline is None:
+                logging.info(f"No ONNX graph of model {version} , serving it with sklearn")
+        if onnx_pipeline is not None:
+            model = preprocessor = compiled_preprocessor = onnx_pipeline
+        else:
+            model = load_model(paths[0])
+            preprocessor = load_object(file_path=self.registry_config.preprocessor_path)
+            compiled_preprocessor = compile_preprocessor(preprocessor)
+        lookup_table = None
+        if self.registry_config.use_lookup_table:
+            lookup_table = load_lookup_table(artifacts_dir, version)
+        # files changed while we are reading them (trainer is still writing) , try again on the next check
+        if self._stamp() != stamp_before:
+            raise RuntimeError("Artifacts changed while loading")
+        return LoadedArtifacts(model=model,
+                               preprocessor=preprocessor,
+                               compiled_preprocessor=compiled_preprocessor,
+                               lookup_table=lookup_table,
+                               categories=known_categories(compiled_preprocessor or preprocessor),
+                               backend='onnx' if onnx_pipeline is not None else 'sklearn',
+                               version=version,
+                               file_stamp=stamp_before,
+                               loaded_at=time.time())
+
+    def reload(self, force=False):
+        """
+        Load the artifacts again if they changed on disk (or always with force=True).
+        The old snapshot keeps serving until the new one is completely loaded.
+        """
+        with self._reload_lock:
+            return self._reload_locked(force)
+
+    def _reload_locked(self, force=False):
+        current = self._current
+        try:
+            if not force and current is not None and \
+                    self._stamp() == current.file_stamp:
+                return current
+            loaded = self._load()
+        except Exception as e:
+            self.last_error = str(e)
+            if current is None:
+                raise CustomException(e, sys)
+            # never drop the requests because of a half written artifact , keep the old version
+            logging.info(f"Model reload failed, still serving version {current.version}: {e}")
+            return current
+        if current is None or loaded.version != current.version:
+            logging.info(f"Model registry loaded version {loaded.version} ({loaded.backend})"
+                         f"{' with lookup table' if loaded.lookup_table is not None else ''}")
+        # single reference assignment , this is the atomic swap
+        self._current = loaded
+        self.last_error = None
+        if current is not None and loaded.version != current.version:
+            for listener in self._listeners:
+                try:
+                    listener(current.version, loaded.version)
+                except Exception as e:
+                    logging.info(f"Model swap listener failed: {e}")
+        return loaded
+
+    def warm_up(self):
+        """
+        Start loading the artifacts in a background thread and return at once , so the process can answer
+        the liveness checks while the model loads. Does nothing when it is loaded or already loading.
+        """
+        if not self.registry_config.warm_up:
+            return
+        if self._current is None and self._reload_lock.acquire(blocking=False):
+            threading.Thread(target=self._background_reload, name='model-warm-up', daemon=True).start()
+
+    def get(self):
+        """
+        Return the current LoadedArtifacts snapshot, loading it on the first call.
+        """
+        current = self._current
+        if current is None:
+            return self.reload()
+
+        now = time.monotonic()
+        if now - self._last_check < self.registry_config.check_interval:
+            return current
+        self._last_check = now
+        try:
+            changed = self._stamp() != current.file_stamp
+        except OSError:
+            # file is just being replaced , look again on the next check
+            changed = False
+        # only one thread loads the new version , requests continue with the current snapshot meanwhile
+        if changed and self._reload_lock.acquire(blocking=False):
+            threading.Thread(target=self._background_reload, daemon=True).start()
+        return current
+
+    def _background_reload(self):
+        try:
+            self._reload_locked()
+        except Exception as e:
+            # first load failed (no artifacts yet) , the next get() or warm_up() tries again
+            logging.info(f"Model load failed: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def _after_fork(self):
+        # locks are not safe to use after fork , the loaded snapshot itself is shared copy-on-write
+        self._reload_lock = threading.Lock()
+        self._last_check = 0.0
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    # one registry per process
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+def _reset_after_fork():
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    if _registry is not None:
+        _registry._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,349 @@
+# export of the fitted preprocessor + model into one ONNX graph , served by onnxruntime
+# the serving side then needs only numpy + onnxruntime , no sklearn / xgboost / catboost / pandas in the worker
+# the preprocessing part of the graph is built from the CompiledPreprocessor (impute , scale , one hot) in float64 ,
+# skl2onnx would scale the one hot block in float32 , and the linear models of the zoo have coefficients of 1e14
+# (collinear one hot columns) which amplify that rounding to whole score points
+# like sklearn the features are cast to float32 before a tree model , the linear models stay in float64
+# the model part is converted by skl2onnx (onnxmltools for xgboost , catboost's own converter for catboost)
+# the manifest keeps the fingerprint of model + preprocessor and the parity of the export against sklearn ,
+# a graph of another model is never served
+import os
+import sys
+import json
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.exception import CustomException
+from src.logger import logging
+
+ONNX_MODEL_FILE = 'model.onnx'
+ONNX_MANIFEST_FILE = 'model.onnx.json'
+# name of the graph input of the model part
+FEATURES_INPUT = 'features'
+
+
+@dataclass
+class OnnxExportConfig:
+    model_path: str = os.path.join('artifacts', 'model.pkl')
+    preprocessor_path: str = os.path.join('artifacts', 'preprocessor.pkl')
+    # random records of the input domain which are predicted by both sklearn and onnxruntime at export
+    parity_rows: int = int(os.environ.get('ONNX_PARITY_ROWS', 5000))
+    # largest allowed difference of a prediction (score points) , the export fails above it
+    parity_tolerance: float = float(os.environ.get('ONNX_PARITY_TOLERANCE', 0.01))
+
+    @property
+    def onnx_path(self):
+        return onnx_model_path(os.path.dirname(self.model_path))
+
+    @property
+    def manifest_path(self):
+        return onnx_manifest_path(os.path.dirname(self.model_path))
+
+
+def onnx_model_path(artifacts_dir):
+    return os.path.join(artifacts_dir, ONNX_MODEL_FILE)
+
+
+def onnx_manifest_path(artifacts_dir):
+    return os.path.join(artifacts_dir, ONNX_MANIFEST_FILE)
+
+
+def is_linear_model(model):
+    # linear models are evaluated in float64 , every other model of the zoo casts the features to float32 itself
+    return type(model).__module__.startswith('sklearn.linear_model')
+
+
+def _register_converters():
+    # xgboost and catboost are not known to skl2onnx , their converters are registered here
+    from skl2onnx import update_registered_converter
+    from skl2onnx.common.shape_calculator import calculate_linear_regressor_output_shapes
+    from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+    from xgboost import XGBRegressor
+    from catboost import CatBoostRegressor
+    update_registered_converter(XGBRegressor, 'XGBoostXGBRegressor',
+                                calculate_linear_regressor_output_shapes, convert_xgboost)
+    update_registered_converter(CatBoostRegressor, 'CatBoostCatBoostRegressor',
+                                calculate_linear_regressor_output_shapes, _convert_catboost)
+
+
+def _convert_catboost(scope, operator, container):
+    # catboost exports its trees as one TreeEnsembleRegressor node , which is copied into the skl2onnx graph
+    from onnx.helper import get_attribute_value
+    from catboost.utils import convert_to_onnx_object
+    graph = convert_to_onnx_object(operator.raw_operator)
+    opsets = {opset.domain: opset.version for opset in graph.opset_import}
+    if len(graph.graph.node) != 1 or not graph.graph.node[0].op_type.startswith('TreeEnsemble'):
+        raise NotImplementedError("Only a single tree ensemble node of catboost can be converted")
+    node = graph.graph.node[0]
+    attributes = {attribute.name: get_attribute_value(attribute) for attribute in node.attribute}
+    container.add_node(node.op_type, [operator.inputs[0].full_name], [operator.outputs[0].full_name],
+                       op_domain=node.domain, op_version=opsets.get(node.domain), **attributes)
+
+
+def model_graph(model, n_features):
+    """
+    ONNX graph of the model alone , one input FEATURES_INPUT of shape (n , n_features).
+    """
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import DoubleTensorType, FloatTensorType
+    _register_converters()
+    tensor_type = DoubleTensorType if is_linear_model(model) else FloatTensorType
+    return convert_sklearn(model, initial_types=[(FEATURES_INPUT, tensor_type([None, n_features]))],
+                           target_opset={'': 17, 'ai.onnx.ml': 3})
+
+
+def preprocessor_graph(compiled, opset_imports, output_name, float_output):
+    """
+    ONNX graph of the CompiledPreprocessor : one (n , 1) input per column (float64 scores , string categories) ,
+    one (n , n_features) output. Missing scores are imputed in the graph , missing categories by OnnxPipeline.
+    """
+    from onnx import helper, TensorProto
+    nodes, initializers, inputs, blocks = [], [], [], []
+
+    def constant(name, values, data_type=TensorProto.DOUBLE):
+        values = np.asarray(values)
+        initializers.append(helper.make_tensor(name, data_type, values.shape, values.ravel().tolist()))
+        return name
+
+    # numerical block : where(isnan(x) , fill , x) -> (x - mean) * (1 / scale)
+    for column in compiled.numerical_columns:
+        inputs.append(helper.make_tensor_value_info(column, TensorProto.DOUBLE, [None, 1]))
+    nodes.append(helper.make_node('Concat', list(compiled.numerical_columns), ['numbers'], axis=1))
+    nodes.append(helper.make_node('IsNaN', ['numbers'], ['numbers_missing']))
+    nodes.append(helper.make_node('Where', ['numbers_missing', constant('fill_values', compiled.fill_values),
+                                            'numbers'], ['numbers_filled']))
+    nodes.append(helper.make_node('Sub', ['numbers_filled', constant('means', compiled.means)], ['numbers_centered']))
+    nodes.append(helper.make_node('Mul', ['numbers_centered', constant('inverse_scales', compiled.inverse_scales)],
+                                  ['numerical_block']))
+    blocks.append((compiled.numerical_offset, 'numerical_block'))
+
+    # categorical block : one hot of every column (unknown category -> zeros) * the value of its one hot column
+    one_hot_outputs = []
+    positions = []
+    for column, table in zip(compiled.categorical_columns, compiled.category_index):
+        inputs.append(helper.make_tensor_value_info(column, TensorProto.STRING, [None, 1]))
+        categories = sorted(table, key=table.get)
+        positions.extend(table[category] for category in categories)
+        nodes.append(helper.make_node('OneHotEncoder', [column], [f'{column}_one_hot'], domain='ai.onnx.ml',
+                                      cats_strings=categories, zeros=1))
+        one_hot_outputs.append(f'{column}_one_hot')
+    if one_hot_outputs:
+        width = len(positions)
+        offset = min(positions)
+        if positions != list(range(offset, offset + width)):
+            raise ValueError("One hot columns of the preprocessor are not contiguous")
+        # OneHotEncoder gives (n , 1 , categories) floats , 0 / 1 is exact so the cast to float64 loses nothing
+        nodes.append(helper.make_node('Concat', one_hot_outputs, ['one_hot_3d'], axis=2))
+        nodes.append(helper.make_node('Reshape', ['one_hot_3d', constant('one_hot_shape', [-1, width], TensorProto.INT64)],
+                                      ['one_hot_float']))
+        nodes.append(helper.make_node('Cast', ['one_hot_float'], ['one_hot'], to=TensorProto.DOUBLE))
+        nodes.append(helper.make_node('Mul', ['one_hot', constant('one_hot_values', compiled.one_hot_values[offset:offset + width])],
+                                      ['categorical_block']))
+        blocks.append((offset, 'categorical_block'))
+
+    block_names = [name for _, name in sorted(blocks)]
+    if float_output:
+        nodes.append(helper.make_node('Concat', block_names, ['features_float64'], axis=1))
+        nodes.append(helper.make_node('Cast', ['features_float64'], [output_name], to=TensorProto.FLOAT))
+        output_type = TensorProto.FLOAT
+    else:
+        nodes.append(helper.make_node('Concat', block_names, [output_name], axis=1))
+        output_type = TensorProto.DOUBLE
+    graph = helper.make_graph(nodes, 'preprocessor', inputs,
+                              [helper.make_tensor_value_info(output_name, output_type, [None, compiled.n_features])],
+                              initializers)
+    return helper.make_model(graph, opset_imports=opset_imports)
+
+
+def build_graph(model, compiled):
+    """
+    One ONNX graph of preprocessor + model , the model part is prefixed with 'model_' so the names never clash.
+    """
+    from onnx import compose, helper
+    model_part = compose.add_prefix(model_graph(model, compiled.n_features), 'model_')
+    opsets = {opset.domain: opset.version for opset in model_part.opset_import}
+    opsets.setdefault('ai.onnx.ml', 1)
+    opset_imports = [helper.make_opsetid(domain, version) for domain, version in opsets.items()]
+    preprocessor_part = preprocessor_graph(compiled, opset_imports, 'transformed_features',
+                                           float_output=not is_linear_model(model))
+    preprocessor_part.ir_version = model_part.ir_version
+    return compose.merge_models(preprocessor_part, model_part,
+                                io_map=[('transformed_features', f'model_{FEATURES_INPUT}')])
+
+
+def rounding_bound(model, transformed):
+    """
+    Per row estimate of the float64 rounding error of a linear model (sqrt(n) * eps * sum |coef * x| , the usual
+    growth of the rounding of a sum of n terms) , zero for the other models. A LinearRegression on the collinear
+    one hot columns has coefficients of 1e14 , sklearn's own prediction is only exact up to a few tenths of a
+    score point and onnxruntime sums the terms in another order.
+    """
+    if not is_linear_model(model):
+        return np.zeros(transformed.shape[0])
+    if hasattr(transformed, 'toarray'):
+        transformed = transformed.toarray()
+    n_terms = transformed.shape[1] + 1
+    magnitude = np.abs(transformed) @ np.abs(np.ravel(model.coef_)) + np.abs(np.ravel(model.intercept_)).sum()
+    return np.sqrt(n_terms) * np.finfo(np.float64).eps * magnitude
+
+
+def sample_domain(compiled, n_rows, random_state=42):
+    # random records of the input domain , integer and fractional scores , every known category
+    import pandas as pd
+    rng = np.random.default_rng(random_state)
+    data = {}
+    for column, table in zip(compiled.categorical_columns, compiled.category_index):
+        categories = np.array(sorted(table, key=table.get), dtype=object)
+        data[column] = categories[rng.integers(0, len(categories), n_rows)]
+    for column in compiled.numerical_columns:
+        scores = rng.integers(0, 101, n_rows).astype(float)
+        fractional = rng.random(n_rows) < 0.25
+        scores[fractional] += np.round(rng.random(fractional.sum()), 2)
+        data[column] = np.minimum(scores, 100)
+    return pd.DataFrame(data)
+
+
+def export_onnx(config: OnnxExportConfig = None):
+    """
+    Convert the saved model + preprocessor into one ONNX graph , check it against sklearn on random records
+    of the domain and write the graph and its manifest next to the model. Returns the manifest.
+    """
+    # imported here , the registry imports this module for the serving side
+    import onnxruntime
+    from src.utils import load_object
+    from src.model_serializer import load_model, resolve_model_path
+    from src.pipeline.model_registry import fingerprint_files
+    from src.pipeline.compiled_preprocessor import compile_preprocessor
+    try:
+        config = config or OnnxExportConfig()
+        started = time.perf_counter()
+        # same files as the registry fingerprints , so the versions match
+        model_path = resolve_model_path(config.model_path)
+        version = fingerprint_files(model_path, config.preprocessor_path)
+        model = load_model(model_path)
+        preprocessor = load_object(file_path=config.preprocessor_path)
+        compiled = compile_preprocessor(preprocessor)
+        if compiled is None:
+            raise ValueError("Preprocessor can not be compiled , it can not be exported to ONNX")
+
+        graph = build_graph(model, compiled)
+        payload = graph.SerializeToString()
+        pipeline = OnnxPipeline(onnxruntime.InferenceSession(payload, providers=['CPUExecutionProvider']),
+                                {'categorical_columns': compiled.categorical_columns,
+                                 'categorical_fill_values': [str(value) for value in compiled.categorical_fill_values],
+                                 'categories': [sorted(table, key=table.get) for table in compiled.category_index],
+                                 'numerical_columns': compiled.numerical_columns,
+                                 'version': version})
+        features = sample_domain(compiled, config.parity_rows)
+        transformed = preprocessor.transform(features)
+        expected = model.predict(transformed)
+        difference = np.abs(pipeline.predict(pipeline.transform(features)) - expected)
+        record_difference = np.array([abs(pipeline.predict(pipeline.transform_record(record))[0] - expected[position])
+                                      for position, record in enumerate(features.head(100).to_dict(orient='records'))])
+        allowed = config.parity_tolerance + rounding_bound(model, transformed)
+        if (difference > allowed).any() or (record_difference > allowed[:len(record_difference)]).any():
+            raise ValueError(f"ONNX predictions differ from sklearn by up to {difference.max():.4g} , "
+                             f"more than {config.parity_tolerance} (+ the float64 rounding of linear models)")
+        max_abs_diff = float(max(difference.max(), record_difference.max()))
+
+        tmp_onnx_path = f"{config.onnx_path}.{os.getpid()}.tmp"
+        with open(tmp_onnx_path, 'wb') as file_obj:
+            file_obj.write(payload)
+        os.replace(tmp_onnx_path, config.onnx_path)
+
+        manifest = dict(pipeline.manifest,
+                        model_class=f"{type(model).__module__}.{type(model).__qualname__}",
+                        float64=is_linear_model(model),
+                        size_bytes=len(payload),
+                        parity={'rows': len(features), 'max_abs_diff': max_abs_diff,
+                                'mean_abs_diff': float(difference.mean()),
+                                'tolerance': config.parity_tolerance,
+                                'max_rounding_bound': float(allowed.max() - config.parity_tolerance)},
+                        created_at=time.time())
+        # the manifest is written last , a graph without a matching manifest is never served
+        tmp_manifest_path = f"{config.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest_path, 'w') as file_obj:
+            json.dump(manifest, file_obj, indent=2)
+        os.replace(tmp_manifest_path, config.manifest_path)
+        logging.info(f"ONNX graph of model {version} written in {time.perf_counter() - started:.1f}s , "
+                     f"max difference to sklearn {max_abs_diff:.2g}")
+        return manifest
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+class OnnxPipeline:
+    """
+    Preprocessor + model in one onnxruntime session. It stands in for both the preprocessor and the model
+    of LoadedArtifacts : transform / transform_record build the graph inputs , predict runs the graph.
+    """
+    def __init__(self, session, manifest):
+        self.session = session
+        self.manifest = manifest
+        self.version = manifest['version']
+        self.categorical_columns = list(manifest['categorical_columns'])
+        self.categorical_fill_values = list(manifest['categorical_fill_values'])
+        # fitted categories of every categorical column , None in the manifests of older exports
+        self.categories = manifest.get('categories')
+        self.numerical_columns = list(manifest['numerical_columns'])
+        self.output_name = session.get_outputs()[0].name
+
+    def transform(self, features):
+        # (n , 1) column vectors , missing categories get the imputed category like the SimpleImputer
+        inputs = {}
+        for column in self.numerical_columns:
+            inputs[column] = features[column].to_numpy(dtype=np.float64, na_value=np.nan).reshape(-1, 1)
+        for column, fill_value in zip(self.categorical_columns, self.categorical_fill_values):
+            values = features[column].to_numpy(dtype=object)
+            values = np.where(values != values, fill_value, values)      # only NaN is missing , like the imputer
+            inputs[column] = values.astype(str).astype(object).reshape(-1, 1)
+        return inputs
+
+    def transform_record(self, record):
+        inputs = {}
+        for column in self.numerical_columns:
+            value = record.get(column)
+            inputs[column] = np.array([[np.nan if value is None else float(value)]])
+        for column, fill_value in zip(self.categorical_columns, self.categorical_fill_values):
+            value = record.get(column)
+            if isinstance(value, float) and value != value:
+                value = fill_value
+            inputs[column] = np.array([[str(value)]], dtype=object)
+        return inputs
+
+    def predict(self, inputs):
+        return self.session.run([self.output_name], inputs)[0].reshape(-1).astype(np.float64)
+
+
+def load_onnx_pipeline(artifacts_dir, version, threads=1):
+    """
+    OnnxPipeline of the given model version , None when there is no graph or it belongs to another model.
+    """
+    manifest_path = onnx_manifest_path(artifacts_dir)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path) as file_obj:
+            manifest = json.load(file_obj)
+        if manifest.get('version') != version:
+            logging.info(f"ONNX graph is for model {manifest.get('version')} , not {version} , not used")
+            return None
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        # every gunicorn worker is a process of its own , more threads per session only compete for the cores
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = onnxruntime.InferenceSession(onnx_model_path(artifacts_dir), options,
+                                               providers=['CPUExecutionProvider'])
+        return OnnxPipeline(session, manifest)
+    except Exception as e:
+        # the sklearn path is still there , so a broken graph only costs the lightweight runtime
+        logging.info(f"ONNX graph not loaded: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    # export the current artifacts , e.g. python -m src.pipeline.onnx_pipeline
+    print(json.dumps(export_onnx(), indent=2))
@@ -1,37 +1,292 @@
 # import basic libraries
 import sys 
 import os
-import pandas as pd
+import json
+import numpy as np
+# pandas is imported by the functions which build DataFrames , the single record path (compiled
+# preprocessor) never needs it , so importing the web app stays fast
 # handle the exceptions 
 from src.exception import CustomException
-# for the load pickle object for predictions 
-from src.utils import load_object
+# process level cache of the pickle objects for predictions 
+from src.pipeline.model_registry import get_registry
+# latency of the prediction stages for /metrics
+from src.pipeline.metrics import metrics, STAGE_METRIC
+
+# input columns of the preprocessor , in the same order as CustomData builds them
+CATEGORICAL_COLUMNS = ['gender',
+                       'race_ethnicity',
+                       'parental_level_of_education',
+                       'lunch',
+                       'test_preparation_course']
+SCORE_COLUMNS = ['reading_score', 'writing_score']
+FEATURE_COLUMNS = CATEGORICAL_COLUMNS + SCORE_COLUMNS
+# the json api (and the html form) send race_ethnicity as ethnicity
+FIELD_ALIASES = {'ethnicity': 'race_ethnicity'}
+# column -> name of the field in the error messages , the same name as the single record path of the api
+FIELD_NAMES = {column: alias for alias, column in FIELD_ALIASES.items()}
+
+
+class InvalidRecord(ValueError):
+    # a record which fails the validation , the api answers it with 400 instead of a prediction
+    pass
 
 
 class PredictPipeline:
-    def __init__(self):
-        pass
+    def __init__(self, registry=None, cache=None):
+        # model and preprocessor are loaded once per process by the registry , not on every request
+        self.registry = registry or get_registry()
+        # optional PredictionCache , repeated records skip the transform and the predict
+        self.cache = cache
+
+    def _active_cache(self, n_records=1):
+        cache = self.cache
+        if cache is None or not cache.enabled or n_records > cache.cache_config.max_batch_lookup:
+            return None
+        return cache
+
+    @property
+    def model_version(self):
+        return self.registry.version
+
     def predict(self,features):
         try:
-            model_path = 'artifacts\\model.pkl'
-            preprocessor_path = 'artifacts\\preprocessor.pkl'
-            # for the linux 
-            
-            # load the data for predictions 
-            model = load_object(file_path = model_path)
-            preprocessor = load_object(file_path = preprocessor_path)
+            # current snapshot of the artifacts , it can be hot swapped by the registry between the requests
+            artifacts = self.registry.get()
+            model = artifacts.model
+            preprocessor = artifacts.preprocessor
             # scaled the input features 
             
             # if there is not model and preprocessor then do this by default 
             if model is None or preprocessor is None:
                 mock_prediction = (features['reading_score'].iloc[0] + features['writing_score'].loc[0] / 2) 
                 return mock_prediction
-            data_scaled = preprocessor.transform(features)
-            preds = model.predict(data_scaled)
+            with metrics.time(STAGE_METRIC, stage='transform', mode='single'):
+                data_scaled = preprocessor.transform(features)
+            with metrics.time(STAGE_METRIC, stage='predict', mode='single'):
+                preds = model.predict(data_scaled)
             return preds
         except Exception as e:
             raise CustomException(e,sys)
         # return the preds 
+
+    def predict_record(self, record):
+        """
+        Predict one validated record (dict with the FEATURE_COLUMNS , ethnicity is accepted too).
+        Uses the compiled preprocessor so no DataFrame is built , falls back to the sklearn path otherwise.
+        Raises InvalidRecord for a categorical value which the preprocessor was not fitted with.
+        """
+        try:
+            artifacts = self.registry.get()
+            record = normalize_record(record)
+            check_categories(record, artifacts.categories)
+            if artifacts.lookup_table is not None:
+                # materialized domain , one array lookup instead of transform + predict
+                with metrics.time(STAGE_METRIC, stage='lookup', mode='single'):
+                    prediction = artifacts.lookup_table.lookup(record)
+                if prediction is not None:
+                    return prediction
+            cache = self._active_cache()
+            if cache is not None:
+                cached = cache.get(artifacts.version, record)
+                if cached is not None:
+                    return cached
+            if artifacts.compiled_preprocessor is not None:
+                with metrics.time(STAGE_METRIC, stage='transform', mode='single'):
+                    data_scaled = artifacts.compiled_preprocessor.transform_record(record)
+            else:
+                with metrics.time(STAGE_METRIC, stage='dataframe', mode='single'):
+                    features = CustomData(**record).get_data_as_data_frame()
+                with metrics.time(STAGE_METRIC, stage='transform', mode='single'):
+                    data_scaled = artifacts.preprocessor.transform(features)
+            with metrics.time(STAGE_METRIC, stage='predict', mode='single'):
+                prediction = float(artifacts.model.predict(data_scaled)[0])
+            if cache is not None:
+                cache.put(artifacts.version, record, prediction)
+            return prediction
+        except InvalidRecord:
+            raise
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def predict_batch(self, records):
+        """
+        Predict a list of student records (dicts) in one vectorized transform + predict call.
+        Returns one result per record, in the same order , invalid records get an error
+        instead of a prediction and do not fail the rest of the batch.
+        """
+        try:
+            # one snapshot for the whole batch , the cache keys must belong to the model which predicted
+            artifacts = self.registry.get()
+            with metrics.time(STAGE_METRIC, stage='dataframe', mode='batch'):
+                features, errors = validate_records(records, artifacts.categories)
+            valid = errors.isna().to_numpy()
+            # with a lookup table the cache would only keep copies of the table
+            cache = self._active_cache(len(records)) if artifacts.lookup_table is None else None
+            if cache is not None:
+                predictions = self._predict_cached(features, valid, artifacts, cache)
+            else:
+                predictions = self.predict_valid(features, errors, artifacts)
+
+            results = []
+            for index, (is_valid, prediction, error) in enumerate(zip(valid, predictions, errors)):
+                if is_valid:
+                    results.append({'index': index, 'success': True, 'prediction': round(float(prediction), 1)})
+                else:
+                    results.append({'index': index, 'success': False, 'error': error})
+            return results
+        except Exception as e:
+            raise CustomException(e,sys)
+
+
+    def predict_frame(self, features):
+        """
+        Validate and predict a DataFrame of records (e.g. a chunk of a csv file) column wise.
+        Returns (predictions with NaN for the invalid rows , Series of the error messages).
+        """
+        try:
+            artifacts = self.registry.get()
+            features, errors = validate_frame(features, categories=artifacts.categories)
+            return self.predict_valid(features, errors, artifacts), errors
+        except Exception as e:
+            raise CustomException(e,sys)
+
+    def predict_valid(self, features, errors, artifacts=None):
+        # one vectorized transform + predict over the valid rows , NaN for the others
+        return self._predict_rows(features, errors.isna().to_numpy(), artifacts or self.registry.get())
+
+    def _predict_cached(self, features, valid, artifacts, cache):
+        # small batches (micro batches) : cached rows are taken from the cache , only the others are predicted
+        rows = features.to_dict(orient='records')
+        predictions = np.full(len(rows), np.nan)
+        missing = valid.copy()
+        for index in np.flatnonzero(valid):
+            cached = cache.get(artifacts.version, rows[index])
+            if cached is not None:
+                predictions[index] = cached
+                missing[index] = False
+        if missing.any():
+            predictions[missing] = self._predict_rows(features, missing, artifacts)[missing]
+            for index in np.flatnonzero(missing):
+                cache.put(artifacts.version, rows[index], predictions[index])
+        return predictions
+
+    def _predict_rows(self, features, valid, artifacts):
+        predictions = np.full(len(features), np.nan)
+        if artifacts.lookup_table is not None and valid.any():
+            # rows inside of the materialized domain come from the lookup table , only the others from the model
+            with metrics.time(STAGE_METRIC, stage='lookup', mode='batch'):
+                table_predictions, found = artifacts.lookup_table.lookup_frame(features)
+            found &= valid
+            predictions[found] = table_predictions[found]
+            valid = valid & ~found
+        if valid.any():
+            # compiled transform gives the same output as the sklearn one , just without walking the pipelines
+            preprocessor = artifacts.compiled_preprocessor or artifacts.preprocessor
+            with metrics.time(STAGE_METRIC, stage='transform', mode='batch'):
+                data_scaled = preprocessor.transform(features.loc[valid, FEATURE_COLUMNS])
+            with metrics.time(STAGE_METRIC, stage='predict', mode='batch'):
+                predictions[valid] = artifacts.model.predict(data_scaled)
+        return predictions
+
+
+def normalize_record(record):
+    # api field names -> preprocessor column names , only the feature columns are kept
+    record = dict(record)
+    for alias, column in FIELD_ALIASES.items():
+        if alias in record and record.get(column) is None:
+            record[column] = record[alias]
+    return {column: record.get(column) for column in FEATURE_COLUMNS}
+
+
+def validate_records(records, categories=None):
+    """
+    Column wise validation of a batch of records , categories (column -> fitted categories) rejects the unknown ones.
+    Returns the feature DataFrame and a Series with the first error message of every row (NaN when the row is valid).
+    """
+    import pandas as pd
+    # rows which are not json objects are replaced by an empty row and flagged
+    not_object = [not isinstance(record, dict) for record in records]
+    features = pd.DataFrame.from_records([{} if bad else record for record, bad in zip(records, not_object)],
+                                         index=range(len(records)))
+    errors = pd.Series(np.where(not_object, 'Record must be a JSON object', None), index=features.index, dtype=object)
+    return validate_frame(features, errors, categories)
+
+
+def validate_frame(features, errors=None, categories=None):
+    """
+    Column wise validation of a DataFrame of records , same rules as validate_records.
+    """
+    import pandas as pd
+    features = features.reset_index(drop=True)
+    if errors is None:
+        errors = pd.Series(None, index=features.index, dtype=object)
+
+    for alias, column in FIELD_ALIASES.items():
+        if alias in features.columns:
+            features[column] = features[alias] if column not in features.columns else features[column].fillna(features[alias])
+    for column in FEATURE_COLUMNS:
+        if column not in features.columns:
+            features[column] = None
+
+    def flag(mask, message):
+        # keep only the first error for each row
+        mask = mask & errors.isna()
+        errors[mask] = message
+
+    for column in FEATURE_COLUMNS:
+        flag(features[column].isna(), f'Missing required field: {FIELD_NAMES.get(column, column)}')
+
+    for column in SCORE_COLUMNS:
+        scores = pd.to_numeric(features[column], errors='coerce')
+        flag(scores.isna(), 'Invalid score values')
+        flag((scores < 0) | (scores > 100), 'Scores must be between 0 and 100')
+        features[column] = scores
+
+    for column in CATEGORICAL_COLUMNS:
+        features[column] = features[column].astype(str)
+        # the one hot encoder ignores unknown categories , the model would predict from an all zero block
+        if categories is not None and column in categories:
+            flag(~features[column].isin(categories[column]), unknown_category_message(column, categories[column]))
+
+    return features[FEATURE_COLUMNS], errors
+
+
+def unknown_category_message(column, known):
+    return f"Unknown value of {FIELD_NAMES.get(column, column)} , expected one of: {', '.join(sorted(known))}"
+
+
+def check_categories(record, categories):
+    # same domain check as validate_frame for one normalized record , raises InvalidRecord
+    if categories is None:
+        return
+    for column in CATEGORICAL_COLUMNS:
+        known = categories.get(column)
+        if known is not None and str(record.get(column)) not in known:
+            raise InvalidRecord(unknown_category_message(column, known))
+
+
+def parse_batch_records(body, content_type=''):
+    """
+    Parse the body of a batch request , either a JSON array or NDJSON (one JSON object per line).
+    Raises ValueError when the body can not be parsed.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    if 'ndjson' in (content_type or '') or not body.lstrip().startswith('['):
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # broken line is reported as an error for that row only
+                records.append(None)
+        return records
+    records = json.loads(body)
+    if not isinstance(records, list):
+        raise ValueError('Body must be a JSON array or NDJSON')
+    return records
         
         
         
@@ -57,6 +312,7 @@ class CustomData:
         
         
     def get_data_as_data_frame(self):
+        import pandas as pd
         try:
             custom_data_input_dict = {
                     "gender" : [self.gender],
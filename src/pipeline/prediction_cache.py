@@ -0,0 +1,227 @@
+# cache of the predictions , keyed on the normalized record + the model version
+# the input space is small (5 low cardinality categoricals + 2 scores) and many requests are exact repeats ,
+# so a hit skips the transform and the predict completely
+# backends :
+#   memory   LRU + TTL inside the worker process
+#   sqlite   one WAL mode sqlite file shared by all the gunicorn workers of the host (approximate LRU + TTL)
+# the model version is part of the key , and the registry listener drops the old entries on a hot swap
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from src.logger import logging
+from src.pipeline.metrics import metrics
+
+# same order as FEATURE_COLUMNS of predict_pipeline
+KEY_COLUMNS = ['gender', 'race_ethnicity', 'parental_level_of_education', 'lunch', 'test_preparation_course',
+               'reading_score', 'writing_score']
+
+
+@dataclass
+class PredictionCacheConfig:
+    # off by default , PREDICTION_CACHE=memory or sqlite enables it
+    backend: str = os.environ.get('PREDICTION_CACHE', 'off')
+    max_entries: int = int(os.environ.get('PREDICTION_CACHE_MAX_ENTRIES', 100000))
+    # seconds an entry is valid , 0 means until it is evicted or the model changes
+    ttl_seconds: float = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+    # file of the sqlite backend , shared by every worker which uses the same path
+    sqlite_path: str = os.environ.get('PREDICTION_CACHE_PATH',
+                                      os.path.join(tempfile.gettempdir(), 'mlproject_prediction_cache.sqlite'))
+    # batches up to this size are looked up row by row (micro batches) , bigger ones skip the cache
+    max_batch_lookup: int = 256
+
+
+def cache_key(version, record):
+    # record is normalized (preprocessor column names) , 70 and 70.0 are the same score
+    values = [str(record[column]) for column in KEY_COLUMNS[:5]]
+    values += [repr(float(record[column])) for column in KEY_COLUMNS[5:]]
+    return version + '\x1f' + '\x1f'.join(values)
+
+
+class MemoryBackend:
+    def __init__(self, config: PredictionCacheConfig):
+        self.cache_config = config
+        self._entries = OrderedDict()   # key -> (prediction , expires at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] and entry[1] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, prediction):
+        expires_at = time.monotonic() + self.cache_config.ttl_seconds if self.cache_config.ttl_seconds else 0
+        with self._lock:
+            self._entries[key] = (prediction, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.cache_config.max_entries:
+                self._entries.popitem(last=False)
+
+    def drop_versions_except(self, version):
+        with self._lock:
+            self._entries = OrderedDict((key, entry) for key, entry in self._entries.items()
+                                        if key.startswith(version + '\x1f'))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+class SqliteBackend:
+    # last_used is only written again when it is older than touch_interval , so most hits are pure reads
+    touch_interval = 60.0
+    # the size limit is enforced every this many puts
+    evict_every = 1000
+
+    def __init__(self, config: PredictionCacheConfig):
+        self.cache_config = config
+        self._local = threading.local()
+        self._puts = 0
+
+    def _connection(self):
+        # sqlite connections must not cross a fork or be shared by threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.cache_config.sqlite_path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.cache_config.sqlite_path, timeout=0.05, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # a cache can lose its last writes on a crash , no fsync on every put
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute('CREATE TABLE IF NOT EXISTS predictions '
+                               '(key TEXT PRIMARY KEY, prediction REAL, expires_at REAL, last_used REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute('SELECT prediction, expires_at, last_used FROM predictions WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        prediction, expires_at, last_used = row
+        if expires_at and expires_at < now:
+            return None
+        if now - last_used > self.touch_interval:
+            connection.execute('UPDATE predictions SET last_used = ? WHERE key = ?', (now, key))
+        return prediction
+
+    def put(self, key, prediction):
+        connection = self._connection()
+        now = time.time()
+        expires_at = now + self.cache_config.ttl_seconds if self.cache_config.ttl_seconds else 0
+        connection.execute('INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)', (key, prediction, expires_at, now))
+        self._puts += 1
+        if self._puts % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM predictions WHERE expires_at > 0 AND expires_at < ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+        if count > self.cache_config.max_entries:
+            connection.execute('DELETE FROM predictions WHERE key IN '
+                               '(SELECT key FROM predictions ORDER BY last_used LIMIT ?)',
+                               (count - self.cache_config.max_entries,))
+
+    def drop_versions_except(self, version):
+        self._connection().execute('DELETE FROM predictions WHERE substr(key, 1, ?) != ?',
+                                   (len(version) + 1, version + '\x1f'))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+
+BACKENDS = {'memory': MemoryBackend, 'sqlite': SqliteBackend}
+
+
+class PredictionCache:
+    def __init__(self, config: PredictionCacheConfig = None):
+        self.cache_config = config or PredictionCacheConfig()
+        if self.cache_config.backend not in BACKENDS and self.cache_config.backend != 'off':
+            raise ValueError(f"Unknown prediction cache backend: {self.cache_config.backend}")
+        self.backend = BACKENDS[self.cache_config.backend](self.cache_config) if self.enabled else None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def enabled(self):
+        return self.cache_config.backend != 'off'
+
+    def attach(self, registry):
+        # drop the results of the old model when the registry swaps it
+        registry.add_listener(self.on_model_swap)
+        return self
+
+    def on_model_swap(self, old_version, new_version):
+        if self.enabled:
+            logging.info(f"Prediction cache invalidated , model {old_version} -> {new_version}")
+            self.backend.drop_versions_except(new_version)
+
+    def get(self, version, record):
+        # cached prediction or None , a failing backend is a miss and never fails the prediction
+        try:
+            prediction = self.backend.get(cache_key(version, record))
+        except Exception as e:
+            self._error(e)
+            prediction = None
+        if prediction is None:
+            self.misses += 1
+            metrics.inc('prediction_cache_requests_total', {'result': 'miss'})
+        else:
+            self.hits += 1
+            metrics.inc('prediction_cache_requests_total', {'result': 'hit'})
+        return prediction
+
+    def put(self, version, record, prediction):
+        try:
+            self.backend.put(cache_key(version, record), float(prediction))
+        except Exception as e:
+            self._error(e)
+
+    def _error(self, e):
+        # e.g. sqlite is locked by another worker for longer than the timeout
+        self.errors += 1
+        metrics.inc('prediction_cache_errors_total', {'error_class': type(e).__name__})
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            entries = len(self.backend) if self.enabled else 0
+        except Exception:
+            entries = None
+        return {'backend': self.cache_config.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'entries': entries}
+
+    def _after_fork(self):
+        self.hits, self.misses, self.errors = 0, 0, 0
+        if self.backend is not None:
+            self.backend._after_fork()
+
+
+metrics.describe('prediction_cache_requests_total', 'counter', 'Prediction cache lookups by result (hit / miss)')
+metrics.describe('prediction_cache_errors_total', 'counter', 'Prediction cache backend errors')
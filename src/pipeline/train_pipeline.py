@@ -0,0 +1,107 @@
+# end to end training : data ingestion -> data transformation -> model trainer
+# the transformed arrays are cached by content (see feature_cache.py) , so when only the models change
+# the ingestion and the transformation are skipped
+# TRAINING_MODE=incremental only updates the model with the rows appended to the source (see incremental_trainer.py)
+import os
+import sys
+from dataclasses import dataclass
+
+from src.exception import CustomException
+from src.logger import logging
+from src.components.data_ingestion import DataIngestion
+from src.components.data_transformation import DataTransformation
+from src.components.model_trainer import ModelTrainer
+from src.components.feature_cache import FeatureCache, restore_file
+from src.components.streaming_ingestion import StreamingDataIngestion, StreamingIngestionConfig
+from src.components.streaming_transformation import StreamingDataTransformation
+from src.components.incremental_trainer import IncrementalTrainer, IncrementalTrainingConfig
+
+
+@dataclass
+class TrainPipelineConfig:
+    # FEATURE_CACHE=0 always runs the ingestion and the transformation again
+    use_feature_cache: bool = os.environ.get('FEATURE_CACHE', '1') != '0'
+    # 'memory' reads the whole dataset with pandas , 'streaming' works chunk by chunk for the sources bigger than memory
+    ingestion_mode: str = os.environ.get('INGESTION_MODE', 'memory')
+    # 'full' runs ingestion -> transformation -> model search , 'incremental' warm starts the model on the new rows
+    training_mode: str = os.environ.get('TRAINING_MODE', 'full')
+
+
+class TrainPipeline:
+    def __init__(self, config: TrainPipelineConfig = None):
+        self.train_pipeline_config = config or TrainPipelineConfig()
+        self.data_ingestion = DataIngestion()
+        self.data_transformation = DataTransformation()
+        self.model_trainer = ModelTrainer()
+        self.feature_cache = FeatureCache()
+        if self.train_pipeline_config.ingestion_mode == 'streaming':
+            ingestion_config = self.data_ingestion.ingestion_config
+            # the streaming components append csv chunks , so the splits are always csv here
+            self.streaming_ingestion = StreamingDataIngestion(StreamingIngestionConfig(
+                train_data_path=os.path.splitext(ingestion_config.train_data_path)[0] + '.csv',
+                test_data_path=os.path.splitext(ingestion_config.test_data_path)[0] + '.csv',
+                source_data_path=ingestion_config.source_data_path,
+                test_size=ingestion_config.test_size,
+                random_state=ingestion_config.random_state))
+            self.streaming_transformation = StreamingDataTransformation()
+        # report of the last incremental run
+        self.incremental_report = None
+
+    def _cache_key(self):
+        ingestion_config = self.data_ingestion.ingestion_config
+        split_settings = {'test_size': ingestion_config.test_size,
+                          'random_state': ingestion_config.random_state,
+                          'mode': self.train_pipeline_config.ingestion_mode}
+        return self.feature_cache.key(ingestion_config.source_data_path,
+                                      split_settings,
+                                      self.data_transformation.get_data_transformer_object())
+
+    def build_features(self, use_cache=None):
+        """
+        Returns (train_arr , test_arr , preprocessor path) , from the cache when the raw data , the split
+        and the preprocessor config did not change.
+        """
+        try:
+            preprocessor_path = self.data_transformation.data_transformation_config.preprocessor_obj_file_path
+            key = None
+            if use_cache is None:
+                use_cache = self.train_pipeline_config.use_feature_cache
+            if use_cache:
+                key = self._cache_key()
+                cached = self.feature_cache.load(key)
+                if cached is not None:
+                    train_arr, test_arr, cached_preprocessor_path = cached
+                    # the served preprocessor must belong to the arrays the model is trained on
+                    restore_file(cached_preprocessor_path, preprocessor_path)
+                    return train_arr, test_arr, preprocessor_path
+
+            if self.train_pipeline_config.ingestion_mode == 'streaming':
+                train_data_path, test_data_path, train_rows, test_rows = \
+                    self.streaming_ingestion.initiate_data_ingestion()
+                train_arr, test_arr, preprocessor_path = self.streaming_transformation.initiate_data_transformation(
+                    train_data_path, test_data_path, train_rows, test_rows)
+            else:
+                train_data_path, test_data_path = self.data_ingestion.initiate_data_ingestion()
+                train_arr, test_arr, preprocessor_path = self.data_transformation.initiate_data_transformation(
+                    train_data_path, test_data_path)
+            if key is not None:
+                self.feature_cache.save(key, train_arr, test_arr, preprocessor_path)
+            return train_arr, test_arr, preprocessor_path
+        except Exception as e:
+            raise CustomException(e, sys)
+
+    def run(self):
+        try:
+            if self.train_pipeline_config.training_mode == 'incremental':
+                self.incremental_report = IncrementalTrainer(self, IncrementalTrainingConfig()).run()
+                return self.incremental_report['r2']
+            train_arr, test_arr, _ = self.build_features()
+            r2_square = self.model_trainer.initiate_model_trainer(train_arr, test_arr)
+            logging.info(f"Training pipeline finished with test r2 {r2_square}")
+            return r2_square
+        except Exception as e:
+            raise CustomException(e, sys)
+
+
+if __name__ == "__main__":
+    print(TrainPipeline().run())
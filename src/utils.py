@@ -1,14 +1,11 @@
 # comman functionalitis which use by entire project
+# numpy , pandas and sklearn are imported inside the functions which need them , the web app imports this
+# module too (load_object) and should not pay for the training libraries on every cold start
 import os 
 import sys
-import numpy as np 
-import pandas as pd
+import time
 import dill
-from sklearn.model_selection import GridSearchCV
-# model evaluation , performance metrics
-from sklearn.metrics import r2_score
 
-# For the hyperparamter tuning
 from src.exception import CustomException
 from src.logger import logging
 
@@ -17,28 +14,75 @@ def save_object(file_path,obj):
         dir_path = os.path.dirname(file_path)
         os.makedirs(dir_path,exist_ok = 1)
         
-        with open(file_path, 'wb',) as file_obj:
+        # write into a temporary file and then rename it , so the running app (model registry)
+        # never reads a half written pickle file
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(tmp_file_path, 'wb',) as file_obj:
             dill.dump(obj,file_obj)
+        os.replace(tmp_file_path, file_path)
     except Exception as e:
         raise CustomException(e,sys)
     
     
 # function for evaluating the model performation 
-def evaluate_models(X_train,y_train,X_test,y_test,models,params):
+def evaluate_models(X_train,y_train,X_test,y_test,models,params,checkpoint=None):
+    # For the hyperparamter tuning
+    # GridSearchCV only returns when the whole grid of a model is done , so the grid is walked here
+    # (same folds , same r2 scoring , first best candidate wins) and every fold result can go to the checkpoint
+    import numpy as np
+    from sklearn.base import clone
+    from sklearn.model_selection import ParameterGrid, KFold
+    # model evaluation , performance metrics
+    from sklearn.metrics import r2_score
+    from src.components.search_checkpoint import candidate_key
     try:
         report = {}
+        # the same 3 folds as cv = 3 , split once and reused by the search of every model
+        folds = list(KFold(n_splits = 3).split(X_train))
         for model_name , model in models.items():
             
-            model.fit(X_train,y_train)  # fit the trainig data 
             param = params[model_name] # getting the parameters and after i am use the values of perticular model 
             
-            gs = GridSearchCV(model,param,cv = 3)
-            # train the model with using the hyperparameter
-            gs.fit(X_train,y_train) # train our model 
-            logging.info("Model Trained by GridSearchCV.")
+            best_params , best_score = {} , -np.inf
+            for candidate in ParameterGrid(param):
+                estimator = clone(model).set_params(**candidate)
+                key = candidate_key(estimator) if checkpoint is not None else None
+                scores = []
+                for fold_index , (train_index , validation_index) in enumerate(folds):
+                    saved = checkpoint.fold_result(key , fold_index) if key else None
+                    if saved is not None:
+                        scores.append(saved['score']) # already done by an earlier run
+                        continue
+                    try:
+                        started = time.perf_counter()
+                        fold_model = clone(estimator).fit(X_train[train_index],y_train[train_index])
+                        fit_seconds = time.perf_counter() - started
+                        started = time.perf_counter()
+                        score = r2_score(y_train[validation_index],fold_model.predict(X_train[validation_index]))
+                        score_seconds = time.perf_counter() - started
+                    except Exception as e:
+                        # like error_score = nan of GridSearchCV , a broken candidate does not stop the search
+                        logging.info(f"Cross validation fit of {model_name} {candidate} failed: {e}")
+                        scores.append(np.nan)
+                        continue
+                    scores.append(score)
+                    if key:
+                        checkpoint.record_fold(model_name , key , candidate , fold_index , score , fit_seconds , score_seconds)
+                mean_score = np.mean(scores)
+                if mean_score > best_score: # nan never wins
+                    best_params , best_score = candidate , mean_score
+            logging.info(f"{model_name} cross validated , best params {best_params}")
             # setting the best parameters required for the best performance 
-            model.set_params(**gs.best_params_) # for each perticular model i am setting there best parameteres
-            model.fit(X_train,y_train) # then again i am train my model with using those hyperparametes 
+            model.set_params(**best_params) # for each perticular model i am setting there best parameteres
+            key = candidate_key(model) if checkpoint is not None else None
+            saved = checkpoint.best_estimator(model_name , key) if key else None
+            if saved is not None:
+                model = models[model_name] = saved[0] # fitted by an earlier run with the same params
+            else:
+                started = time.perf_counter()
+                model.fit(X_train,y_train) # then again i am train my model with using those hyperparametes 
+                if key:
+                    checkpoint.save_best(model_name , key , best_params , model , time.perf_counter() - started)
             
             y_train_pred = model.predict(X_train)       # prediction of model on training data
             y_test_pred = model.predict(X_test)         # prediction of model on testing data
@@ -48,8 +92,10 @@ def evaluate_models(X_train,y_train,X_test,y_test,models,params):
             
             # store the test score in dictionay
             report[model_name]  =  test_model_score
+            if checkpoint is not None:
+                checkpoint.record_test_score(model_name , test_model_score)
             
-            return report
+        return report
     except Exception as e:
         raise CustomException(e,sys)    
     
@@ -60,4 +106,121 @@ def load_object(file_path):
             return dill.load(file_obj)
         
     except Exception as e:
-        raise CustomException(e,sys)        
\ No newline at end of file
+        raise CustomException(e,sys)        
+
+# file extension of every supported format for the dataset artifacts (raw / train / test)
+ARTIFACT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather', 'npz': '.npz'}
+
+
+def artifact_format_of(file_path):
+    extension = os.path.splitext(file_path)[1]
+    for artifact_format, format_extension in ARTIFACT_FORMATS.items():
+        if extension == format_extension:
+            return artifact_format
+    raise ValueError(f"Unknown artifact format of {file_path}")
+
+
+def apply_dtypes(df, dtypes):
+    # explicit dtypes , the categorical columns become pandas categoricals (dictionary encoded in parquet / feather)
+    return df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+
+
+def save_dataframe(file_path, df):
+    """
+    Save a DataFrame in the format of the file extension (.csv , .parquet , .feather , .npz).
+    In .npz every column is one array , the categoricals are stored as codes + categories.
+    """
+    import numpy as np
+    import pandas as pd
+    try:
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        artifact_format = artifact_format_of(file_path)
+        tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        if artifact_format == 'csv':
+            df.to_csv(tmp_file_path, index=False, header=True)
+        elif artifact_format == 'parquet':
+            df.to_parquet(tmp_file_path, engine='pyarrow', index=False)
+        elif artifact_format == 'feather':
+            df.reset_index(drop=True).to_feather(tmp_file_path)
+        else:
+            arrays = {}
+            for column in df.columns:
+                if isinstance(df[column].dtype, pd.CategoricalDtype):
+                    arrays[f"{column}.codes"] = df[column].cat.codes.to_numpy()
+                    arrays[f"{column}.categories"] = df[column].cat.categories.to_numpy(dtype=str)
+                else:
+                    arrays[column] = df[column].to_numpy()
+            with open(tmp_file_path, 'wb') as file_obj:
+                np.savez_compressed(file_obj, **arrays)
+        os.replace(tmp_file_path, file_path)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+def load_dataframe(file_path, columns=None):
+    """
+    Load a DataFrame saved by save_dataframe , the columnar formats read only the given columns.
+    """
+    import numpy as np
+    import pandas as pd
+    try:
+        artifact_format = artifact_format_of(file_path)
+        if artifact_format == 'csv':
+            return pd.read_csv(file_path, usecols=columns)
+        if artifact_format == 'parquet':
+            return pd.read_parquet(file_path, engine='pyarrow', columns=columns)
+        if artifact_format == 'feather':
+            return pd.read_feather(file_path, columns=columns)
+
+        with np.load(file_path, allow_pickle=False) as arrays:
+            available = []
+            for key in arrays.files:
+                column = key[:-len('.codes')] if key.endswith('.codes') else key
+                if not key.endswith('.categories') and column not in available:
+                    available.append(column)
+            data = {}
+            for column in (columns or available):
+                if f"{column}.codes" in arrays.files:
+                    data[column] = pd.Categorical.from_codes(arrays[f"{column}.codes"],
+                                                             categories=arrays[f"{column}.categories"])
+                else:
+                    data[column] = arrays[column]
+            return pd.DataFrame(data)
+    except Exception as e:
+        raise CustomException(e, sys)
+
+
+# memory of a process from /proc/<pid>/status (linux only) , VmRSS is the current resident set and VmHWM its peak
+# returns MB , or None when it can not be read (other platforms , process gone)
+def process_memory_mb(pid='self', field='VmRSS'):
+    try:
+        with open(f'/proc/{pid}/status') as file_obj:
+            for line in file_obj:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def process_smaps_mb(pid='self', field='Pss'):
+    # Pss = the private pages + this process' share of the pages it shares with others (e.g. the forked workers) ,
+    # summing the Pss of all the workers gives the real memory use , summing the RSS counts shared pages many times
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as file_obj:
+            for line in file_obj:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_memory():
+    # writing 5 into clear_refs resets VmHWM of this process , so the next peak belongs to one stage / fit only
+    try:
+        with open('/proc/self/clear_refs', 'w') as file_obj:
+            file_obj.write('5')
+        return True
+    except OSError:
+        return False
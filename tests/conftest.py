@@ -0,0 +1,55 @@
+# shared setup of the tests , run from the repository root : python -m pytest
+# the environment is set before src.logger and the configs are imported , they read it on import
+import os
+import tempfile
+
+_TEST_DIR = tempfile.mkdtemp(prefix='mlproject_tests_')
+# log file and metrics snapshots of the test run go to a temporary directory , not into the repository
+os.environ.setdefault('LOG_DIR', os.path.join(_TEST_DIR, 'logs'))
+os.environ.setdefault('LOG_MODE', 'sync')
+os.environ.setdefault('METRICS_DIR', os.path.join(_TEST_DIR, 'metrics'))
+# the tests load the artifacts themselves , no background loading
+os.environ.setdefault('MODEL_WARM_UP', '0')
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACTS_DIR = os.path.join(ROOT_DIR, 'artifacts')
+DATA_PATH = os.path.join(ROOT_DIR, 'notebook', 'data', 'stud.csv')
+
+
+@pytest.fixture
+def student_data():
+    import pandas as pd
+    return pd.read_csv(DATA_PATH)
+
+
+@pytest.fixture(scope='session')
+def fitted_preprocessor():
+    # the ColumnTransformer of DataTransformation fitted on the student data
+    import pandas as pd
+    from src.components.data_transformation import DataTransformation, TARGET_COLUMN
+    features = pd.read_csv(DATA_PATH).drop(columns=[TARGET_COLUMN])
+    return DataTransformation().get_data_transformer_object().fit(features)
+
+
+def with_edge_cases(features):
+    # missing values and categories which were never seen while fitting , appended to the rows
+    import numpy as np
+    import pandas as pd
+    edge_cases = features.head(5).copy().reset_index(drop=True)
+    edge_cases.loc[0, 'reading_score'] = np.nan
+    edge_cases.loc[1, 'gender'] = np.nan
+    edge_cases.loc[2, 'race_ethnicity'] = 'group Z'
+    edge_cases.loc[3, ['writing_score', 'lunch']] = [np.nan, None]
+    edge_cases.loc[4, 'parental_level_of_education'] = 'unknown degree'
+    return pd.concat([features, edge_cases], ignore_index=True)
+
+
+@pytest.fixture
+def registry():
+    # registry of the tracked artifacts , sklearn backend without a lookup table
+    from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+    return ModelRegistry(ModelRegistryConfig(model_path=os.path.join(ARTIFACTS_DIR, 'model.pkl'),
+                                             preprocessor_path=os.path.join(ARTIFACTS_DIR, 'preprocessor.pkl'),
+                                             use_lookup_table=False, warm_up=False, backend='sklearn'))
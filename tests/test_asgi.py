@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('jinja2')
+
+import asgi
+from src.pipeline.predict_pipeline import PredictPipeline
+
+RECORD = {'gender': 'female', 'ethnicity': 'group B', 'parental_level_of_education': "bachelor's degree",
+          'lunch': 'standard', 'test_preparation_course': 'none', 'reading_score': 72, 'writing_score': 74}
+
+
+def request(method, path, body=b''):
+    # one http request through the ASGI app , returns (status , headers , json body)
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path,
+             'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]}
+    asyncio.run(asgi.application(scope, receive, send))
+    return sent[0]['status'], dict(sent[0]['headers']), json.loads(sent[1]['body'])
+
+
+@pytest.fixture
+def pipeline(registry, monkeypatch):
+    pipeline = PredictPipeline(registry)
+    monkeypatch.setattr(asgi, 'predict_pipeline', pipeline)
+    yield pipeline
+    asgi.executor.shutdown()
+
+
+@pytest.fixture
+def overloaded(monkeypatch):
+    # every slot of the executor is taken
+    monkeypatch.setattr(asgi.executor, 'in_flight', asgi.executor.max_in_flight)
+
+
+def test_predict(pipeline):
+    status, _, payload = request('POST', '/api/predict', json.dumps(RECORD).encode())
+    assert status == 200 and payload['success']
+    status, _, payload = request('POST', '/api/predict', json.dumps(dict(RECORD, ethnicity=None)).encode())
+    assert status == 400 and payload['error'] == 'Missing required field: ethnicity'
+
+
+def test_liveness_is_answered_by_an_overloaded_worker(pipeline, overloaded):
+    status, _, payload = request('GET', '/health/live')
+    assert status == 200 and payload['status'] == 'alive'
+    # the predictions and the readiness wait for the executor , they are rejected
+    status, headers, _ = request('POST', '/api/predict', json.dumps(RECORD).encode())
+    assert status == 503 and headers[b'retry-after'] == b'1'
+    status, _, _ = request('GET', '/health/ready')
+    assert status == 503
+
+
+def test_health_of_a_loaded_model_is_answered_inline(pipeline, monkeypatch):
+    assert request('GET', '/health')[0] == 200
+    assert pipeline.registry.is_loaded
+    monkeypatch.setattr(asgi.executor, 'in_flight', asgi.executor.max_in_flight)
+    status, _, payload = request('GET', '/health')
+    assert status == 200 and payload['pipeline_loaded']
+    # before the first load it needs the executor
+    monkeypatch.setattr(pipeline.registry, '_current', None)
+    assert request('GET', '/health')[0] == 503
+
+
+def test_readiness(pipeline):
+    assert not pipeline.registry.is_loaded
+    status, _, payload = request('GET', '/health/ready')
+    # warm up is switched off in the tests , so it stays loading until the first prediction
+    assert status == 503 and payload['status'] == 'loading'
+    pipeline.registry.get()
+    status, _, payload = request('GET', '/health/ready')
+    assert status == 200 and payload['model_version'] == pipeline.registry.version
@@ -0,0 +1,45 @@
+import os
+
+import pandas as pd
+
+from src.pipeline.batch_predict import BatchPredictConfig, BatchPredictor, read_chunks
+from tests.conftest import ARTIFACTS_DIR, DATA_PATH
+
+
+def run(output_path, resume=False, chunksize=300):
+    config = BatchPredictConfig(input_path=DATA_PATH,
+                                output_path=str(output_path),
+                                model_path=os.path.join(ARTIFACTS_DIR, 'model.pkl'),
+                                preprocessor_path=os.path.join(ARTIFACTS_DIR, 'preprocessor.pkl'),
+                                chunksize=chunksize,
+                                workers=1,
+                                resume=resume)
+    return BatchPredictor(config).run()
+
+
+def test_read_chunks_after_the_last_row_is_empty():
+    rows = len(pd.read_csv(DATA_PATH))
+    assert list(read_chunks(DATA_PATH, 300, skip_rows=rows)) == []
+    chunks = list(read_chunks(DATA_PATH, 300, skip_rows=rows - 10))
+    assert [(first_row, len(chunk)) for first_row, chunk in chunks] == [(rows - 10, 10)]
+
+
+def test_resume_of_a_finished_run(tmp_path):
+    output_path = tmp_path / 'out.csv'
+    summary = run(output_path)
+    expected = output_path.read_bytes()
+    resumed = run(output_path, resume=True)
+    assert resumed['rows'] == 0
+    assert resumed['total_rows'] == summary['total_rows']
+    assert output_path.read_bytes() == expected
+
+
+def test_resume_without_output_starts_over(tmp_path):
+    output_path = tmp_path / 'out.csv'
+    run(output_path)
+    expected = output_path.read_bytes()
+    os.remove(output_path)
+    summary = run(output_path, resume=True)
+    assert summary['rows'] == summary['total_rows']
+    # no zero bytes of the old output size in front
+    assert output_path.read_bytes() == expected
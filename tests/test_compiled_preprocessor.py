@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import OneHotEncoder
+
+from src.components.data_transformation import TARGET_COLUMN
+from src.pipeline.compiled_preprocessor import (CompiledPreprocessor, check_parity, compile_preprocessor,
+                                                known_categories)
+from src.utils import load_object
+from tests.conftest import ARTIFACTS_DIR, with_edge_cases
+
+
+@pytest.fixture
+def features(student_data):
+    return with_edge_cases(student_data.drop(columns=[TARGET_COLUMN]))
+
+
+def dense(matrix):
+    return matrix.toarray() if hasattr(matrix, 'toarray') else matrix
+
+
+def test_transform_matches_sklearn(fitted_preprocessor, features):
+    compiled = CompiledPreprocessor.from_column_transformer(fitted_preprocessor)
+    np.testing.assert_allclose(compiled.transform(features), dense(fitted_preprocessor.transform(features)),
+                               rtol=0, atol=1e-9)
+
+
+def test_transform_record_matches_sklearn(fitted_preprocessor, features):
+    compiled = CompiledPreprocessor.from_column_transformer(fitted_preprocessor)
+    expected = dense(fitted_preprocessor.transform(features))
+    for position, record in enumerate(features.to_dict(orient='records')):
+        np.testing.assert_allclose(compiled.transform_record(record), expected[position:position + 1],
+                                   rtol=0, atol=1e-9)
+
+
+def test_missing_values_are_imputed_like_sklearn(fitted_preprocessor, features):
+    compiled = CompiledPreprocessor.from_column_transformer(fitted_preprocessor)
+    edge_cases = features.tail(5)
+    assert edge_cases.isna().any(axis=1).sum() == 3
+    np.testing.assert_allclose(compiled.transform(edge_cases), dense(fitted_preprocessor.transform(edge_cases)),
+                               rtol=0, atol=1e-9)
+
+
+def test_unknown_category_is_an_all_zero_block(fitted_preprocessor, features):
+    compiled = CompiledPreprocessor.from_column_transformer(fitted_preprocessor)
+    record = features.iloc[-3].to_dict()
+    assert record['race_ethnicity'] == 'group Z'
+    table = compiled.category_index[compiled.categorical_columns.index('race_ethnicity')]
+    row = compiled.transform_record(record)[0]
+    assert not row[list(table.values())].any()
+
+
+def test_saved_preprocessor_parity(features):
+    # the preprocessor.pkl which is served
+    preprocessor = load_object(os.path.join(ARTIFACTS_DIR, 'preprocessor.pkl'))
+    assert check_parity(preprocessor, features)
+
+
+def test_known_categories(fitted_preprocessor):
+    encoder = fitted_preprocessor.named_transformers_['cat_pipeline'].named_steps['one_hot_encoder']
+    expected = {column: frozenset(str(category) for category in categories)
+                for column, categories in zip(fitted_preprocessor.transformers_[1][2], encoder.categories_)}
+    assert known_categories(compile_preprocessor(fitted_preprocessor)) == expected
+    # the sklearn fallback gives the same
+    assert known_categories(fitted_preprocessor) == expected
+
+
+def test_unsupported_encoder_is_not_compiled(fitted_preprocessor):
+    import copy
+    preprocessor = copy.deepcopy(fitted_preprocessor)
+    encoder = preprocessor.named_transformers_['cat_pipeline'].named_steps['one_hot_encoder']
+    assert isinstance(encoder, OneHotEncoder)
+    encoder.handle_unknown = 'error'
+    with pytest.raises(ValueError):
+        CompiledPreprocessor.from_column_transformer(preprocessor)
+    assert compile_preprocessor(preprocessor) is None
@@ -0,0 +1,175 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge, SGDRegressor
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components.data_ingestion import DataIngestionConfig
+from src.components.data_transformation import DataTransformation, TARGET_COLUMN
+from src.components.incremental_trainer import (IncrementalTrainer, IncrementalTrainingConfig, drift_scores,
+                                                hash_prefix)
+from src.components.model_trainer import ModelTrainer, ModelTrainerConfig
+from src.components.streaming_ingestion import hash_split
+from src.model_serializer import load_model, save_model
+from src.utils import load_object, save_object
+from tests.conftest import DATA_PATH
+
+TRAINED_ROWS = 800
+
+
+def make_trainer(tmp_path, model, **config):
+    """
+    Source , split , preprocessor , model and training state of the first TRAINED_ROWS rows of the student data
+    in tmp_path , and an IncrementalTrainer on them. Its full retrain only records the reason.
+    """
+    data = pd.read_csv(DATA_PATH)
+    data.head(TRAINED_ROWS).to_csv(tmp_path / 'stud.csv', index=False)
+    ingestion_config = DataIngestionConfig(train_data_path=str(tmp_path / 'train.csv'),
+                                           test_data_path=str(tmp_path / 'test.csv'),
+                                           source_data_path=str(tmp_path / 'stud.csv'))
+    source = data.head(TRAINED_ROWS)
+    test_mask = hash_split(source, ingestion_config.test_size, ingestion_config.random_state)
+    source[~test_mask].to_csv(ingestion_config.train_data_path, index=False)
+    source[test_mask].to_csv(ingestion_config.test_data_path, index=False)
+
+    features = source[~test_mask].drop(columns=[TARGET_COLUMN])
+    preprocessor = DataTransformation().get_data_transformer_object().fit(features)
+    save_object(str(tmp_path / 'preprocessor.pkl'), preprocessor)
+    trainer_config = ModelTrainerConfig()
+    trainer_config.trained_model_file_path = str(tmp_path / 'model.pkl')
+    save_model(model.fit(preprocessor.transform(features), source[~test_mask][TARGET_COLUMN]),
+               trainer_config.trained_model_file_path)
+
+    retrains = []
+    pipeline = SimpleNamespace(
+        train_pipeline_config=SimpleNamespace(ingestion_mode='memory'),
+        data_ingestion=SimpleNamespace(ingestion_config=ingestion_config),
+        data_transformation=SimpleNamespace(data_transformation_config=SimpleNamespace(
+            preprocessor_obj_file_path=str(tmp_path / 'preprocessor.pkl'))),
+        model_trainer=ModelTrainer(trainer_config))
+    trainer = IncrementalTrainer(pipeline, IncrementalTrainingConfig(state_path=str(tmp_path / 'training_state.pkl'),
+                                                                     **config))
+    trainer.full_retrain = lambda reason, report: retrains.append(reason) or dict(report, mode='full', reason=reason)
+    save_object(trainer.incremental_config.state_path, trainer.build_state(r2=0.8))
+    return trainer, retrains
+
+
+def append_to_source(tmp_path, rows):
+    rows.to_csv(tmp_path / 'stud.csv', mode='a', index=False, header=False)
+
+
+def new_student_rows(n_rows):
+    return pd.read_csv(DATA_PATH).iloc[TRAINED_ROWS:TRAINED_ROWS + n_rows]
+
+
+def file_rows(file_path):
+    return len(pd.read_csv(file_path))
+
+
+def test_warm_start_method():
+    xgboost = pytest.importorskip('xgboost')
+    assert IncrementalTrainer.warm_start_method(xgboost.XGBRegressor()) == 'continued_boosting'
+    assert IncrementalTrainer.warm_start_method(SGDRegressor()) == 'partial_fit'
+    assert IncrementalTrainer.warm_start_method(RandomForestRegressor()) == 'warm_start'
+    assert IncrementalTrainer.warm_start_method(Ridge()) == 'refit'
+
+
+def test_no_new_rows(tmp_path):
+    trainer, retrains = make_trainer(tmp_path, Ridge())
+    report = trainer.run()
+    assert report['mode'] == 'none' and report['new_rows'] == 0
+    assert retrains == []
+
+
+def test_warm_start_keeps_the_preprocessor(tmp_path):
+    trainer, retrains = make_trainer(tmp_path, RandomForestRegressor(n_estimators=10, random_state=0),
+                                     min_drift_rows=1000)
+    preprocessor_before = (tmp_path / 'preprocessor.pkl').read_bytes()
+    train_rows, test_rows = file_rows(tmp_path / 'train.csv'), file_rows(tmp_path / 'test.csv')
+    append_to_source(tmp_path, new_student_rows(100))
+
+    report = trainer.run()
+    assert retrains == []
+    assert report['mode'] == 'incremental' and report['method'] == 'warm_start'
+    assert report['preprocessor'] == 'kept'
+    assert (tmp_path / 'preprocessor.pkl').read_bytes() == preprocessor_before
+    assert load_model(str(tmp_path / 'model.pkl')).n_estimators == 10 + trainer.incremental_config.extra_estimators
+    # the new rows are appended to the split files
+    assert file_rows(tmp_path / 'train.csv') == train_rows + report['new_train_rows']
+    assert file_rows(tmp_path / 'test.csv') == test_rows + report['new_test_rows']
+    assert report['new_train_rows'] + report['new_test_rows'] == 100
+    state = load_object(str(tmp_path / 'training_state.pkl'))
+    assert state.incremental_runs == 1 and state.rows == TRAINED_ROWS + 100
+    assert state.source_offset == os.path.getsize(tmp_path / 'stud.csv')
+    assert state.source_sha256 == hash_prefix(str(tmp_path / 'stud.csv'), state.source_offset)
+    # the same rows are not trained on twice
+    assert trainer.run()['mode'] == 'none'
+
+
+def test_refit_gets_a_new_preprocessor(tmp_path):
+    trainer, retrains = make_trainer(tmp_path, Ridge(), min_drift_rows=1000)
+    preprocessor_before = (tmp_path / 'preprocessor.pkl').read_bytes()
+    append_to_source(tmp_path, new_student_rows(100))
+    report = trainer.run()
+    assert retrains == []
+    assert report['method'] == 'refit' and report['preprocessor'] == 'refitted'
+    assert (tmp_path / 'preprocessor.pkl').read_bytes() != preprocessor_before
+
+
+def edit_trained_row(tmp_path):
+    # the last trained row gets another writing score
+    with open(tmp_path / 'stud.csv', 'r+b') as file_obj:
+        file_obj.seek(os.path.getsize(tmp_path / 'stud.csv') - 3)
+        file_obj.write(b'99\n')
+
+
+@pytest.mark.parametrize('change, config, reason', [
+    (lambda tmp_path: append_to_source(tmp_path, new_student_rows(10).assign(lunch='none')),
+     {}, "new categories {'lunch': ['none']}"),
+    (lambda tmp_path: append_to_source(tmp_path, new_student_rows(20).assign(reading_score=100, writing_score=100)),
+     {'min_drift_rows': 10}, 'drift of'),
+    (lambda tmp_path: append_to_source(tmp_path, new_student_rows(200).sample(600, replace=True, random_state=0)),
+     {}, f'600 new rows on {TRAINED_ROWS} trained rows'),
+    (edit_trained_row, {}, 'the trained rows of the source changed'),
+    (lambda tmp_path: append_to_source(tmp_path, new_student_rows(10)),
+     {'max_incremental_runs': 0}, '0 incremental runs in a row'),
+], ids=['new_category', 'drift', 'too_many_rows', 'edited_source', 'max_runs'])
+def test_full_retrain(tmp_path, change, config, reason):
+    trainer, retrains = make_trainer(tmp_path, DecisionTreeRegressor(max_depth=5), **config)
+    model_before = (tmp_path / 'model.manifest.json').read_bytes()
+    change(tmp_path)
+    assert trainer.run()['mode'] == 'full'
+    assert len(retrains) == 1 and retrains[0].startswith(reason)
+    # nothing was updated
+    assert (tmp_path / 'model.manifest.json').read_bytes() == model_before
+    assert load_object(str(tmp_path / 'training_state.pkl')).incremental_runs == 0
+
+
+def test_missed_r2_gate_retrains_fully(tmp_path):
+    trainer, retrains = make_trainer(tmp_path, Ridge(), min_drift_rows=1000)
+    trainer.model_trainer.model_trainer_config.min_r2_score = 0.99
+    append_to_source(tmp_path, new_student_rows(50))
+    report = trainer.run()
+    assert report['mode'] == 'full' and report['method'] == 'refit'
+    assert retrains[0].startswith('r2 ') and 'below 0.99' in retrains[0]
+    # the split files did not get the new rows
+    assert file_rows(tmp_path / 'train.csv') + file_rows(tmp_path / 'test.csv') == TRAINED_ROWS
+
+
+def test_drift_scores(tmp_path):
+    trainer, _ = make_trainer(tmp_path, Ridge())
+    state = trainer.load_state()
+    same = pd.read_csv(trainer.ingestion_config.train_data_path)
+    scores, unseen = drift_scores(state.fitter, state.target_moments, same)
+    assert unseen == {}
+    assert max(scores.values()) == pytest.approx(0, abs=1e-9)
+    shifted = same.assign(reading_score=same['reading_score'] + np.sqrt(state.fitter.moments['reading_score'].variance),
+                          gender='female', race_ethnicity='group Z')
+    scores, unseen = drift_scores(state.fitter, state.target_moments, shifted)
+    assert scores['reading_score'] == pytest.approx(1.0)
+    assert scores['gender'] == pytest.approx((same['gender'] == 'male').mean())
+    assert unseen == {'race_ethnicity': ['group Z']}
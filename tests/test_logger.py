@@ -0,0 +1,88 @@
+# the logger configures itself on import , so every case runs in an interpreter of its own
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from tests.conftest import ROOT_DIR
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+
+
+def run_logged(code, tmp_path, **env):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, LOG_DIR=str(tmp_path), LOG_FILE='test.log', LOG_FLUSH_INTERVAL='0.05',
+               **env)
+    result = subprocess.run([sys.executable, '-c', textwrap.dedent(code)], capture_output=True, text=True, env=env,
+                            cwd=str(tmp_path), timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+def test_forked_child_writes_a_file_of_its_own(tmp_path):
+    child_pid = run_logged("""
+        import os
+        import src.logger as logger
+        from src.logger import logging
+        # buffered in the parent , not written yet when it forks
+        logging.info('parent before the fork')
+        pid = os.fork()
+        if pid == 0:
+            logging.info('child')
+            logger._listener.stop()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        logging.info('parent after the fork')
+        print(pid)
+    """, tmp_path, LOG_MODE='async', LOG_BATCH_SIZE='1000')
+    with open(tmp_path / 'test.log') as file_obj:
+        parent_lines = file_obj.read().splitlines()
+    with open(tmp_path / f'test_{child_pid}.log') as file_obj:
+        child_lines = file_obj.read().splitlines()
+    assert [line.rsplit(' - ', 1)[1] for line in parent_lines] == ['parent before the fork', 'parent after the fork']
+    assert [line.rsplit(' - ', 1)[1] for line in child_lines] == ['child']
+    assert sorted(os.listdir(tmp_path)) == sorted(['test.log', f'test_{child_pid}.log'])
+
+
+def test_fork_while_the_writer_is_busy(tmp_path):
+    # every record ends up exactly once , in the file of the process which logged it
+    run_logged("""
+        import os
+        import src.logger as logger
+        from src.logger import logging
+        pids = []
+        for index in range(5):
+            for line in range(200):
+                logging.info(f'parent {index} {line}')
+            pid = os.fork()
+            if pid == 0:
+                logging.info(f'child {index}')
+                logger._listener.stop()
+                os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    """, tmp_path, LOG_MODE='async', LOG_BATCH_SIZE='7')
+    lines = {}
+    for name in os.listdir(tmp_path):
+        with open(tmp_path / name) as file_obj:
+            lines[name] = [line.rsplit(' - ', 1)[1] for line in file_obj.read().splitlines()]
+    parent = lines.pop('test.log')
+    assert parent == [f'parent {index} {line}' for index in range(5) for line in range(200)]
+    assert sorted(sum(lines.values(), [])) == [f'child {index}' for index in range(5)]
+    assert all(len(child) == 1 for child in lines.values())
+
+
+def test_sync_mode_is_not_changed(tmp_path):
+    run_logged("""
+        import os
+        from src.logger import logging
+        pid = os.fork()
+        if pid == 0:
+            logging.info('child')
+            os._exit(0)
+        os.waitpid(pid, 0)
+        logging.info('parent')
+    """, tmp_path, LOG_MODE='sync')
+    assert os.listdir(tmp_path) == ['test.log']
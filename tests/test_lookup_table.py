@@ -0,0 +1,95 @@
+import copy
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.exception import CustomException
+from src.model_serializer import load_model
+from src.pipeline.lookup_table import (LookupTableConfig, load_lookup_table, lookup_manifest_path,
+                                       lookup_table_path, materialize_lookup_table)
+from src.pipeline.model_registry import ModelRegistry, ModelRegistryConfig
+from src.pipeline.predict_pipeline import PredictPipeline
+from src.utils import load_object, save_object
+from tests.conftest import ARTIFACTS_DIR
+
+RECORD = {'gender': 'female', 'race_ethnicity': 'group B', 'parental_level_of_education': "bachelor's degree",
+          'lunch': 'standard', 'test_preparation_course': 'none', 'reading_score': 62, 'writing_score': 65}
+
+
+@pytest.fixture
+def artifacts_dir(tmp_path):
+    for name in ('model.pkl', 'preprocessor.pkl'):
+        shutil.copy(os.path.join(ARTIFACTS_DIR, name), tmp_path / name)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def manifest(artifacts_dir):
+    # scores 60 to 70 only , the whole domain would be 2.4M records
+    return materialize_lookup_table(LookupTableConfig(model_path=os.path.join(artifacts_dir, 'model.pkl'),
+                                                      preprocessor_path=os.path.join(artifacts_dir, 'preprocessor.pkl'),
+                                                      score_min=60, score_max=70))
+
+
+def sklearn_prediction(artifacts_dir, records):
+    model = load_model(os.path.join(artifacts_dir, 'model.pkl'))
+    preprocessor = load_object(os.path.join(artifacts_dir, 'preprocessor.pkl'))
+    return model.predict(preprocessor.transform(pd.DataFrame(records)))
+
+
+def test_table_matches_the_model(artifacts_dir, manifest):
+    assert manifest['shape'][-2:] == [11, 11] and manifest['rows'] == np.prod(manifest['shape'])
+    table = load_lookup_table(artifacts_dir, manifest['version'])
+    records = [RECORD, dict(RECORD, gender='male', lunch='free/reduced', reading_score=70, writing_score=60.0)]
+    expected = sklearn_prediction(artifacts_dir, records)
+    np.testing.assert_allclose([table.lookup(record) for record in records], expected, rtol=1e-6)
+    predictions, found = table.lookup_frame(pd.DataFrame(records))
+    assert found.all()
+    np.testing.assert_allclose(predictions, expected, rtol=1e-6)
+
+
+def test_records_outside_of_the_domain(artifacts_dir, manifest):
+    table = load_lookup_table(artifacts_dir, manifest['version'])
+    outside = [dict(RECORD, race_ethnicity='group Z'), dict(RECORD, reading_score=62.5),
+               dict(RECORD, writing_score=71), dict(RECORD, reading_score=None), dict(RECORD, lunch=None)]
+    assert [table.lookup(record) for record in outside] == [None] * len(outside)
+    predictions, found = table.lookup_frame(pd.DataFrame([RECORD] + outside[:3]))
+    assert found.tolist() == [True, False, False, False]
+    assert np.isnan(predictions[1:]).all()
+
+
+def test_table_of_another_model_is_not_loaded(artifacts_dir, manifest):
+    assert load_lookup_table(artifacts_dir, 'another-version') is None
+    # a table which does not match its manifest is not used either
+    with open(lookup_manifest_path(artifacts_dir), 'w') as file_obj:
+        json.dump(dict(manifest, shape=[1, 2, 3]), file_obj)
+    assert load_lookup_table(artifacts_dir, manifest['version']) is None
+    os.remove(lookup_manifest_path(artifacts_dir))
+    assert os.path.exists(lookup_table_path(artifacts_dir))
+    assert load_lookup_table(artifacts_dir, manifest['version']) is None
+
+
+def test_registry_serves_from_the_table(artifacts_dir, manifest):
+    registry = ModelRegistry(ModelRegistryConfig(model_path=os.path.join(artifacts_dir, 'model.pkl'),
+                                                 preprocessor_path=os.path.join(artifacts_dir, 'preprocessor.pkl'),
+                                                 use_lookup_table=True, warm_up=False, backend='sklearn'))
+    assert registry.get().lookup_table is not None
+    pipeline = PredictPipeline(registry)
+    expected = sklearn_prediction(artifacts_dir, [RECORD, dict(RECORD, reading_score=90)])
+    # in the domain from the table , outside of it from the model
+    assert pipeline.predict_record(RECORD) == pytest.approx(expected[0], rel=1e-6)
+    assert pipeline.predict_record(dict(RECORD, reading_score=90)) == pytest.approx(expected[1])
+
+
+def test_preprocessor_which_can_not_be_compiled(artifacts_dir, fitted_preprocessor):
+    fitted_preprocessor = copy.deepcopy(fitted_preprocessor)
+    fitted_preprocessor.named_transformers_['cat_pipeline'].named_steps['one_hot_encoder'].handle_unknown = 'error'
+    save_object(os.path.join(artifacts_dir, 'preprocessor.pkl'), fitted_preprocessor)
+    with pytest.raises(CustomException, match='can not be compiled'):
+        materialize_lookup_table(LookupTableConfig(model_path=os.path.join(artifacts_dir, 'model.pkl'),
+                                                   preprocessor_path=os.path.join(artifacts_dir, 'preprocessor.pkl')))
+    assert not os.path.exists(lookup_manifest_path(artifacts_dir))
@@ -0,0 +1,148 @@
+import errno
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+from sklearn.model_selection import KFold
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components import model_search
+from src.components.model_search import FoldCache, ModelSearch, ModelSearchConfig, _fit_final, _init_worker
+
+
+@pytest.fixture
+def train_data():
+    rng = np.random.default_rng(0)
+    X = rng.random((60, 3))
+    return X, X @ np.array([1.0, 2.0, 3.0])
+
+
+@pytest.fixture
+def worker(train_data, tmp_path, monkeypatch):
+    # the worker state of the pool , set up in this process
+    X, y = train_data
+    _init_worker(X, y, list(KFold(n_splits=3).split(X)), ModelSearchConfig())
+    monkeypatch.chdir(tmp_path)
+    fit_params = []
+    fit_estimator = model_search.fit_estimator
+
+    def recording_fit(estimator, *args, **kwargs):
+        fit_params.append(estimator.get_params())
+        return fit_estimator(estimator, *args, **kwargs)
+
+    monkeypatch.setattr(model_search, 'fit_estimator', recording_fit)
+    return fit_params
+
+
+def test_final_fit_is_single_threaded(worker):
+    model_name, estimator, fit_time = _fit_final('Random Forest', RandomForestRegressor(n_estimators=5, n_jobs=-1))
+    assert model_name == 'Random Forest' and fit_time >= 0
+    assert worker[0]['n_jobs'] == 1
+    # the fitted model gets its own n_jobs back for the predictions
+    assert estimator.get_params()['n_jobs'] == -1
+    assert estimator.predict(np.zeros((1, 3))).shape == (1,)
+
+
+def test_final_fit_of_xgboost(worker):
+    xgboost = pytest.importorskip('xgboost')
+    _, estimator, _ = _fit_final('XGBRegressor', xgboost.XGBRegressor(n_estimators=5))
+    assert worker[0]['n_jobs'] == 1
+    assert estimator.get_params()['n_jobs'] is None
+
+
+def test_final_fit_of_catboost_writes_no_files(worker, tmp_path):
+    catboost = pytest.importorskip('catboost')
+    _, estimator, _ = _fit_final('CatBoosting Regressor', catboost.CatBoostRegressor(iterations=5, verbose=False))
+    assert worker[0]['thread_count'] == 1 and worker[0]['allow_writing_files'] is False
+    assert not (tmp_path / 'catboost_info').exists()
+    assert estimator.predict(np.zeros((1, 3))).shape == (1,)
+
+
+def assert_fold_arrays(cache, X, y, folds):
+    X_train, y_train, fold_arrays = cache.open()
+    np.testing.assert_array_equal(X_train, X)
+    np.testing.assert_array_equal(y_train, y)
+    for (train_index, validation_index), (X_fit, y_fit, X_validation, y_validation) in zip(folds, fold_arrays):
+        np.testing.assert_array_equal(X_fit, X[train_index])
+        np.testing.assert_array_equal(y_fit, y[train_index])
+        np.testing.assert_array_equal(X_validation, X[validation_index])
+        np.testing.assert_array_equal(y_validation, y[validation_index])
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_fold_cache(train_data, tmp_path, shuffle):
+    X, y = train_data
+    folds = list(KFold(n_splits=3, shuffle=shuffle, random_state=0 if shuffle else None).split(X))
+    cache = FoldCache.build(X, y, folds, str(tmp_path))
+    assert os.path.dirname(cache.directory) == str(tmp_path)
+    # the contiguous validation blocks of KFold are views of the train data
+    assert len(cache.validation_ranges) == (0 if shuffle else 3)
+    # an upper bound , plus the .npy headers
+    assert cache.nbytes <= FoldCache.required_bytes(X, y, folds) + 128 * len(os.listdir(cache.directory))
+    assert_fold_arrays(cache, X, y, folds)
+    cache.remove()
+    assert os.listdir(tmp_path) == []
+
+
+def test_default_dir_depends_on_the_free_space_of_dev_shm(monkeypatch):
+    if not (os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK)):
+        pytest.skip('no writable /dev/shm')
+    usage = shutil.disk_usage('/dev/shm')._replace(total=64 << 20, used=0, free=64 << 20)
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: usage)
+    assert FoldCache.default_dir(10 << 20) == '/dev/shm'
+    # the cache has to leave SHM_HEADROOM of it free
+    assert FoldCache.default_dir(60 << 20) is None
+
+
+def test_full_dev_shm_falls_back_to_the_temp_directory(train_data, monkeypatch):
+    X, y = train_data
+    folds = list(KFold(n_splits=3).split(X))
+    write = FoldCache._write.__func__
+    written_to = []
+
+    def filling_write(cls, X_train, y_train, folds, cache_dir):
+        written_to.append(cache_dir)
+        if cache_dir == '/dev/shm':
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return write(cls, X_train, y_train, folds, cache_dir)
+
+    monkeypatch.setattr(FoldCache, 'default_dir', classmethod(lambda cls, n_bytes: '/dev/shm'))
+    monkeypatch.setattr(FoldCache, '_write', classmethod(filling_write))
+    cache = FoldCache.build(X, y, folds)
+    try:
+        assert written_to == ['/dev/shm', None]
+        assert os.path.dirname(cache.directory) == tempfile.gettempdir()
+        assert_fold_arrays(cache, X, y, folds)
+    finally:
+        cache.remove()
+
+
+def test_remove_stale_keeps_the_caches_of_running_processes(tmp_path):
+    running = tmp_path / f'{FoldCache.PREFIX}{os.getpid()}_a'
+    # pid above the pid_max of linux , that process does not exist
+    finished = tmp_path / f'{FoldCache.PREFIX}99999999_b'
+    other = tmp_path / 'other_99999999'
+    for directory in (running, finished, other):
+        directory.mkdir()
+    FoldCache.remove_stale(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted([running.name, other.name])
+
+
+def test_memmap_and_pickle_search_agree(train_data, tmp_path):
+    X, y = train_data
+    models = {'Decision Tree': DecisionTreeRegressor(random_state=0), 'Ridge': Ridge()}
+    params = {'Decision Tree': {'max_depth': [2, 4]}, 'Ridge': {'alpha': [0.1, 1.0]}}
+    reports, cv_scores = [], []
+    for data_sharing in ('memmap', 'pickle'):
+        search = ModelSearch(ModelSearchConfig(n_jobs=1, data_sharing=data_sharing, cache_dir=str(tmp_path)))
+        reports.append(search.run(X[:45], y[:45], X[45:], y[45:], dict(models), params))
+        cv_scores.append({name: [result.mean_score for result in results]
+                          for name, results in search.cv_results.items()})
+    assert reports[0] == pytest.approx(reports[1])
+    assert cv_scores[0] == pytest.approx(cv_scores[1])
+    # the fold cache is removed after the search
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import Ridge
+
+from src.components.model_selection import (ModelSelectionConfig, choose, measure_inference_cost, pareto_front,
+                                            select_model, within_budget)
+from src.exception import CustomException
+
+
+def row(model, test_r2, row_latency_us_p50, batch_latency_ms=1.0, size_bytes=1000):
+    return {'model': model, 'test_r2': test_r2, 'row_latency_us_p50': row_latency_us_p50,
+            'batch_latency_ms': batch_latency_ms, 'size_bytes': size_bytes}
+
+
+ROWS = [row('Forest', 0.88, 900, 20.0, 10 ** 7),
+        row('Boosting', 0.875, 300, 5.0, 10 ** 6),
+        row('Linear', 0.86, 50, 0.5, 1000),
+        # worse than Linear on every objective
+        row('Tree', 0.80, 60, 0.6, 2000)]
+
+
+def with_flags(rows, config):
+    front = pareto_front(rows)
+    return [dict(item, pareto=item['model'] in front, within_budget=within_budget(item, config)) for item in rows]
+
+
+def test_pareto_front():
+    assert pareto_front(ROWS) == ['Forest', 'Boosting', 'Linear']
+    # an equal row does not dominate
+    assert pareto_front([ROWS[2], dict(ROWS[2], model='Copy')]) == ['Linear', 'Copy']
+
+
+def test_within_budget():
+    assert within_budget(ROWS[0], ModelSelectionConfig())
+    assert not within_budget(ROWS[0], ModelSelectionConfig(row_latency_budget_us=500))
+    assert not within_budget(ROWS[1], ModelSelectionConfig(batch_latency_budget_ms=2))
+    assert within_budget(ROWS[2], ModelSelectionConfig(row_latency_budget_us=500, batch_latency_budget_ms=2))
+
+
+@pytest.mark.parametrize('config, selected', [
+    (ModelSelectionConfig(policy='r2'), 'Forest'),
+    (ModelSelectionConfig(policy='latency_budget', row_latency_budget_us=500), 'Boosting'),
+    (ModelSelectionConfig(policy='latency_budget', row_latency_budget_us=500, batch_latency_budget_ms=1), 'Linear'),
+    (ModelSelectionConfig(policy='pareto', r2_tolerance=0.01), 'Boosting'),
+    (ModelSelectionConfig(policy='pareto', r2_tolerance=0.05), 'Linear'),
+    (ModelSelectionConfig(policy='pareto', r2_tolerance=0), 'Forest'),
+])
+def test_choose(config, selected):
+    assert choose(with_flags(ROWS, config), config)[0] == selected
+
+
+def test_choose_errors():
+    config = ModelSelectionConfig(policy='latency_budget', row_latency_budget_us=10)
+    with pytest.raises(ValueError, match='No model within the latency budget .* the fastest is Linear'):
+        choose(with_flags(ROWS, config), config)
+    with pytest.raises(ValueError, match='Unknown model selection policy'):
+        choose(ROWS, ModelSelectionConfig(policy='fastest'))
+
+
+def test_measure_and_select(tmp_path):
+    rng = np.random.default_rng(0)
+    X = rng.random((20, 3))
+    y = X @ np.array([1.0, 2.0, 3.0])
+    models = {'Ridge': Ridge().fit(X, y), 'Random Forest': RandomForestRegressor(n_estimators=20).fit(X, y)}
+    config = ModelSelectionConfig(policy='r2', latency_rows=10, batch_size=50, repeat=2,
+                                  report_path=str(tmp_path / 'model_selection.json'))
+    cost = measure_inference_cost(models['Ridge'], X, config)
+    assert cost['batch_size'] == 50 and cost['size_bytes'] > 0
+    assert 0 < cost['row_latency_us_p50'] <= cost['row_latency_us_p99']
+
+    report = select_model(models, {'Ridge': 0.9, 'Random Forest': 0.95}, X, config)
+    assert report['selected'] == 'Random Forest'
+    assert [item['model'] for item in report['models']] == ['Random Forest', 'Ridge']
+    assert [item['selected'] for item in report['models']] == [True, False]
+    with open(tmp_path / 'model_selection.json') as file_obj:
+        assert json.load(file_obj)['selected'] == 'Random Forest'
+
+    # nothing within the budget fails the selection
+    config.policy, config.row_latency_budget_us = 'latency_budget', 1e-3
+    with pytest.raises(CustomException, match='No model within the latency budget'):
+        select_model(models, {'Ridge': 0.9, 'Random Forest': 0.95}, X, config)
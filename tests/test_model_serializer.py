@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+from src.exception import CustomException
+from src.model_serializer import (ModelSerializerConfig, load_model, manifest_path_of, resolve_model_path,
+                                  save_model)
+from tests.conftest import ARTIFACTS_DIR
+
+X = np.random.default_rng(0).random((50, 3))
+y = X @ np.array([1.0, 2.0, 3.0])
+
+
+def native_model(name):
+    if name == 'xgboost':
+        return pytest.importorskip('xgboost').XGBRegressor(n_estimators=5)
+    return pytest.importorskip('catboost').CatBoostRegressor(iterations=5, verbose=False, allow_writing_files=False)
+
+
+@pytest.mark.parametrize('serializer, model', [
+    ('auto', DecisionTreeRegressor(max_depth=3)),
+    ('dill', LinearRegression()),
+    ('auto', 'xgboost'),
+    ('xgboost_json', 'xgboost'),
+    ('auto', 'catboost'),
+])
+def test_round_trip(tmp_path, serializer, model):
+    model = native_model(model) if isinstance(model, str) else model
+    model.fit(X, y)
+    model_path = str(tmp_path / 'model.pkl')
+    manifest = save_model(model, model_path, ModelSerializerConfig(serializer=serializer))
+    assert resolve_model_path(model_path) == manifest_path_of(model_path) == str(tmp_path / 'model.manifest.json')
+    assert manifest['class'].endswith(type(model).__name__)
+    assert os.path.getsize(tmp_path / manifest['file']) == manifest['size_bytes']
+    if serializer == 'auto':
+        assert manifest['format'] in ('joblib', 'xgboost_ubj', 'catboost_cbm')
+    loaded = load_model(model_path)
+    assert type(loaded) is type(model)
+    np.testing.assert_allclose(loaded.predict(X), model.predict(X), rtol=1e-6)
+
+
+def test_checksum_mismatch_is_rejected(tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    manifest = save_model(DecisionTreeRegressor(max_depth=3).fit(X, y), model_path)
+    with open(tmp_path / manifest['file'], 'ab') as file_obj:
+        file_obj.write(b'\0')
+    with pytest.raises(CustomException, match='Checksum'):
+        load_model(model_path)
+    # the check can be switched off
+    config = ModelSerializerConfig(verify_checksum=False)
+    assert isinstance(load_model(model_path, config), DecisionTreeRegressor)
+
+
+def test_legacy_model_without_manifest(tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    shutil.copy(os.path.join(ARTIFACTS_DIR, 'model.pkl'), model_path)
+    assert resolve_model_path(model_path) == model_path
+    assert hasattr(load_model(model_path), 'predict')
+
+
+def test_new_format_replaces_the_old_payload_but_not_model_pkl(tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    shutil.copy(os.path.join(ARTIFACTS_DIR, 'model.pkl'), model_path)
+    model = DecisionTreeRegressor(max_depth=3).fit(X, y)
+    save_model(model, model_path, ModelSerializerConfig(serializer='joblib'))
+    manifest = save_model(model, model_path, ModelSerializerConfig(serializer='dill'))
+    # the dill payload is model.pkl itself , it replaced the legacy file and the joblib payload is gone
+    assert manifest['file'] == 'model.pkl'
+    assert sorted(os.listdir(tmp_path)) == ['model.manifest.json', 'model.pkl']
+    save_model(model, model_path, ModelSerializerConfig(serializer='joblib'))
+    assert sorted(os.listdir(tmp_path)) == ['model.joblib', 'model.manifest.json', 'model.pkl']
+    with open(tmp_path / 'model.manifest.json') as file_obj:
+        assert json.load(file_obj)['format'] == 'joblib'
+
+
+def test_auto_falls_back_to_dill(tmp_path, monkeypatch):
+    import joblib
+
+    def failing_dump(model, file_path):
+        # like a model with a lambda when dill has not extended pickle
+        open(file_path, 'wb').close()
+        raise TypeError("cannot pickle 'function' object")
+
+    monkeypatch.setattr(joblib, 'dump', failing_dump)
+    manifest = save_model(LinearRegression().fit(X, y), str(tmp_path / 'model.pkl'))
+    assert manifest['format'] == 'dill'
+    assert sorted(os.listdir(tmp_path)) == ['model.manifest.json', 'model.pkl']
+    np.testing.assert_allclose(load_model(str(tmp_path / 'model.pkl')).predict(X), y, atol=1e-9)
+    # an explicitly chosen serializer does not fall back
+    with pytest.raises(CustomException, match='cannot pickle'):
+        save_model(LinearRegression().fit(X, y), str(tmp_path / 'model.pkl'), ModelSerializerConfig(serializer='joblib'))
+
+
+def test_unknown_and_mismatching_formats(tmp_path):
+    model = LinearRegression().fit(X, y)
+    with pytest.raises(CustomException, match='Unknown model serializer'):
+        save_model(model, str(tmp_path / 'model.pkl'), ModelSerializerConfig(serializer='onnx'))
+    with pytest.raises(CustomException, match='can not save'):
+        save_model(model, str(tmp_path / 'model.pkl'), ModelSerializerConfig(serializer='xgboost_ubj'))
+    assert os.listdir(tmp_path) == []
+
+
+def test_native_manifest_only_builds_classes_of_its_library(tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    save_model(native_model('xgboost').fit(X, y), model_path)
+    with open(manifest_path_of(model_path)) as file_obj:
+        manifest = json.load(file_obj)
+    with open(manifest_path_of(model_path), 'w') as file_obj:
+        json.dump(dict(manifest, **{'class': 'subprocess.Popen'}), file_obj)
+    with pytest.raises(CustomException, match='is not a xgboost_ubj model'):
+        load_model(model_path)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('skl2onnx')
+
+from sklearn.linear_model import Ridge
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components.data_transformation import TARGET_COLUMN
+from src.model_serializer import save_model
+from src.pipeline.onnx_pipeline import (OnnxExportConfig, export_onnx, load_onnx_pipeline, onnx_manifest_path,
+                                        rounding_bound)
+from src.utils import save_object
+from tests.conftest import with_edge_cases
+
+
+def export(tmp_path, model, preprocessor):
+    save_model(model, str(tmp_path / 'model.pkl'))
+    save_object(str(tmp_path / 'preprocessor.pkl'), preprocessor)
+    config = OnnxExportConfig(model_path=str(tmp_path / 'model.pkl'),
+                              preprocessor_path=str(tmp_path / 'preprocessor.pkl'), parity_rows=500)
+    return config, export_onnx(config)
+
+
+@pytest.mark.parametrize('model', [DecisionTreeRegressor(max_depth=6, random_state=42), Ridge()],
+                         ids=['tree', 'linear'])
+def test_onnx_predictions_match_sklearn(tmp_path, student_data, fitted_preprocessor, model):
+    model.fit(fitted_preprocessor.transform(student_data.drop(columns=[TARGET_COLUMN])), student_data[TARGET_COLUMN])
+    config, manifest = export(tmp_path, model, fitted_preprocessor)
+    assert manifest['parity']['max_abs_diff'] <= manifest['parity']['tolerance'] + \
+        manifest['parity']['max_rounding_bound']
+
+    pipeline = load_onnx_pipeline(str(tmp_path), manifest['version'])
+    assert pipeline is not None
+    # missing values and unknown categories included
+    features = with_edge_cases(student_data.drop(columns=[TARGET_COLUMN]))
+    transformed = fitted_preprocessor.transform(features)
+    expected = model.predict(transformed)
+    allowed = config.parity_tolerance + rounding_bound(model, transformed)
+    assert (np.abs(pipeline.predict(pipeline.transform(features)) - expected) <= allowed).all()
+    for position, record in zip(range(len(features) - 20, len(features)),
+                                features.tail(20).to_dict(orient='records')):
+        assert abs(pipeline.predict(pipeline.transform_record(record))[0] - expected[position]) <= allowed[position]
+
+
+def test_graph_of_another_model_is_not_loaded(tmp_path, student_data, fitted_preprocessor):
+    features = student_data.drop(columns=[TARGET_COLUMN])
+    model = DecisionTreeRegressor(max_depth=3).fit(fitted_preprocessor.transform(features),
+                                                   student_data[TARGET_COLUMN])
+    _, manifest = export(tmp_path, model, fitted_preprocessor)
+    assert load_onnx_pipeline(str(tmp_path), 'another-version') is None
+    assert load_onnx_pipeline(str(tmp_path), manifest['version']) is not None
+
+
+def test_no_graph(tmp_path):
+    assert not (tmp_path / 'model.onnx.json').exists()
+    assert onnx_manifest_path(str(tmp_path)) == str(tmp_path / 'model.onnx.json')
+    assert load_onnx_pipeline(str(tmp_path), 'any-version') is None
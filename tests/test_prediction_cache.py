@@ -0,0 +1,81 @@
+import pytest
+
+from src.pipeline.prediction_cache import PredictionCache, PredictionCacheConfig, cache_key
+from src.pipeline.predict_pipeline import PredictPipeline
+
+RECORD = {'gender': 'female', 'race_ethnicity': 'group B', 'parental_level_of_education': "bachelor's degree",
+          'lunch': 'standard', 'test_preparation_course': 'none', 'reading_score': 72, 'writing_score': 74}
+
+
+def make_cache(backend, tmp_path, **kwargs):
+    return PredictionCache(PredictionCacheConfig(backend=backend, sqlite_path=str(tmp_path / 'cache.sqlite'),
+                                                 **kwargs))
+
+
+def test_cache_key_is_normalized():
+    assert cache_key('v1', RECORD) == cache_key('v1', dict(RECORD, reading_score=72.0))
+    assert cache_key('v1', RECORD) != cache_key('v1', dict(RECORD, reading_score=72.5))
+    assert cache_key('v1', RECORD) != cache_key('v2', RECORD)
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_hit_miss_and_model_swap(backend, tmp_path):
+    cache = make_cache(backend, tmp_path)
+    assert cache.get('v1', RECORD) is None
+    cache.put('v1', RECORD, 70.5)
+    assert cache.get('v1', RECORD) == 70.5
+    # the results of the old model are dropped on a hot swap
+    cache.on_model_swap('v1', 'v2')
+    assert cache.get('v1', RECORD) is None
+    assert cache.stats() == {'backend': backend, 'hits': 1, 'misses': 2, 'errors': 0, 'hit_ratio': 1 / 3,
+                             'entries': 0}
+
+
+def test_sqlite_is_shared_between_caches(tmp_path):
+    make_cache('sqlite', tmp_path).put('v1', RECORD, 70.5)
+    assert make_cache('sqlite', tmp_path).get('v1', RECORD) == 70.5
+
+
+def test_memory_lru_and_ttl(tmp_path, monkeypatch):
+    cache = make_cache('memory', tmp_path, max_entries=2, ttl_seconds=10)
+    for score in (60, 61, 62):
+        cache.put('v1', dict(RECORD, reading_score=score), score)
+    # the oldest entry is evicted
+    assert cache.get('v1', dict(RECORD, reading_score=60)) is None
+    assert cache.get('v1', dict(RECORD, reading_score=62)) == 62
+    import time
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert cache.get('v1', dict(RECORD, reading_score=62)) is None
+    assert len(cache.backend) == 1
+
+
+def test_failing_backend_is_a_miss(tmp_path):
+    cache = make_cache('memory', tmp_path)
+
+    def broken(*args):
+        raise RuntimeError('backend is down')
+
+    cache.backend.get = cache.backend.put = broken
+    cache.put('v1', RECORD, 70.5)
+    assert cache.get('v1', RECORD) is None
+    assert (cache.hits, cache.misses, cache.errors) == (0, 1, 2)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match='Unknown prediction cache backend'):
+        PredictionCache(PredictionCacheConfig(backend='redis'))
+    assert not PredictionCache(PredictionCacheConfig(backend='off')).enabled
+
+
+def test_pipeline_uses_the_cache(registry, tmp_path):
+    cache = make_cache('memory', tmp_path).attach(registry)
+    pipeline = PredictPipeline(registry, cache)
+    first = pipeline.predict_record(RECORD)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert pipeline.predict_record(dict(RECORD, reading_score=72.0)) == first
+    assert (cache.hits, cache.misses) == (1, 1)
+    # a micro batch takes the cached rows from the cache
+    results = pipeline.predict_batch([RECORD, dict(RECORD, writing_score=75)])
+    assert [result['success'] for result in results] == [True, True]
+    assert cache.hits == 2
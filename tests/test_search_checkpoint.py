@@ -0,0 +1,106 @@
+import sqlite3
+
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.linear_model import Ridge
+from sklearn.tree import DecisionTreeRegressor
+
+from src.components.model_search import ModelSearch, ModelSearchConfig
+from src.components.search_checkpoint import SearchCheckpoint, SearchCheckpointConfig, candidate_key, search_key
+
+rng = np.random.default_rng(0)
+X = rng.random((60, 3))
+y = X @ np.array([1.0, 2.0, 3.0])
+SETTINGS = {'cv': 3, 'early_stopping_rounds': None}
+
+
+def open_checkpoint(tmp_path, arrays=(X, y), settings=SETTINGS, keep_searches=3):
+    config = SearchCheckpointConfig(enabled=True, db_path=str(tmp_path / 'model_search.sqlite'),
+                                    keep_searches=keep_searches)
+    return SearchCheckpoint.open(config, arrays, settings)
+
+
+def test_search_key(tmp_path):
+    np.save(tmp_path / 'X.npy', X)
+    mapped = np.load(tmp_path / 'X.npy', mmap_mode='r')
+    assert search_key((mapped, y), SETTINGS) == search_key((X.copy(), y), SETTINGS)
+    assert search_key((X, y + 1), SETTINGS) != search_key((X, y), SETTINGS)
+    assert search_key((X, y), dict(SETTINGS, cv=5)) != search_key((X, y), SETTINGS)
+
+
+def test_candidate_key():
+    tree = DecisionTreeRegressor(max_depth=3)
+    assert candidate_key(tree) == candidate_key(clone(tree))
+    assert candidate_key(tree) != candidate_key(DecisionTreeRegressor(max_depth=4))
+    assert candidate_key(Ridge()) != candidate_key(DecisionTreeRegressor())
+
+
+def test_switched_off(tmp_path):
+    config = SearchCheckpointConfig(enabled=False, db_path=str(tmp_path / 'model_search.sqlite'))
+    assert SearchCheckpoint.open(config, (X, y), SETTINGS) is None
+    assert not (tmp_path / 'model_search.sqlite').exists()
+
+
+def test_results_survive_a_restart(tmp_path):
+    checkpoint = open_checkpoint(tmp_path)
+    key = candidate_key(Ridge())
+    checkpoint.record_fold('Ridge', key, {'alpha': 1.0}, 0, 0.9, 0.1, 0.01, 0.1, 120.0)
+    estimator = Ridge().fit(X, y)
+    checkpoint.save_best('Ridge', key, {'alpha': 1.0}, estimator, 0.2)
+    checkpoint.record_test_score('Ridge', 0.95)
+    checkpoint.close()
+
+    checkpoint = open_checkpoint(tmp_path)
+    assert checkpoint.fold_result(key, 0) == {'score': 0.9, 'fit_seconds': 0.1, 'score_seconds': 0.01,
+                                              'fit_cpu_seconds': 0.1, 'fit_peak_memory_mb': 120.0}
+    assert checkpoint.fold_result(key, 1) is None
+    saved, fit_seconds = checkpoint.best_estimator('Ridge', key)
+    np.testing.assert_allclose(saved.predict(X), estimator.predict(X))
+    assert fit_seconds == 0.2
+    # another candidate of the model is fitted again
+    assert checkpoint.best_estimator('Ridge', candidate_key(Ridge(alpha=2.0))) is None
+    assert checkpoint.summary() == [{'model': 'Ridge', 'params': '{"alpha": 1.0}', 'fit_seconds': 0.2,
+                                     'test_score': 0.95, 'cv_score': 0.9, 'cv_fit_seconds': 0.1, 'folds': 1}]
+    # other data is another search
+    assert open_checkpoint(tmp_path, arrays=(X, y + 1)).completed == {}
+
+
+def test_unreadable_estimator_is_fitted_again(tmp_path):
+    checkpoint = open_checkpoint(tmp_path)
+    key = candidate_key(Ridge())
+    checkpoint.save_best('Ridge', key, {}, Ridge().fit(X, y), 0.2)
+    with checkpoint.connection:
+        checkpoint.connection.execute("UPDATE best_estimators SET estimator = ?", (b'not a pickle',))
+    assert checkpoint.best_estimator('Ridge', key) is None
+
+
+def test_prune_keeps_the_estimators_of_the_last_searches(tmp_path):
+    keys = []
+    for offset in range(3):
+        checkpoint = open_checkpoint(tmp_path, arrays=(X, y + offset), keep_searches=2)
+        keys.append(checkpoint.key)
+        checkpoint.save_best('Ridge', 'candidate', {}, Ridge().fit(X, y + offset), 0.1)
+        checkpoint.record_fold('Ridge', 'candidate', {}, 0, 0.9, 0.1, 0.01)
+        checkpoint.close()
+    open_checkpoint(tmp_path, arrays=(X, y + 2), keep_searches=2).close()
+    connection = sqlite3.connect(str(tmp_path / 'model_search.sqlite'))
+    kept = dict(connection.execute("SELECT search_key, estimator IS NOT NULL FROM best_estimators"))
+    assert kept == {keys[0]: 0, keys[1]: 1, keys[2]: 1}
+    # the fold results of the old searches stay
+    assert connection.execute("SELECT COUNT(*) FROM fold_results").fetchone()[0] == 3
+    connection.close()
+
+
+def test_resumed_search_skips_the_saved_fits(tmp_path):
+    models = {'Decision Tree': DecisionTreeRegressor(random_state=0), 'Ridge': Ridge()}
+    params = {'Decision Tree': {'max_depth': [2, 4]}, 'Ridge': {'alpha': [0.1, 1.0]}}
+    reports = []
+    for _ in range(2):
+        search = ModelSearch(ModelSearchConfig(n_jobs=1, data_sharing='pickle'))
+        checkpoint = open_checkpoint(tmp_path)
+        reports.append(search.run(X[:45], y[:45], X[45:], y[45:], dict(models), params, checkpoint))
+        checkpoint.close()
+    # 4 candidates x 3 folds + the 2 final fits
+    assert search.resumed_fits == 4 * 3 + 2
+    assert reports[0] == pytest.approx(reports[1])
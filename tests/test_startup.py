@@ -0,0 +1,26 @@
+# the web apps are imported in a fresh interpreter , like gunicorn does before the first request
+import os
+
+import pytest
+
+from src.benchmark.startup import FORBIDDEN_MODULES, check, measure_import
+from tests.conftest import ROOT_DIR
+
+
+@pytest.mark.parametrize('module', ['app', 'application', 'asgi'])
+def test_import_does_not_pull_in_the_heavy_libraries(module, monkeypatch):
+    monkeypatch.chdir(ROOT_DIR)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get('PYTHONPATH')])))
+    total_ms, entries = measure_import(module, env)
+    imported = {entry['module'] for entry in entries}
+    assert total_ms > 0
+    assert 'pandas' not in imported and 'sklearn' not in imported
+    assert [name for name in FORBIDDEN_MODULES if name in imported] == []
+
+
+def test_check_reports_the_budget_and_the_forbidden_imports():
+    report = {'module': 'app', 'import_ms': 900.0, 'forbidden_imported': ['pandas']}
+    assert check(report, budget_ms=600) == ["import app took 900 ms , budget 600 ms", "import app imports pandas"]
+    assert check(dict(report, import_ms=100.0, forbidden_imported=[]), budget_ms=600) == []
+    # no budget , only the imports are checked
+    assert check(report, budget_ms=None) == ["import app imports pandas"]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.pipeline.api_handlers import parse_predict_request
+from src.pipeline.predict_pipeline import FEATURE_COLUMNS, InvalidRecord, check_categories, validate_records
+
+RECORD = {'gender': 'female', 'ethnicity': 'group B', 'parental_level_of_education': "bachelor's degree",
+          'lunch': 'standard', 'test_preparation_course': 'none', 'reading_score': 72, 'writing_score': 74}
+CATEGORIES = {'race_ethnicity': frozenset(['group A', 'group B'])}
+
+
+def test_valid_records():
+    features, errors = validate_records([RECORD, dict(RECORD, reading_score='80.5')], CATEGORIES)
+    assert list(features.columns) == FEATURE_COLUMNS
+    assert errors.isna().all()
+    assert features['race_ethnicity'].tolist() == ['group B', 'group B']
+    np.testing.assert_array_equal(features['reading_score'], [72.0, 80.5])
+
+
+def test_errors_name_the_api_fields():
+    records = [{key: value for key, value in RECORD.items() if key != 'ethnicity'},
+               dict(RECORD, ethnicity='group Z'),
+               dict(RECORD, writing_score=None),
+               dict(RECORD, reading_score='high'),
+               dict(RECORD, reading_score=101),
+               ['not', 'a', 'record']]
+    _, errors = validate_records(records, CATEGORIES)
+    assert errors.tolist() == ['Missing required field: ethnicity',
+                               'Unknown value of ethnicity , expected one of: group A, group B',
+                               'Missing required field: writing_score',
+                               'Invalid score values',
+                               'Scores must be between 0 and 100',
+                               'Record must be a JSON object']
+
+
+def test_batch_and_single_record_errors_agree():
+    import json
+    missing = {key: value for key, value in RECORD.items() if key != 'ethnicity'}
+    _, response = parse_predict_request(json.dumps(missing))
+    _, errors = validate_records([missing])
+    assert response.status == 400
+    assert response.payload['error'] == errors[0]
+
+
+def test_check_categories():
+    record = dict(RECORD, race_ethnicity='group B')
+    check_categories(record, CATEGORIES)
+    check_categories(dict(record, race_ethnicity='group Z'), None)
+    with pytest.raises(InvalidRecord, match='Unknown value of ethnicity'):
+        check_categories(dict(record, race_ethnicity='group Z'), CATEGORIES)